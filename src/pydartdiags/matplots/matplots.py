@@ -35,16 +35,13 @@ def plot_profile(
 
     # calculate stats and add to dataframe
     stats.diag_stats(obs_seq.df)
-    qc0 = stats.select_used_qcs(obs_seq.df)  # filter only qc=0, qc=2
+    all_df = obs_seq.select_type(type)  # for possible vs used
+    qc0 = stats.select_used_qcs(all_df)  # filter only qc=0, qc=2
 
-    # filter by type
-    qc0 = qc0[qc0["type"] == type]
     if qc0.empty:
         print(f"No rows found for type: {type}")
         return None
 
-    all_df = obs_seq.df[obs_seq.df["type"] == type]  # for possible vs used
-
     if all_df["vert_unit"].nunique() > 1:
         print(
             f"Multiple vertical units found in the data: {all_df['vert_unit'].unique()} for type: {type}"
@@ -245,14 +242,13 @@ def plot_rank_histogram(obs_seq, type, ens_size, levels=None):
         fig: The matplotlib figure object.
     """
 
-    qc0 = stats.select_used_qcs(obs_seq.df)  # filter only qc=0, qc=2
-
     if (isinstance(type, int) and type < 0) or (type == "IDENTITY_OBS"):
         type = "IDENTITY_OBS"
         print(
             "Observation type is for identity observations."
         )  # Filter on types < 0 to get identity observations
 
+        qc0 = stats.select_used_qcs(obs_seq.df)  # filter only qc=0, qc=2
         # Only keep rows where 'type' is numeric before comparing
         qc0 = qc0[pd.to_numeric(qc0["type"], errors="coerce").notnull()]
         qc0 = qc0[qc0["type"].astype(int) < 0]
@@ -261,7 +257,8 @@ def plot_rank_histogram(obs_seq, type, ens_size, levels=None):
             return None
 
     else:
-        qc0 = qc0[qc0["type"] == type]  # filter by type
+        # filter by type, then only qc=0, qc=2
+        qc0 = stats.select_used_qcs(obs_seq.select_type(type))
 
         if qc0.empty:
             print(f"No rows found for type: {type}")
@@ -321,7 +318,7 @@ def plot_rank_histogram(obs_seq, type, ens_size, levels=None):
 
         for level in sorted(midpoints):
 
-            df = qc0[qc0["midpoint"] == level]
+            df = qc0[qc0["midpoint"] == level].copy()
             # convert to hPa only for Pressure (Pa)
             df["midpoint"] = df["midpoint"].astype(float)
             df["midpoint"] = df["midpoint"] * conversion
@@ -391,21 +388,19 @@ def plot_evolution(
     """
     # Calculate stats and add to dataframe
     stats.diag_stats(obs_seq.df)
-    qc0 = stats.select_used_qcs(obs_seq.df)  # filter only qc=0, qc=2
-    qc0 = qc0[qc0["type"] == type]  # filter by type
+    all_df = obs_seq.select_type(type)  # for possible vs used
+    qc0 = stats.select_used_qcs(all_df)  # filter only qc=0, qc=2
 
     if qc0.empty:
         print(f"No data found for type: {type}")
         return
 
-    all_df = obs_seq.df[obs_seq.df["type"] == type]  # for possible vs used
-
     if levels:
         stats.bin_by_layer(qc0, levels)  # bin by level
         midpoints = qc0["midpoint"].unique()
 
         for level in sorted(midpoints):
-            df = qc0[qc0["midpoint"] == level]
+            df = qc0[qc0["midpoint"] == level].copy()
 
             # Bin by time
             stats.bin_by_time(df, time_bin_width)
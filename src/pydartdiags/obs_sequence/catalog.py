@@ -0,0 +1,337 @@
+# SPDX-License-Identifier: Apache-2.0
+"""
+A catalog of the obs_seq files in a directory tree.
+
+The catalog records the format, copies, observation types, number of observations and
+time span of each file in a small JSON index, so files can be selected by time and type
+without loading them. Only the header and the first and last observations of a file are
+read: the observations of a DART obs_seq file form a linked list in time order, so when
+the first and last records in the file are the head and tail of the list, their times are
+the time span of the file. The last record is found by seeking from the end of the file.
+Files in another order, compressed files, which cannot seek from the end, and binary files
+with locations other than loc3d or loc1d are read in full.
+
+Files are rescanned only when their size or modification time changes.
+"""
+
+import datetime as dt
+import fnmatch
+import json
+import os
+import struct
+import pandas as pd
+from pydartdiags.obs_sequence import compression
+from pydartdiags.obs_sequence.obs_sequence import ObsSequence, _convert_dart_time
+
+_INDEX_VERSION = 1
+
+# the length of the location record of a binary obs_seq file: lon, lat, vertical and the
+# vertical coordinate for threed_sphere, and one real for oned
+_BINARY_LOC_MODS = {28: "loc3d", 8: "loc1d"}
+
+
+def _dart_time(seconds, days, loc_mod):
+    """The datetime of DART seconds, days, as in ObsSequence.df['time']."""
+    if loc_mod == "loc3d":
+        return _convert_dart_time(seconds, days)
+    return dt.datetime(2000, 1, 1) + dt.timedelta(seconds=seconds, days=days)
+
+
+def _parse_ascii_obs(lines, n_copies):
+    """The key, linked list (previous, next), time and location type of an ASCII record."""
+    key = int(lines[0].split()[1])
+    previous, next_ = map(int, lines[n_copies + 1].split()[:2])
+    seconds, days = map(int, lines[-2].split()[:2])
+    loc_mod = "loc1d" if "loc1d" in lines else "loc3d"
+    return key, previous, next_, _dart_time(seconds, days, loc_mod), loc_mod
+
+
+def _ascii_first_last(file, header, n_copies):
+    """The first and last observation records of an ASCII obs_seq file."""
+    with open(file, "r") as f:
+        for _ in header:
+            next(f)
+        lines = []
+        for line in f:
+            if "OBS" in line and lines:
+                break
+            if line.strip():
+                lines.append(line.strip())
+        first = _parse_ascii_obs(lines, n_copies)
+
+    # read back from the end of the file until the start of the last record
+    with open(file, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        block = 4096
+        while True:
+            start = max(size - block, 0)
+            f.seek(start)
+            lines = f.read().decode("utf-8").splitlines()
+            if start > 0:
+                lines = lines[1:]  # may be a partial line
+            starts = [i for i, line in enumerate(lines) if "OBS" in line]
+            if starts or start == 0:
+                break
+            block *= 4
+    lines = [line.strip() for line in lines[starts[-1] :] if line.strip()]
+    last = _parse_ascii_obs(lines, n_copies)
+    return first, last
+
+
+def _read_record(f):
+    """Read one Fortran record from a binary file."""
+    record_length = ObsSequence._read_record_length(f)
+    record = f.read(record_length)
+    ObsSequence._check_trailing_record_length(f, record_length)
+    return record
+
+
+def _binary_first_last(file, header, n_copies, num_obs):
+    """
+    The first and last observation records of a binary obs_seq file, or None if the
+    location type is neither loc3d nor loc1d.
+    """
+    with open(file, "rb") as f:
+        for _ in range(len(header) - 1):
+            record_length = ObsSequence._read_record_length(f)
+            f.seek(record_length + 4, os.SEEK_CUR)
+
+        # copies, linked list, location, kind, then metadata up to the 8 byte time record
+        for _ in range(n_copies):
+            _read_record(f)
+        previous, next_ = struct.unpack("ii", _read_record(f)[:8])
+        loc_mod = _BINARY_LOC_MODS.get(len(_read_record(f)))
+        if loc_mod is None:
+            return None
+        _read_record(f)
+        record = _read_record(f)
+        while len(record) != 8:
+            record = _read_record(f)
+        seconds, days = struct.unpack("ii", record)
+        first = (1, previous, next_, _dart_time(seconds, days, loc_mod), loc_mod)
+
+        # the last two records are the time and error variance of the last observation
+        f.seek(-4, os.SEEK_END)
+        (record_length,) = struct.unpack("i", f.read(4))
+        f.seek(-(record_length + 12), os.SEEK_END)
+        (time_length,) = struct.unpack("i", f.read(4))
+        f.seek(-(record_length + 12 + time_length), os.SEEK_END)
+        seconds, days = struct.unpack("ii", f.read(8))
+        last = (num_obs, None, -1, _dart_time(seconds, days, loc_mod), loc_mod)
+    return first, last
+
+
+def _header_entry(header, binary):
+    """The catalog entry of an obs_seq file, from its header."""
+    copie_names, _ = ObsSequence._collect_copie_names(header)
+    n_non_qc, n_qc = ObsSequence._num_qc_non_qc(header)
+    for line in header:
+        if "num_obs:" in line and "max_num_obs:" in line:
+            num_obs = int(line.split()[1])
+    first_key, last_key = int(header[-1].split()[1]), int(header[-1].split()[3])
+    return {
+        "format": "binary" if binary else "ascii",
+        "num_obs": num_obs,
+        "copies": copie_names[:n_non_qc],
+        "qc_copies": copie_names[n_non_qc:],
+        "types": sorted(ObsSequence._collect_obs_types(header).values()),
+    }, (first_key, last_key)
+
+
+def scan_file(file, count_types=False):
+    """
+    Read the catalog entry of one obs_seq file.
+
+    Args:
+        file (str): The obs_seq file, ASCII or binary, and optionally compressed.
+        count_types (bool, optional): Read the whole file to count the observations of each
+            type. Default is False, which records the types listed in the header.
+
+    Returns:
+        dict: The format ('ascii' or 'binary'), 'num_obs', the 'copies' and 'qc_copies', the
+        'types' in the header, the 'loc_mod', the 'first_time' and 'last_time' as ISO strings
+        (None if the file has no observations), and 'type_counts' (None unless count_types).
+    """
+    binary = ObsSequence._is_binary(file)
+    if binary:
+        header = ObsSequence._read_binary_header(file)
+    else:
+        header = ObsSequence._read_header(file)
+    entry, (first_key, last_key) = _header_entry(header, binary)
+    n_copies = len(entry["copies"]) + len(entry["qc_copies"])
+    entry.update(loc_mod=None, first_time=None, last_time=None, type_counts=None)
+
+    obs_seq = None
+    if entry["num_obs"] > 0:
+        head = tail = False
+        if compression.codec(file) is None:
+            if binary:
+                records = _binary_first_last(file, header, n_copies, entry["num_obs"])
+            else:
+                records = _ascii_first_last(file, header, n_copies)
+            if records is not None:
+                first, last = records
+                # the first record is the head of the linked list, and the last the tail
+                head = first[0] == first_key and first[1] == -1
+                tail = last[0] == last_key and last[2] == -1
+        if head and tail:
+            entry.update(
+                loc_mod=first[4],
+                first_time=first[3].isoformat(),
+                last_time=last[3].isoformat(),
+            )
+        else:
+            obs_seq = ObsSequence(file)
+            entry.update(
+                loc_mod=obs_seq.loc_mod,
+                first_time=obs_seq.df["time"].min().isoformat(),
+                last_time=obs_seq.df["time"].max().isoformat(),
+            )
+
+    if count_types:
+        if obs_seq is None:
+            obs_seq = ObsSequence(file) if entry["num_obs"] > 0 else None
+        counts = {} if obs_seq is None else obs_seq.df["type"].value_counts()
+        entry["type_counts"] = {str(k): int(v) for k, v in dict(counts).items()}
+    return entry
+
+
+class Catalog:
+    """
+    A catalog of the obs_seq files in a directory tree, kept in a JSON index.
+
+    Creating a catalog loads the index, if there is one, and calls :meth:`update`.
+
+    Args:
+        root (str): The directory to scan.
+        pattern (str, optional): A glob pattern for the obs_seq file names. Default is 'obs_seq*'.
+        index (str, optional): The JSON index file. Default is '.obs_seq_catalog.json' in root.
+        count_types (bool, optional): Count the observations of each type, which reads every
+            file in full once. Default is False: the types are those listed in the file headers,
+            which may include types with no observations.
+
+    Attributes:
+        entries (dict): The catalog entry of each file, see :func:`scan_file`, keyed by path
+            relative to root.
+        df (pandas.DataFrame): The entries as a DataFrame, one row per file.
+
+    Examples:
+
+        .. code-block:: python
+
+            catalog = Catalog("/scratch/experiment/output", pattern="obs_seq.final.*")
+            files = catalog.files(
+                start="2019-12-01", end="2019-12-02", types=["RADIOSONDE_TEMPERATURE"]
+            )
+            obs_seqs = [ObsSequence(file) for file in files]
+    """
+
+    def __init__(self, root, pattern="obs_seq*", index=None, count_types=False):
+        self.root = os.path.abspath(root)
+        self.pattern = pattern
+        self.index = (
+            index
+            if index is not None
+            else os.path.join(self.root, ".obs_seq_catalog.json")
+        )
+        self.count_types = count_types
+        self.entries = {}
+        if os.path.exists(self.index):
+            with open(self.index, "r") as f:
+                saved = json.load(f)
+            if saved.get("version") == _INDEX_VERSION:
+                self.entries = saved["files"]
+        self.update()
+
+    def _find_files(self):
+        """The paths, relative to root, of the files matching the pattern."""
+        index = os.path.abspath(self.index)
+        found = []
+        for directory, subdirectories, names in os.walk(self.root):
+            subdirectories.sort()
+            for name in sorted(fnmatch.filter(names, self.pattern)):
+                path = os.path.join(directory, name)
+                if path != index:
+                    found.append(os.path.relpath(path, self.root))
+        return found
+
+    def update(self):
+        """
+        Scan new and changed files and drop deleted files, then save the index.
+
+        A file is rescanned if its size or modification time differs from the index.
+
+        Returns:
+            list of str: The paths, relative to root, of the files that were scanned.
+        """
+        found = self._find_files()
+        scanned = []
+        for path in found:
+            stat = os.stat(os.path.join(self.root, path))
+            entry = self.entries.get(path)
+            if (
+                entry is not None
+                and entry["size"] == stat.st_size
+                and entry["mtime_ns"] == stat.st_mtime_ns
+                and (entry["type_counts"] is not None or not self.count_types)
+            ):
+                continue
+            entry = scan_file(os.path.join(self.root, path), self.count_types)
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            self.entries[path] = entry
+            scanned.append(path)
+
+        removed = set(self.entries) - set(found)
+        for path in removed:
+            del self.entries[path]
+        if scanned or removed or not os.path.exists(self.index):
+            self._save()
+        self._build_df()
+        return scanned
+
+    def _save(self):
+        """Write the index, replacing the previous one only once it is complete."""
+        temporary = f"{self.index}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"version": _INDEX_VERSION, "files": self.entries}, f)
+        os.replace(temporary, self.index)
+
+    def _build_df(self):
+        """The entries as a DataFrame, with times as Timestamps."""
+        columns = ["file", "format", "loc_mod", "num_obs", "first_time", "last_time"]
+        columns += ["types", "type_counts", "copies", "qc_copies"]
+        rows = [
+            {**entry, "file": os.path.join(self.root, path)}
+            for path, entry in sorted(self.entries.items())
+        ]
+        self.df = pd.DataFrame(rows, columns=columns)
+        self.df["first_time"] = pd.to_datetime(self.df["first_time"])
+        self.df["last_time"] = pd.to_datetime(self.df["last_time"])
+
+    def files(self, start=None, end=None, types=None):
+        """
+        The files with observations in a time window, and of any of the given types.
+
+        Args:
+            start (datetime-like, optional): Start of the window, inclusive.
+            end (datetime-like, optional): End of the window, exclusive.
+            types (str or list of str, optional): Observation types. With count_types, a file
+                matches if it has observations of a type, otherwise if its header lists it.
+
+        Returns:
+            list of str: The matching files, sorted by path.
+        """
+        df = self.df
+        keep = df["num_obs"] > 0
+        if start is not None:
+            keep &= df["last_time"] >= pd.Timestamp(start)
+        if end is not None:
+            keep &= df["first_time"] < pd.Timestamp(end)
+        if types is not None:
+            types = {types} if isinstance(types, str) else set(types)
+            if self.count_types:
+                has_type = [bool(types & set(counts)) for counts in df["type_counts"]]
+            else:
+                has_type = [bool(types & set(listed)) for listed in df["types"]]
+            keep &= pd.Series(has_type, index=df.index, dtype=bool)
+        return list(df.loc[keep, "file"])
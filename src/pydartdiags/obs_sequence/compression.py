@@ -0,0 +1,170 @@
+# SPDX-License-Identifier: Apache-2.0
+"""
+Compressed obs_seq files.
+
+Files ending in .gz, .xz or .zst are gzip, xz or Zstandard compressed. They are decompressed
+as a stream while they are read, so ObsSequence reads them without decompressing them to
+disk, and ObsSequence.write_obs_seq compresses them as they are written.
+
+Compression runs in parallel. Zstandard compresses with its own worker threads. gzip and xz
+files are written as a series of independently compressed blocks, gzip members or xz
+streams, which are compressed in a thread pool; gzip, xz and Python read such a file as a
+single file.
+
+Zstandard requires zstandard, an optional dependency of pydartdiags.
+"""
+
+import collections
+import functools
+import gzip
+import io
+import lzma
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+_CODECS = {".gz": "gzip", ".xz": "xz", ".zst": "zstd"}
+_DEFAULT_LEVELS = {"gzip": 6, "xz": 6, "zstd": 3}
+_BLOCK_SIZE = 4 * 1024 * 1024  # uncompressed bytes per gzip member or xz stream
+
+
+def _import_zstandard():
+    """Import zstandard, with an error message explaining how to install it."""
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(
+            "Zstandard compressed files require zstandard. "
+            "Install it with: pip install zstandard"
+        ) from e
+    return zstandard
+
+
+def codec(file):
+    """
+    The compression of a file, from its suffix.
+
+    Args:
+        file (str): The file.
+
+    Returns:
+        str: 'gzip', 'xz' or 'zstd', or None if the file is not compressed.
+    """
+    return _CODECS.get(os.path.splitext(os.fspath(file))[1].lower())
+
+
+def _compress_block(codec, block, level):
+    """Compress a block as a complete gzip member or xz stream."""
+    if codec == "gzip":
+        return gzip.compress(block, compresslevel=level, mtime=0)
+    return lzma.compress(block, preset=level)
+
+
+class _BlockWriter(io.RawIOBase):
+    """
+    Write a gzip or xz file as blocks compressed in a thread pool.
+
+    zlib and liblzma release the GIL while they compress, so the blocks are compressed in
+    parallel. The blocks are written to the file in order, and at most two per thread wait
+    to be written.
+    """
+
+    def __init__(self, file, codec, level, threads):
+        self._file = open(file, "wb")
+        self._compress = functools.partial(_compress_block, codec, level=level)
+        self._threads = threads
+        self._executor = ThreadPoolExecutor(threads)
+        self._pending = collections.deque()
+        self._buffer = bytearray()
+        self._blocks = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= _BLOCK_SIZE:
+            self._submit(bytes(self._buffer[:_BLOCK_SIZE]))
+            del self._buffer[:_BLOCK_SIZE]
+        return len(data)
+
+    def _submit(self, block):
+        self._pending.append(self._executor.submit(self._compress, block))
+        self._blocks += 1
+        while len(self._pending) > 2 * self._threads:
+            self._file.write(self._pending.popleft().result())
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            # an empty file is still one block, so it is a valid compressed file
+            if self._buffer or self._blocks == 0:
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._file.write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown()
+            self._file.close()
+            super().close()
+
+
+def _reader(file, codec):
+    """A binary file object decompressing file as it is read."""
+    if codec == "gzip":
+        return gzip.open(file, "rb")
+    if codec == "xz":
+        return lzma.open(file, "rb")
+    zstandard = _import_zstandard()
+    reader = zstandard.ZstdDecompressor().stream_reader(
+        open(file, "rb"), read_across_frames=True
+    )
+    return io.BufferedReader(reader)
+
+
+def _writer(file, codec, level, threads):
+    """A binary file object compressing to file as it is written."""
+    if level is None:
+        level = _DEFAULT_LEVELS[codec]
+    if threads is None:
+        threads = os.cpu_count() or 1
+    if codec == "zstd":
+        zstandard = _import_zstandard()
+        compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+        return compressor.stream_writer(open(file, "wb"))
+    return io.BufferedWriter(_BlockWriter(file, codec, level, threads))
+
+
+def open_file(file, mode="r", level=None, threads=None):
+    """
+    Open an obs_seq file for reading or writing, compressed or not.
+
+    Files ending in .gz, .xz or .zst are decompressed as they are read and compressed as
+    they are written. Other files are opened with open().
+
+    Args:
+        file (str): The file.
+        mode (str, optional): 'r' or 'w', with 'b' for a binary file object. Default is 'r'.
+        level (int, optional): The compression level when writing. Default is 6 for gzip and
+            xz, and 3 for Zstandard.
+        threads (int, optional): The number of threads compressing when writing.
+            Default is the number of CPUs.
+
+    Returns:
+        file object: A text or binary file object, as from open().
+
+    Raises:
+        ValueError: If mode is not 'r', 'rb', 'w' or 'wb' for a compressed file.
+    """
+    name = codec(file)
+    if name is None:
+        return open(file, mode)
+    if mode.replace("t", "") in ["r", "rb"]:
+        stream = _reader(file, name)
+    elif mode.replace("t", "") in ["w", "wb"]:
+        stream = _writer(file, name, level, threads)
+    else:
+        raise ValueError(f"Compressed files can only be read or written, not '{mode}'")
+    if "b" in mode:
+        return stream
+    return io.TextIOWrapper(stream)
@@ -0,0 +1,208 @@
+# SPDX-License-Identifier: Apache-2.0
+"""
+Out-of-core observation sequences with Dask.
+
+A set of obs_seq files is represented as a Dask DataFrame with one partition per file and
+the same columns as ObsSequence.df. Files are read only when a result is computed, one file
+per task, so a set of files larger than memory can be processed a few files at a time, on
+the local threaded or multiprocessing scheduler or on a cluster.
+
+Statistics are computed from partial aggregates. Each partition is reduced to sums and counts
+per group, binned as in :func:`pydartdiags.stats.stats.binned_statistics`. The partial
+aggregates of all partitions are then added together and converted to statistics.
+
+Requires dask[dataframe], an optional dependency of pydartdiags.
+"""
+
+import pandas as pd
+from pydartdiags.obs_sequence import obs_sequence as obsq
+from pydartdiags.stats import stats
+
+
+def _import_dask():
+    """Import dask, with an error message explaining how to install it."""
+    try:
+        import dask
+        import dask.dataframe as dd
+    except ImportError as e:
+        raise ImportError(
+            "The Dask backend requires dask. Install it with: pip install 'dask[dataframe]'"
+        ) from e
+    return dask, dd
+
+
+def _read_partition(file, columns=None):
+    """Read one obs_seq file into a DataFrame with the given columns."""
+    df = obsq.ObsSequence(file).df
+    if columns is not None:
+        df = df.reindex(columns=columns)
+    return df
+
+
+def read_obs_seqs(files, columns=None, meta=None):
+    """
+    Represent a set of obs_seq files as a Dask DataFrame, with one partition per file.
+
+    The files are not read until a result is computed. ASCII obs_seq files hold variable
+    length observation records that cannot be located without reading the file from the
+    start, so each file is a single partition.
+
+    Args:
+        files (list of str): The obs_seq files, ASCII or binary. All files should have the
+            same copies.
+        columns (list of str, optional): The columns to read. Default is all the columns of
+            the first file.
+        meta (pandas.DataFrame, optional): An empty DataFrame with the columns and dtypes of
+            the partitions. If None, the first file is read to find them.
+
+    Returns:
+        dask.dataframe.DataFrame: The observations, with the same columns as ObsSequence.df.
+        Missing copies in a file are NaN.
+
+    Raises:
+        ValueError: If no files are given.
+        ImportError: If dask is not installed.
+
+    Examples:
+
+        .. code-block:: python
+
+            import glob
+            ddf = read_obs_seqs(sorted(glob.glob("obs_seq.final.2019*")))
+            ddf = diag_stats(select_used_qcs(ddf))
+            grand = binned_statistics(ddf, by=["type"])
+    """
+    dask, dd = _import_dask()
+    files = list(files)
+    if not files:
+        raise ValueError("No obs_seq files given.")
+    if meta is None:
+        meta = _read_partition(files[0], columns).iloc[:0]
+    columns = list(meta.columns)
+    # keep the object columns (type, metadata) as in ObsSequence.df
+    with dask.config.set({"dataframe.convert-string": False}):
+        return dd.from_map(
+            _read_partition,
+            files,
+            columns=columns,
+            meta=meta,
+            label="read-obs-seq",
+            enforce_metadata=False,
+        )
+
+
+def _diag_stats_partition(df):
+    """diag_stats on a shallow copy, so the input partition is not modified."""
+    return stats.diag_stats(df.copy(deep=False))
+
+
+def diag_stats(ddf):
+    """
+    Add the diagnostic statistics of :func:`pydartdiags.stats.stats.diag_stats` to each partition.
+
+    Args:
+        ddf (dask.dataframe.DataFrame): The observations.
+
+    Returns:
+        dask.dataframe.DataFrame: The observations with the added columns.
+    """
+    return ddf.map_partitions(_diag_stats_partition)
+
+
+def select_used_qcs(ddf):
+    """
+    Select the observations that were used, with a DART quality control flag of 0 or 2.
+
+    Args:
+        ddf (dask.dataframe.DataFrame): The observations.
+
+    Returns:
+        dask.dataframe.DataFrame: The used observations.
+    """
+    return ddf[ddf["DART_quality_control"].isin([0, 2])]
+
+
+def _partition_sums(df, by, kwargs):
+    """Partial aggregates of the diagnostic statistics of one partition."""
+    codes, keys = stats.bin_observations(df, by=by, **kwargs)
+    return stats._binned_sums(df, codes, keys)
+
+
+def partial_aggregates(ddf, by=("type",), **kwargs):
+    """
+    Reduce each partition to partial aggregates (sums and counts) per group and add them up.
+
+    If binning by time, the time range of all the partitions is found first so that every
+    partition has the same time bins. This reads the files twice, unless the DataFrame has
+    been persisted.
+
+    Args:
+        ddf (dask.dataframe.DataFrame): The observations, with diagnostic statistics.
+        by (list of str, optional): Columns to group by category. Default is ('type',).
+        **kwargs: Binning options passed to :func:`pydartdiags.stats.stats.bin_observations`.
+
+    Returns:
+        pandas.DataFrame: A column for each binning dimension, 'count', and the sums and counts
+        of the diagnostic statistics of each group.
+    """
+    dask, _ = _import_dask()
+    by = list(by)
+    if kwargs.get("time_value") is not None and kwargs.get("time_range") is None:
+        kwargs["time_range"] = dask.compute(ddf["time"].min(), ddf["time"].max())
+
+    parts = [
+        dask.delayed(_partition_sums)(part, by, kwargs) for part in ddf.to_delayed()
+    ]
+    sums = pd.concat(dask.compute(*parts), ignore_index=True)
+    key_columns = [
+        c for c in sums.columns if c != "count" and not c.endswith(("_sum", "_n"))
+    ]
+    return sums.groupby(key_columns, sort=True).sum().reset_index()
+
+
+def binned_statistics(ddf, by=("type",), **kwargs):
+    """
+    Calculate statistics (RMSE, bias, total spread) for any combination of binning dimensions.
+
+    The Dask version of :func:`pydartdiags.stats.stats.binned_statistics`, computed from the
+    partial aggregates of the partitions. This function assumes that diagnostic statistics
+    have already been computed with :func:`diag_stats`.
+
+    Args:
+        ddf (dask.dataframe.DataFrame): The observations, with diagnostic statistics.
+        by (list of str, optional): Columns to group by category. Default is ('type',).
+        **kwargs: Binning options passed to :func:`pydartdiags.stats.stats.bin_observations`:
+            levels, verticalUnit, time_value, lat_bins, lon_bins, resolution, equal_area,
+            time_range.
+
+    Returns:
+        pandas.DataFrame: The statistics, as for :func:`pydartdiags.stats.stats.binned_statistics`.
+
+    Examples:
+
+        .. code-block:: python
+
+            ddf = diag_stats(select_used_qcs(read_obs_seqs(files)))
+            profiles = binned_statistics(ddf, by=["type"], levels=levels)
+    """
+    return stats._finalize_sums(partial_aggregates(ddf, by=by, **kwargs))
+
+
+def possible_vs_used(ddf):
+    """
+    Calculates the count of possible vs. used observations by type.
+
+    Args:
+        ddf (dask.dataframe.DataFrame): The observations.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with columns 'type', 'possible' and 'used', as for
+        :meth:`pydartdiags.obs_sequence.obs_sequence.ObsSequence.possible_vs_used`.
+    """
+    dask, _ = _import_dask()
+    possible = ddf.groupby("type")["observation"].count()
+    used = select_used_qcs(ddf).groupby("type")["observation"].count()
+    possible, used = dask.compute(possible, used)
+    possible = possible.sort_index().rename("possible")
+    used = used.reindex(possible.index, fill_value=0).rename("used")
+    return pd.concat([possible, used], axis=1).reset_index()
@@ -0,0 +1,165 @@
+# SPDX-License-Identifier: Apache-2.0
+"""
+Follow an ASCII obs_seq file while it is being written.
+
+A :class:`Follower` remembers the byte offset of the first observation it has not parsed.
+Each :meth:`Follower.poll` reads the file from that offset, parses the observations that
+have been completely written, and adds their partial aggregates to a
+:class:`pydartdiags.stats.store.StatsStore`, so statistics are available while the file
+grows without reading it again.
+"""
+
+import pandas as pd
+from pydartdiags.obs_sequence import compression
+from pydartdiags.obs_sequence.obs_sequence import ObsSequence
+from pydartdiags.stats.store import StatsStore
+
+
+def _record_complete(lines):
+    """Whether the lines of an ASCII observation record end with its time and error variance."""
+    kind = [i for i, line in enumerate(lines) if line.strip() == b"kind"]
+    if not kind or len(lines) < kind[0] + 4:
+        return False
+    return len(lines[-2].split()) == 2 and len(lines[-1].split()) == 1
+
+
+class Follower:
+    """
+    Follow an ASCII obs_seq file, parsing only the observations appended since the last poll.
+
+    An observation is complete once the next 'OBS' record has started. The last observation
+    is parsed when the number of observations reaches num_obs in the header and its time and
+    error variance have been written, or when :meth:`poll` is called with final=True.
+
+    Args:
+        file (str): The ASCII obs_seq file, not compressed. It need not exist yet.
+        store (StatsStore, optional): The store the statistics are accumulated into.
+            Default is a new in-memory StatsStore.
+        cycle (datetime-like, optional): The cycle the observations are accumulated into.
+            Default is the time of the first observation parsed.
+        synonyms (list, optional): Additional synonyms for the observation column, as for
+            ObsSequence.
+
+    Attributes:
+        offset (int): The byte offset of the first observation not yet parsed.
+        n_obs (int): The number of observations parsed.
+        obs_seq (ObsSequence): An ObsSequence with the header of the file, and the
+            observations parsed by the last poll in its df.
+
+    Raises:
+        ValueError: If the file is compressed.
+
+    Examples:
+
+        .. code-block:: python
+
+            follower = Follower("obs_seq.final", store=StatsStore(levels=levels))
+            while running:
+                follower.poll()
+                rmse = follower.store.time_statistics(type="RADIOSONDE_TEMPERATURE")
+                time.sleep(60)
+            follower.poll(final=True)
+    """
+
+    def __init__(self, file, store=None, cycle=None, synonyms=None):
+        if compression.codec(file) is not None:
+            raise ValueError("Compressed obs_seq files cannot be followed.")
+        self.file = file
+        self.store = store if store is not None else StatsStore()
+        self.cycle = None if cycle is None else pd.Timestamp(cycle)
+        self.offset = 0
+        self.n_obs = 0
+        self.obs_seq = ObsSequence(file=None, synonyms=synonyms)
+        self._num_obs = None  # num_obs in the header, None until the header is read
+
+    def _read_header(self, data):
+        """
+        Parse the header if it has been written.
+
+        Returns:
+            int: The length in bytes of the header, or None if it is not complete.
+        """
+        if b"\0" in data[:1024]:
+            raise ValueError("Only ASCII obs_seq files can be followed.")
+        end = 0
+        for line in data.split(b"\n")[:-1]:
+            end += len(line) + 1
+            if b"first:" in line and b"last:" in line:
+                break
+        else:
+            return None
+
+        header = [line.strip() for line in data[:end].decode("utf-8").splitlines()]
+        self.obs_seq._set_header(header)
+        for line in header:
+            if "num_obs:" in line and "max_num_obs:" in line:
+                self._num_obs = int(line.split()[1])
+        return end
+
+    def poll(self, final=False):
+        """
+        Parse the observations appended since the last poll and add them to the store.
+
+        Args:
+            final (bool, optional): The file is complete, so the last observation is parsed
+                too. Default is False.
+
+        Returns:
+            pandas.DataFrame: The new observations, as in ObsSequence.df. Empty if there are
+            none.
+
+        Raises:
+            ValueError: If the file is a binary obs_seq file.
+        """
+        try:
+            with open(self.file, "rb") as f:
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return pd.DataFrame()
+
+        if self._num_obs is None:
+            header_length = self._read_header(data)
+            if header_length is None:
+                return pd.DataFrame()
+            self.offset += header_length
+            data = data[header_length:]
+
+        # complete lines only, unless the file is complete, and the byte offset of each
+        lines = data.split(b"\n")
+        if not final or not lines[-1].strip():
+            lines = lines[:-1]
+        starts = []
+        position = 0
+        for line in lines:
+            starts.append(position)
+            position += len(line) + 1
+
+        records = [i for i, line in enumerate(lines) if b"OBS" in line]
+        ends = records[1:]
+        # the last observation in the file may still be being written
+        last_complete = final or (
+            self.n_obs + len(records) == self._num_obs
+            and _record_complete(lines[records[-1] :] if records else [])
+        )
+        if records and last_complete:
+            ends.append(len(lines))
+        if not ends:
+            return pd.DataFrame()
+
+        self.obs_seq.seq = [
+            [line.decode("utf-8").strip() for line in lines[start:end]]
+            for start, end in zip(records, ends)
+        ]
+        self.obs_seq.all_obs = self.obs_seq._create_all_obs()
+        self.obs_seq._create_df()
+        df = self.obs_seq.df
+        if self.obs_seq.has_posterior():
+            ObsSequence._replace_qc2_nan(df)
+
+        self.offset += starts[ends[-1]] if ends[-1] < len(lines) else len(data)
+        self.n_obs += len(df)
+        if self.cycle is None:
+            self.cycle = df["time"].iloc[0]
+        self.store.accumulate(df, self.cycle)
+        return df
@@ -3,9 +3,17 @@ import pandas as pd
 import datetime as dt
 import numpy as np
 import os
+import copy
 import yaml
 import struct
 import functools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from pydartdiags.stats import stats
+from pydartdiags.obs_sequence import compression
+from pydartdiags.obs_sequence import spatial
+from pydartdiags.obs_sequence import query
+from pydartdiags.obs_sequence import polars_backend
 
 
 def _requires_assimilation_info(func):
@@ -32,6 +40,7 @@ class ObsSequence:
 
     Args:
         file (str): The input observation sequence ASCII or binary file.
+            Files ending in .gz, .xz or .zst are decompressed as they are read.
             If None, an empty ObsSequence object is created from scratch.
         synonyms (list, optional): List of additional synonyms for the observation column in the DataFrame.
             The default list is
@@ -112,16 +121,9 @@ class ObsSequence:
             return
 
         if self._is_binary(file):
-            self.header = self._read_binary_header(file)
+            self._set_header(self._read_binary_header(file))
         else:
-            self.header = self._read_header(file)
-
-        self.types = self._collect_obs_types(self.header)
-        self.reverse_types = {v: k for k, v in self.types.items()}
-        self.copie_names, self.n_copies = self._collect_copie_names(self.header)
-        self.n_non_qc, self.n_qc = self._num_qc_non_qc(self.header)
-        self.non_qc_copie_names = self.copie_names[: self.n_non_qc]
-        self.qc_copie_names = self.copie_names[self.n_non_qc :]
+            self._set_header(self._read_header(file))
 
         if self._is_binary(file):
             self.seq = self._obs_binary_reader(file, self.n_copies)
@@ -130,6 +132,28 @@ class ObsSequence:
             self.seq = self._obs_reader(file, self.n_copies)
 
         self.all_obs = self._create_all_obs()  # uses up the generator
+        self._create_df()
+
+        if self._is_binary(file):
+            # binary files do not have "OBS      X" in, so set linked list from df.
+            self.update_attributes_from_df()
+
+        # Replace MISSING_R8s with NaNs in posterior stats where DART_quality_control = 2
+        if self.has_posterior():
+            ObsSequence._replace_qc2_nan(self.df)
+
+    def _set_header(self, header):
+        """Set the header, and the types and copies it defines"""
+        self.header = header
+        self.types = self._collect_obs_types(self.header)
+        self.reverse_types = {v: k for k, v in self.types.items()}
+        self.copie_names, self.n_copies = self._collect_copie_names(self.header)
+        self.n_non_qc, self.n_qc = self._num_qc_non_qc(self.header)
+        self.non_qc_copie_names = self.copie_names[: self.n_non_qc]
+        self.qc_copie_names = self.copie_names[self.n_non_qc :]
+
+    def _create_df(self):
+        """create the dataframe from the list of all observations"""
         # at this point you know if the seq is loc3d or loc1d
         if self.loc_mod == "None":
             raise ValueError(
@@ -151,14 +175,6 @@ class ObsSequence:
         }
         self.df = self.df.rename(columns=rename_dict)
 
-        if self._is_binary(file):
-            # binary files do not have "OBS      X" in, so set linked list from df.
-            self.update_attributes_from_df()
-
-        # Replace MISSING_R8s with NaNs in posterior stats where DART_quality_control = 2
-        if self.has_posterior():
-            ObsSequence._replace_qc2_nan(self.df)
-
     def _create_all_obs(self):
         """steps through the generator to create a
         list of all observations in the sequence
@@ -305,6 +321,8 @@ class ObsSequence:
 
         Args:
             file (str): The path to the file where the observation sequence will be written.
+                Files ending in .gz, .xz or .zst are compressed as they are written, see
+                :mod:`compression`.
 
         Notes:
             - Longitude and latitude are converted back to radians if the location model is 'loc3d'.
@@ -325,7 +343,7 @@ class ObsSequence:
         # Update attributes, header, and linked list from dataframe
         self.update_attributes_from_df()
 
-        with open(file, "w") as f:
+        with compression.open_file(file, "w") as f:
 
             for line in self.header:
                 f.write(str(line) + "\n")
@@ -534,10 +552,473 @@ class ObsSequence:
 
         return pd.concat([possible, used], axis=1).reset_index()
 
+    def _df_key(self, columns):
+        """
+        The key the cached indexes are stored with: self.df, its index and a copy of the
+        columns the index is built from.
+        """
+        return self.df, self.df.index, [self.df[c].to_numpy().copy() for c in columns]
+
+    def _df_unchanged(self, key, columns):
+        """
+        Whether self.df has not been replaced, and neither its rows nor the values of
+        columns have changed in place, since key was taken.
+        """
+        df, index, values = key
+        return (
+            df is self.df
+            and index is self.df.index
+            and all(
+                _same_values(self.df[c].to_numpy(), v) for c, v in zip(columns, values)
+            )
+        )
+
+    def spatial_index(self, band_deg=1.0):
+        """
+        The spatial index over the observation locations.
+
+        The index is built on first use and cached. It is rebuilt when self.df is replaced,
+        its rows or locations change in place, or :meth:`update_attributes_from_df` is called.
+
+        Args:
+            band_deg (float, optional): The width of the latitude bands of the index in degrees.
+                Default is 1.0.
+
+        Returns:
+            SpatialIndex: A :class:`pydartdiags.obs_sequence.spatial.SpatialIndex` whose
+            positions are row positions in self.df.
+
+        Raises:
+            ValueError: If the observation sequence is not loc3d.
+
+        Examples:
+            .. code-block:: python
+
+                index = obs_seq.spatial_index()
+                distance_km, rows = index.nearest(station_lons, station_lats, k=1)
+                nearest = obs_seq.df.iloc[rows[:, 0]]
+        """
+        if self.loc_mod != "loc3d":
+            raise ValueError("A spatial index requires a loc3d observation sequence.")
+        cached = getattr(self, "_spatial_index", None)
+        if (
+            cached is None
+            or cached[1] != band_deg
+            or not self._df_unchanged(cached[0], ["longitude", "latitude"])
+        ):
+            index = spatial.SpatialIndex(
+                self.df["longitude"], self.df["latitude"], band_deg=band_deg
+            )
+            self._spatial_index = (
+                self._df_key(["longitude", "latitude"]),
+                band_deg,
+                index,
+            )
+        return self._spatial_index[2]
+
+    def select_within(self, longitude, latitude, distance_km):
+        """
+        Select the observations within a great-circle distance of a point.
+
+        Args:
+            longitude (float): The longitude of the point in degrees.
+            latitude (float): The latitude of the point in degrees.
+            distance_km (float): The maximum distance in km.
+
+        Returns:
+            pandas.DataFrame: A DataFrame containing only the rows within distance_km of the point.
+
+        Raises:
+            ValueError: If the observation sequence is not loc3d.
+        """
+        rows = self.spatial_index().within(longitude, latitude, distance_km)
+        return self.df.iloc[rows]
+
+    def select_box(self, lon_min, lon_max, lat_min, lat_max):
+        """
+        Select the observations in a latitude/longitude box.
+
+        Args:
+            lon_min (float): The western edge of the box in degrees. If lon_min is more than
+                lon_max, the box crosses the 0/360 degree meridian.
+            lon_max (float): The eastern edge of the box in degrees.
+            lat_min (float): The southern edge of the box in degrees.
+            lat_max (float): The northern edge of the box in degrees.
+
+        Returns:
+            pandas.DataFrame: A DataFrame containing only the rows in the box, edges included.
+
+        Raises:
+            ValueError: If the observation sequence is not loc3d.
+        """
+        rows = self.spatial_index().box(lon_min, lon_max, lat_min, lat_max)
+        return self.df.iloc[rows]
+
+    def _sorted_times(self):
+        """
+        The sorted observation times, and the row order that sorts them (None if
+        self.df is already in time order). Cached until self.df is replaced, its rows or
+        times change in place or :meth:`update_attributes_from_df` is called.
+        """
+        cached = getattr(self, "_time_index", None)
+        if cached is None or not self._df_unchanged(cached[0], ["time"]):
+            times = self.df["time"].to_numpy()
+            order = None
+            if not self.df["time"].is_monotonic_increasing:
+                order = np.argsort(times, kind="stable")
+                times = times[order]
+            self._time_index = (self._df_key(["time"]), times, order)
+        return self._time_index[1], self._time_index[2]
+
+    def select_time(self, start=None, end=None):
+        """
+        Select the observations with start <= time < end.
+
+        The observations are found with a binary search of the sorted times. If the DataFrame is
+        in time order, as it is after reading a file or calling :meth:`update_attributes_from_df`,
+        the selection is a slice of the DataFrame.
+
+        Args:
+            start (str or datetime, optional): The start of the time window, included. If None,
+                the window starts with the first observation.
+            end (str or datetime, optional): The end of the time window, excluded. If None,
+                the window ends with the last observation.
+
+        Returns:
+            pandas.DataFrame: A DataFrame containing only the rows in the time window, in time order.
+
+        Examples:
+            .. code-block:: python
+
+                for start in pd.date_range("2019-12-01", "2019-12-08", freq="1h"):
+                    window = obs_seq.select_time(start, start + pd.Timedelta("1h"))
+        """
+        times, order = self._sorted_times()
+        lo = (
+            0 if start is None else times.searchsorted(pd.Timestamp(start).asm8, "left")
+        )
+        hi = (
+            len(times)
+            if end is None
+            else times.searchsorted(pd.Timestamp(end).asm8, "left")
+        )
+        if order is None:
+            return self.df.iloc[lo:hi]
+        return self.df.iloc[order[lo:hi]]
+
+    def _type_rows(self):
+        """
+        Dictionary from each observation type to its row positions in self.df, built by
+        factorizing the type column once. Cached until self.df is replaced, its rows or
+        types change in place or :meth:`update_attributes_from_df` is called.
+        """
+        cached = getattr(self, "_type_index", None)
+        if cached is None or not self._df_unchanged(cached[0], ["type"]):
+            codes, types = pd.factorize(self.df["type"])
+            order = np.argsort(codes, kind="stable")
+            # rows with a missing type (code -1) sort first
+            counts = np.bincount(codes[codes >= 0], minlength=len(types))
+            ends = np.cumsum(counts) + (codes < 0).sum()
+            rows = {
+                type: order[end - count : end]
+                for type, count, end in zip(types, counts, ends)
+            }
+            self._type_index = (self._df_key(["type"]), rows)
+        return self._type_index[1]
+
+    def select_type(self, type):
+        """
+        Select the observations of a type.
+
+        The rows of each type are found from an index built once for all types. Each call
+        checks that the type column is unchanged, which is cheaper than comparing every row
+        with the type, and then copies only the observations of that type.
+
+        Args:
+            type (str or int): The observation type, or a negative integer for identity observations.
+
+        Returns:
+            pandas.DataFrame: A DataFrame containing only the rows of the type. Empty if there
+            are no observations of the type.
+
+        Examples:
+            .. code-block:: python
+
+                for type in obs_seq.df["type"].unique():
+                    df = obs_seq.select_type(type)
+        """
+        rows = self._type_rows().get(type, np.array([], dtype=np.int64))
+        return self.df.iloc[rows]
+
+    def query(self):
+        """
+        Start a lazy query over the observations.
+
+        Filters, a column selection, diagnostic statistics and an aggregation are recorded and
+        run in one pass by :meth:`Query.collect`, using the type, time and spatial indexes.
+
+        Returns:
+            Query: A :class:`pydartdiags.obs_sequence.query.Query` with no steps.
+
+        Examples:
+            .. code-block:: python
+
+                profile = (
+                    obs_seq.query()
+                    .used()
+                    .types("RADIOSONDE_TEMPERATURE")
+                    .within(255.0, 40.0, distance_km=500.0)
+                    .diag_stats()
+                    .collect()
+                )
+        """
+        return query.Query(self)
+
+    def to_arrow(self, columns=None):
+        """
+        Export the observations to an Arrow table.
+
+        Numeric and time columns are not copied. Requires pyarrow.
+
+        Args:
+            columns (list of str, optional): The columns to export. Default is all columns.
+
+        Returns:
+            pyarrow.Table: The observations, with NaN values as nulls.
+        """
+        return polars_backend.to_arrow(self.df, columns)
+
+    def to_polars(self, columns=None):
+        """
+        Export the observations to a Polars DataFrame, through Arrow.
+
+        Numeric and time columns are not copied. Requires pyarrow and polars.
+        The statistics in :mod:`pydartdiags.obs_sequence.polars_backend` run natively on the
+        result.
+
+        Args:
+            columns (list of str, optional): The columns to export. Default is all columns.
+
+        Returns:
+            polars.DataFrame: The observations, with NaN values as nulls.
+
+        Examples:
+            .. code-block:: python
+
+                from pydartdiags.obs_sequence import polars_backend as plb
+
+                frame = plb.diag_stats(obs_seq.to_polars().lazy())
+                grand = plb.grand_statistics(frame).collect()
+        """
+        return polars_backend.to_polars(self.df, columns)
+
+    def thin(
+        self,
+        resolution=1.0,
+        time_value=None,
+        levels=None,
+        verticalUnit="pressure (Pa)",
+        equal_area=False,
+    ):
+        """
+        Thin the observation sequence to one observation per type, grid cell, time window
+        and vertical level.
+
+        The observation closest to the centre of each cell of a global latitude/longitude
+        grid is kept, see :func:`pydartdiags.stats.stats.thin_observations`.
+
+        Args:
+            resolution (float, optional): The grid spacing in degrees. Default is 1.0.
+            time_value (str, optional): The width of each time window (e.g. '1h'). If None,
+                observations are thinned regardless of time.
+            levels (list, optional): Vertical bin edges. If None, each vertical coordinate
+                value is thinned separately.
+            verticalUnit (str, optional): The unit of the vertical levels. Default is 'pressure (Pa)'.
+            equal_area (bool, optional): Use an equal-area grid. Default is False.
+
+        Returns:
+            ObsSequence: A new ObsSequence containing the thinned observations, which can be
+            written with :meth:`write_obs_seq`.
+
+        Raises:
+            ValueError: If the observation sequence is not loc3d.
+
+        Examples:
+            .. code-block:: python
+
+                thinned = obs_seq.thin(resolution=0.5, time_value="1h")
+                thinned.write_obs_seq("obs_seq.thinned")
+        """
+        if self.loc_mod != "loc3d":
+            raise ValueError("Thinning requires a loc3d observation sequence.")
+
+        rows = stats.thin_observations(
+            self.df,
+            resolution=resolution,
+            time_value=time_value,
+            levels=levels,
+            verticalUnit=verticalUnit,
+            equal_area=equal_area,
+        )
+        thinned = copy.copy(self)
+        thinned.reverse_types = dict(self.reverse_types)
+        thinned.df = self.df.iloc[rows].copy()
+        thinned.update_attributes_from_df()
+        return thinned
+
+    def superob(
+        self,
+        resolution=1.0,
+        time_value=None,
+        levels=None,
+        verticalUnit="pressure (Pa)",
+        equal_area=False,
+        qc=(0, 2),
+    ):
+        """
+        Average the observations in each type, grid cell, time window and vertical level
+        into a superobservation.
+
+        By default only the observations used by the assimilation (DART QC 0 or 2) are
+        averaged, so rejected observations and failed forward operators, whose copies may
+        be MISSING_R8, are left out.
+
+        For each superobservation:
+
+        - the observation and the other non-QC copies are the mean of the copies, except
+          the ensemble spreads (copies ending in '_spread'), which are the root mean of the
+          variances, sqrt(mean(spread**2)),
+        - the QC copies are the largest (worst) QC value,
+        - the location is the mean location on the sphere, and the vertical and time are
+          the mean vertical and time,
+        - the obs_err_var is the mean obs_err_var divided by the number of observations
+          averaged, assuming uncorrelated observation errors,
+        - type and vert_unit are those of the observations averaged, and the metadata
+          and external forward operator are those of the first observation.
+
+        Observations are assigned to boxes with integer codes from
+        :func:`pydartdiags.stats.stats.bin_observations`, and every copy is averaged in one
+        2D reduction over the observations sorted by box.
+
+        Args:
+            resolution (float, optional): The grid spacing in degrees. Default is 1.0.
+            time_value (str, optional): The width of each time window (e.g. '1h'). If None,
+                observations are averaged regardless of time.
+            levels (list, optional): Vertical bin edges. If None, each vertical coordinate
+                value is averaged separately. If given, only observations with vert_unit
+                equal to verticalUnit within the levels are used.
+            verticalUnit (str, optional): The unit of the vertical levels. Default is 'pressure (Pa)'.
+            equal_area (bool, optional): Use an equal-area grid. Default is False.
+            qc (list of int, optional): The DART QC values of the observations averaged.
+                Default is (0, 2). If None, observations with any DART QC are averaged.
+
+        Returns:
+            ObsSequence: A new ObsSequence containing the superobservations, which can be
+            written with :meth:`write_obs_seq`.
+
+        Raises:
+            ValueError: If the observation sequence is not loc3d.
+
+        Examples:
+            .. code-block:: python
+
+                satwinds = obs_seq.superob(resolution=0.5, time_value="1h", levels=levels)
+                satwinds.write_obs_seq("obs_seq.superob")
+        """
+        if self.loc_mod != "loc3d":
+            raise ValueError("Superobbing requires a loc3d observation sequence.")
+
+        df = self.df
+        codes, _ = stats.bin_observations(
+            df,
+            by=["type"] if levels is not None else ["type", "vert_unit", "vertical"],
+            levels=levels,
+            verticalUnit=verticalUnit,
+            time_value=time_value,
+            resolution=resolution,
+            equal_area=equal_area,
+        )
+        if qc is not None and "DART_quality_control" in df.columns:
+            codes[~df["DART_quality_control"].isin(qc).to_numpy()] = -1
+        rows = np.flatnonzero(codes >= 0)
+        order = rows[np.argsort(codes[rows], kind="stable")]
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        n = np.diff(np.r_[starts, len(order)])
+
+        def box_mean(values):
+            return np.add.reduceat(values[order], starts, axis=0) / (
+                n if values.ndim == 1 else n[:, None]
+            )
+
+        columns = [
+            c
+            for c in df.columns
+            if c in self.copie_names
+            or c
+            in [
+                "obs_num",
+                "linked_list",
+                "longitude",
+                "latitude",
+                "vertical",
+                "vert_unit",
+                "type",
+                "metadata",
+                "external_FO",
+                "seconds",
+                "days",
+                "time",
+                "obs_err_var",
+            ]
+        ]
+        superobs = df.iloc[order[starts]][columns].reset_index(drop=True)
+
+        non_qc = [c for c in self.non_qc_copie_names if c in df.columns]
+        qc_copies = [c for c in self.qc_copie_names if c in df.columns]
+        superobs[non_qc] = box_mean(df[non_qc].to_numpy(dtype=np.float64))
+        spreads = [c for c in non_qc if c.endswith("_spread")]
+        if spreads:
+            superobs[spreads] = np.sqrt(
+                box_mean(df[spreads].to_numpy(dtype=np.float64) ** 2)
+            )
+        if qc_copies:
+            superobs[qc_copies] = np.maximum.reduceat(
+                df[qc_copies].to_numpy()[order], starts, axis=0
+            )
+
+        xyz = box_mean(spatial.unit_vectors(df["longitude"], df["latitude"]))
+        superobs["longitude"] = np.mod(
+            np.rad2deg(np.arctan2(xyz[:, 1], xyz[:, 0])), 360
+        )
+        superobs["latitude"] = np.rad2deg(
+            np.arctan2(xyz[:, 2], np.hypot(xyz[:, 0], xyz[:, 1]))
+        )
+        superobs["vertical"] = box_mean(df["vertical"].to_numpy(dtype=np.float64))
+        superobs["obs_err_var"] = (
+            box_mean(df["obs_err_var"].to_numpy(dtype=np.float64)) / n
+        )
+
+        # Mean time to the second, and DART days, seconds since 1601-01-01
+        seconds = df["time"].to_numpy().astype("datetime64[s]").astype(np.int64)
+        dart_epoch = np.datetime64("1601-01-01", "s").astype(np.int64)
+        mean_seconds = np.round(box_mean(seconds - dart_epoch)).astype(np.int64)
+        superobs["days"] = mean_seconds // 86400
+        superobs["seconds"] = mean_seconds % 86400
+        superobs["time"] = (
+            (mean_seconds + dart_epoch).astype("datetime64[s]").astype("datetime64[ns]")
+        )
+
+        superobbed = copy.copy(self)
+        superobbed.reverse_types = dict(self.reverse_types)
+        superobbed.df = superobs
+        superobbed.update_attributes_from_df()
+        return superobbed
+
     @staticmethod
     def _is_binary(file):
         """Check if a file is binary file."""
-        with open(file, "rb") as f:
+        with compression.open_file(file, "rb") as f:
             chunk = f.read(1024)
             if b"\0" in chunk:
                 return True
@@ -547,7 +1028,7 @@ class ObsSequence:
     def _read_header(file):
         """Read the header and number of lines in the header of an ascii obs_seq file"""
         header = []
-        with open(file, "r") as f:
+        with compression.open_file(file, "r") as f:
             for line in f:
                 if "first:" in line and "last:" in line:
                     header.append(line.strip())
@@ -568,7 +1049,7 @@ class ObsSequence:
         #   number of obs_type_definitions
         #   number of copies
         #   number of qcs
-        with open(file, "rb") as f:
+        with compression.open_file(file, "rb") as f:
             while True:
                 # Read the record length
                 record_length = ObsSequence._read_record_length(f)
@@ -593,9 +1074,9 @@ class ObsSequence:
                     )[:16]
                     break
 
-            # Go back to the beginning of the file
-            f.seek(0)
-
+        # Go back to the beginning of the file, reopening it since a compressed file
+        # cannot seek back
+        with compression.open_file(file, "rb") as f:
             for _ in range(2):
                 record_length = ObsSequence._read_record_length(f)
                 if record_length is None:
@@ -716,7 +1197,7 @@ class ObsSequence:
     def _obs_reader(file, n):
         """Reads the ascii obs sequence file and returns a generator of the obs"""
         previous_line = ""
-        with open(file, "r") as f:
+        with compression.open_file(file, "r") as f:
             for line in f:
                 if "OBS" in line or "OBS" in previous_line:
                     if "OBS" in line:
@@ -787,7 +1268,7 @@ class ObsSequence:
     def _obs_binary_reader(self, file, n):
         """Reads the obs sequence binary file and returns a generator of the obs"""
         header_length = len(self.header)
-        with open(file, "rb") as f:
+        with compression.open_file(file, "rb") as f:
             # Skip the first len(obs_seq.header) lines
             for _ in range(header_length - 1):
                 # Read the record length
@@ -795,11 +1276,9 @@ class ObsSequence:
                 if record_length is None:  # End of file
                     break
 
-                # Skip the actual record
-                f.seek(record_length, 1)
-
-                # Skip the trailing record length
-                f.seek(4, 1)
+                # Skip the actual record and the trailing record length, reading rather
+                # than seeking so compressed files are read as a stream
+                f.read(record_length + 4)
 
             obs_num = 0
             while True:
@@ -849,29 +1328,19 @@ class ObsSequence:
 
                 ObsSequence._check_trailing_record_length(f, record_length)
 
-                # Skip metadata (obs_def) and go directly to the time record
+                # Skip metadata (obs_def) and go directly to the time record,
+                # the first record that is 8 bytes (two ints)
                 while True:
-                    pos = f.tell()
                     record_length = ObsSequence._read_record_length(f)
                     if record_length is None:
                         break  # End of file
 
                     record = f.read(record_length)
-                    # Check if this record is likely the "time" record (8 bytes, can be unpacked as two ints)
-                    if record_length == 8:
-                        try:
-                            seconds, days = struct.unpack("ii", record)
-                            # If unpack succeeds, this is the time record
-                            f.seek(pos)  # Seek back so the main loop can process it
-                            break
-                        except struct.error:
-                            pass  # Not the time record, keep skipping
-
                     ObsSequence._check_trailing_record_length(f, record_length)
+                    if record_length == 8:
+                        break
 
                 # time (seconds, days)
-                record_length = ObsSequence._read_record_length(f)
-                record = f.read(record_length)
                 try:  # This is incase the record is not the time record because of metadata funkyness
                     seconds, days = struct.unpack("ii", record)
                 except struct.error as e:
@@ -884,8 +1353,6 @@ class ObsSequence:
                 time_string = f"{seconds} {days}"
                 obs.append(time_string)
 
-                ObsSequence._check_trailing_record_length(f, record_length)
-
                 # obs error variance
                 record_length = ObsSequence._read_record_length(f)
                 record = f.read(record_length)
@@ -901,7 +1368,8 @@ class ObsSequence:
 
         This function sets up composite observation types based on a provided YAML configuration or
         a default configuration. It constructs new composite rows by combining specified
-        components and adds them to the DataFrame in place.
+        components and adds them to the DataFrame in place. All composite types are
+        constructed in a single pass over the DataFrame.
 
         Args:
             composite_types (str, optional): The YAML configuration for composite types.
@@ -931,22 +1399,10 @@ class ObsSequence:
         if len(components) != len(set(components)):
             raise Exception("There are repeat values in components.")
 
-        # data frame for the composite types
-        df_comp = self.df[
-            self.df["type"]
-            .str.upper()
-            .isin([component.upper() for component in components])
-        ]
-
-        df = pd.DataFrame()
-        for key in self.composite_types_dict:
-            df_new = _construct_composit(
-                df_comp,
-                key,
-                self.composite_types_dict[key]["components"],
-                raise_on_duplicate,
-            )
-            df = pd.concat([df, df_new], axis=0)
+        # all composite types are constructed in a single pass
+        df = _construct_composites(
+            self.df, self.composite_types_dict, raise_on_duplicate
+        )
 
         # add the composite types to the DataFrame
         self.df = pd.concat([self.df, df], axis=0)
@@ -1078,23 +1534,81 @@ class ObsSequence:
 
         # todo HK @todo combine synonyms for obs?
 
-        # Initialize combined data
-        combo.df = pd.DataFrame()
-
-        # Iterate over the list of observation sequences and combine their data
-        for obs_seq in obs_sequences:
-            if copies:
-                combo.df = pd.concat(
-                    [combo.df, obs_seq.df[requested_columns]], ignore_index=True
-                )
-            else:
-                combo.df = pd.concat([combo.df, obs_seq.df], ignore_index=True)
+        # Combine the data in a single concatenation
+        combo.df = pd.concat(
+            [
+                obs_seq.df[requested_columns] if copies else obs_seq.df
+                for obs_seq in obs_sequences
+            ],
+            ignore_index=True,
+        )
 
         # update ObsSequence attributes from the combined DataFrame
         combo.update_attributes_from_df()
 
         return combo
 
+    @classmethod
+    def from_files(cls, files, workers=None, copies=None, synonyms=None):
+        """
+        Read a list of observation sequence files in parallel and join them.
+
+        The files are read in a process pool. Each worker returns the numeric and time
+        columns of its file through shared memory, so only the few text columns are pickled,
+        and the files are joined with :meth:`join`, which checks that they have the same
+        loc_mod, assimilation info, posterior info and copies.
+
+        Args:
+            files (list of str): The obs_seq files to read, ASCII or binary.
+            workers (int, optional): The number of worker processes. Default is the number of
+                CPUs. If 1, the files are read in the calling process.
+            copies (list of str, optional): A list of copy names to include in the combined
+                data. If not provided, all copies are included.
+            synonyms (list, optional): Additional synonyms for the observation column, as for
+                ObsSequence.
+
+        Returns:
+            A new ObsSequence object containing the combined data.
+
+        Raises:
+            ValueError: If the list of files is empty or the files cannot be joined.
+
+        Examples:
+            .. code-block:: python
+
+                files = sorted(glob.glob("obs_seq.final.201912*"))
+                month = ObsSequence.from_files(files, workers=8)
+        """
+        files = list(files)
+        if not files:
+            raise ValueError("The list of observation sequences is empty.")
+
+        if workers == 1:
+            obs_sequences = [cls(file, synonyms=synonyms) for file in files]
+        else:
+            # the workers create the shared memory blocks and this process frees them, so
+            # they must share this process's resource tracker
+            resource_tracker.ensure_running()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(_read_to_shared_memory, file, synonyms)
+                    for file in files
+                ]
+                try:
+                    obs_sequences = [
+                        _obs_seq_from_shared_memory(cls, future.result())
+                        for future in futures
+                    ]
+                except BaseException:
+                    # free the shared memory of the files that were read
+                    executor.shutdown(cancel_futures=True)
+                    for future in futures:
+                        if not future.cancelled() and future.exception() is None:
+                            _release_shared_memory(future.result()[0])
+                    raise
+
+        return cls.join(obs_sequences, copies=copies)
+
     @staticmethod
     def _update_linked_list(df):
         """
@@ -1244,6 +1758,25 @@ class ObsSequence:
         # update linked list for obs and obs_nums
         ObsSequence._update_linked_list(self.df)
 
+        # cached indexes are rebuilt on next use
+        self._spatial_index = None
+        self._time_index = None
+        self._type_index = None
+
+
+def _same_values(values, cached):
+    """Whether two column arrays hold the same values, missing values included."""
+    if values.shape != cached.shape or values.dtype != cached.dtype:
+        return False
+    if values.dtype.kind in "mM":
+        return np.array_equal(values.view("i8"), cached.view("i8"))
+    if values.dtype.kind in "fc":
+        return np.array_equal(values, cached, equal_nan=True)
+    equal = values == cached
+    if equal.all():
+        return True
+    return bool((equal | (pd.isna(values) & pd.isna(cached))).all())
+
 
 def _load_yaml_to_dict(file_path):
     """
@@ -1263,6 +1796,96 @@ def _load_yaml_to_dict(file_path):
         raise
 
 
+# ObsSequence attributes sent back from a worker process with the DataFrame
+_WORKER_ATTRIBUTES = [
+    "loc_mod",
+    "file",
+    "synonyms_for_obs",
+    "header",
+    "types",
+    "reverse_types",
+    "copie_names",
+    "n_copies",
+    "non_qc_copie_names",
+    "qc_copie_names",
+    "n_non_qc",
+    "n_qc",
+    "columns",
+]
+
+
+def _read_to_shared_memory(file, synonyms):
+    """
+    Read an obs_seq file in a worker process and put its numeric and time columns in a
+    shared memory block.
+
+    Returns:
+        tuple: The shared memory name, the (column, dtype, offset) of each column in it, the
+        number of rows, the column order, a DataFrame of the other columns, and the
+        ObsSequence attributes.
+    """
+    obs_seq = ObsSequence(file, synonyms=synonyms)
+    df = obs_seq.df
+    shared = [column for column in df.columns if df[column].dtype.kind in "biufM"]
+    size = sum(df[column].to_numpy().nbytes for column in shared)
+
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    layout = []
+    offset = 0
+    for column in shared:
+        values = df[column].to_numpy()
+        np.ndarray(values.shape, values.dtype, buffer=block.buf, offset=offset)[:] = (
+            values
+        )
+        layout.append((column, values.dtype.str, offset))
+        offset += values.nbytes
+    block.close()
+
+    attributes = {name: getattr(obs_seq, name) for name in _WORKER_ATTRIBUTES}
+    return (
+        block.name,
+        layout,
+        len(df),
+        list(df.columns),
+        df.drop(columns=shared),
+        attributes,
+    )
+
+
+def _release_shared_memory(name):
+    """Free a shared memory block, if it still exists."""
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+def _obs_seq_from_shared_memory(cls, result):
+    """Build an ObsSequence from the result of _read_to_shared_memory and free its block."""
+    name, layout, n_rows, columns, others, attributes = result
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        data = {
+            column: np.ndarray(
+                n_rows, np.dtype(dtype), buffer=block.buf, offset=offset
+            ).copy()
+            for column, dtype, offset in layout
+        }
+    finally:
+        block.close()
+        block.unlink()
+    for column in others.columns:
+        data[column] = others[column].to_numpy()
+
+    obs_seq = cls(file=None)
+    for attribute, value in attributes.items():
+        setattr(obs_seq, attribute, value)
+    obs_seq.df = pd.DataFrame(data, columns=columns)
+    return obs_seq
+
+
 def _convert_dart_time(seconds, days):
     """covert from seconds, days after 1601 to datetime object
 
@@ -1274,87 +1897,125 @@ def _convert_dart_time(seconds, days):
     return time
 
 
-def _construct_composit(df_comp, composite, components, raise_on_duplicate):
+def _hash_columns(columns):
+    """Hash the rows of a 2D array of uint64 values to uint64 keys."""
+    keys = np.zeros(len(columns), dtype=np.uint64)
+    for column in columns.T:
+        keys = (keys ^ column) * spatial._HASH_PRIMES[0]
+        keys ^= keys >> np.uint64(31)
+    return keys
+
+
+def _construct_composites(df, composite_types_dict, raise_on_duplicate):
     """
-    Creates a new DataFrame by combining pairs of rows from two specified component
-    types in an observation DataFrame. It matches rows based on location and time,
-    and then combines certain columns using the square root of the sum of squares
-    of the components.
+    Creates a new DataFrame of composite rows by combining pairs of rows of the two
+    component types of each composite type in an observation DataFrame. Rows are paired
+    on location and time, and the observation, obs_err_var and ensemble columns are
+    combined using the square root of the sum of squares of the components.
 
-    Args:
-        df_comp (pd.DataFrame): The DataFrame containing the component rows to be combined.
-        composite (str): The type name for the new composite rows.
-        components (list of str): A list containing the type names of the two components to be combined.
-        raise_on_duplicate (bool): If False, raises an exception if there are duplicates in the components.
-        otherwise deals with duplicates as though they are distinct observations.
+    All composite types are constructed in a single pass: rows are grouped by composite
+    type and a hashed key over latitude, longitude, vertical and time, and all columns are
+    combined as one 2D array operation. Where there are repeat rows of a component at the
+    same location and time, these are treated as distinct observations, and the k-th row
+    of the first component is paired with the k-th row of the second component.
 
+    Args:
+        df (pd.DataFrame): The DataFrame containing the component rows to be combined.
+        composite_types_dict (dict): The composite types, each with a list of the type names
+            of the two components to be combined.
+        raise_on_duplicate (bool): If True, raises an exception if there are duplicates in the
+            components. Otherwise deals with duplicates as though they are distinct observations.
 
     Returns:
-        merged_df (pd.DataFrame): A DataFrame containing the new composite rows.
+        pd.DataFrame: A DataFrame containing the new composite rows.
     """
-    # select rows for the two components
-    if len(components) != 2:
-        raise ValueError("components must be a list of two component types.")
-    selected_rows = df_comp[df_comp["type"] == components[0].upper()]
-    selected_rows_v = df_comp[df_comp["type"] == components[1].upper()]
-    selected_rows = selected_rows.copy()
-    selected_rows_v = selected_rows_v.copy()
-
-    prior_columns_to_combine = df_comp.filter(regex="prior_ensemble").columns.tolist()
-    posterior_columns_to_combine = df_comp.filter(
-        regex="posterior_ensemble"
-    ).columns.tolist()
-    columns_to_combine = (
-        prior_columns_to_combine
-        + posterior_columns_to_combine
-        + ["observation", "obs_err_var"]
-    )
-    merge_columns = ["latitude", "longitude", "vertical", "time"]  # @todo HK 1d or 3d
-    same_obs_columns = merge_columns + [
-        "observation",
-        "obs_err_var",
-    ]  # same observation is duplicated
-
-    if (
-        selected_rows[same_obs_columns].duplicated().sum() > 0
-        or selected_rows_v[same_obs_columns].duplicated().sum() > 0
-    ):
+    composites = list(composite_types_dict)
+    component_of = {}
+    for c, composite in enumerate(composites):
+        components = composite_types_dict[composite]["components"]
+        if len(components) != 2:
+            raise ValueError("components must be a list of two component types.")
+        for side, component in enumerate(components):
+            component_of[component.upper()] = (c, side)
+
+    # composite type and component (0 or 1) of every row, -1 for other types
+    type_codes, type_names = pd.factorize(df["type"])
+    lookup = np.array(
+        [component_of.get(name, (-1, -1)) for name in type_names] + [(-1, -1)],
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    composite_code, side = lookup[type_codes].T
+    rows = np.flatnonzero(composite_code >= 0)
 
-        if raise_on_duplicate:
-            print(
-                f"{selected_rows[same_obs_columns].duplicated().sum()} duplicates in {composite} component {components[0]}: "
-            )
-            print(f"{selected_rows[same_obs_columns]}")
-            print(
-                f"{selected_rows_v[same_obs_columns].duplicated().sum()} duplicates in {composite} component {components[0]}: "
-            )
-            print(f"{selected_rows_v[same_obs_columns]}")
+    merge_columns = ["latitude", "longitude", "vertical", "time"]  # @todo HK 1d or 3d
+    if raise_on_duplicate:
+        same_obs_columns = merge_columns + ["observation", "obs_err_var", "type"]
+        duplicated = df.iloc[rows][same_obs_columns].duplicated()
+        if duplicated.any():
+            print(f"{duplicated.sum()} duplicates in components:")
+            print(f"{df.iloc[rows][duplicated.to_numpy()][same_obs_columns]}")
             raise Exception("There are duplicates in the components.")
 
-        else:
-            selected_rows["dup_num"] = selected_rows.groupby(
-                same_obs_columns
-            ).cumcount()
-            selected_rows_v["dup_num"] = selected_rows_v.groupby(
-                same_obs_columns
-            ).cumcount()
-
-    # Merge the two DataFrames on location and time columns
-    merged_df = pd.merge(
-        selected_rows, selected_rows_v, on=merge_columns, suffixes=("", "_v")
+    # exact bit patterns of the location and time, with -0.0 equal to 0.0
+    bits = np.column_stack(
+        [
+            (df[column].to_numpy(dtype=np.float64)[rows] + 0.0).view(np.uint64)
+            for column in merge_columns[:3]
+        ]
+        + [
+            df["time"].to_numpy().astype("datetime64[ns]").view(np.uint64)[rows],
+            composite_code[rows].astype(np.uint64),
+        ]
     )
+    group, _ = pd.factorize(_hash_columns(bits))
+    # factorize numbers the groups in order of appearance
+    first = np.flatnonzero(np.diff(np.maximum.accumulate(np.r_[-1, group])) > 0)
+    if not (bits == bits[first[group]]).all():
+        # hash collision, fall back to exact keys
+        _, group = np.unique(bits, axis=0, return_inverse=True)
+        group = group.ravel()
+
+    # pair the k-th row of the first component with the k-th row of the second
+    order = np.lexsort((rows, side[rows], group))
+    n_groups = group.max() + 1 if len(group) else 0
+    n_first = np.bincount(group[side[rows] == 0], minlength=n_groups)
+    n_second = np.bincount(group[side[rows] == 1], minlength=n_groups)
+    starts = np.cumsum(n_first + n_second) - (n_first + n_second)
+    n_pairs = np.minimum(n_first, n_second)
+    k = np.arange(n_pairs.sum()) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+    first_rows = rows[order[np.repeat(starts, n_pairs) + k]]
+    second_rows = rows[order[np.repeat(starts + n_first, n_pairs) + k]]
+
+    keep = np.lexsort((first_rows, composite_code[first_rows]))
+    first_rows, second_rows = first_rows[keep], second_rows[keep]
 
-    # Apply the square root of the sum of squares method to the relevant columns
-    for col in columns_to_combine:
-        merged_df[col] = np.sqrt(merged_df[col] ** 2 + merged_df[f"{col}_v"] ** 2)
-
-    # Create the new composite rows
-    merged_df["type"] = composite.upper()
-    merged_df = merged_df.drop(
-        columns=[col for col in merged_df.columns if col.endswith("_v")]
+    columns_to_combine = (
+        [col for col in df.columns if "prior_ensemble" in col]
+        + [col for col in df.columns if "posterior_ensemble" in col]
+        + ["observation", "obs_err_var"]
     )
+    # square root of the sum of squares of all the columns at once, as (column, row) arrays
+    combined = np.stack(
+        [df[col].to_numpy(dtype=np.float64)[first_rows] for col in columns_to_combine]
+    )
+    second = np.stack(
+        [df[col].to_numpy(dtype=np.float64)[second_rows] for col in columns_to_combine]
+    )
+    combined **= 2
+    second **= 2
+    combined += second
+    np.sqrt(combined, out=combined)
 
-    if "dup_num" in merged_df.columns:
-        merged_df = merged_df.drop(columns=["dup_num"])
-
-    return merged_df
+    # Create the new composite rows
+    other_columns = [col for col in df.columns if col not in columns_to_combine]
+    composite_df = pd.concat(
+        [
+            df[other_columns].iloc[first_rows].reset_index(drop=True),
+            pd.DataFrame(combined.T, columns=columns_to_combine, copy=False),
+        ],
+        axis=1,
+    )[list(df.columns)]
+    composite_df["type"] = np.array([c.upper() for c in composites], dtype=object)[
+        composite_code[first_rows]
+    ]
+    return composite_df
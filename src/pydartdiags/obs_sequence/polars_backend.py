@@ -0,0 +1,309 @@
+# SPDX-License-Identifier: Apache-2.0
+"""
+Columnar observations with Apache Arrow and Polars.
+
+ObsSequence.df is a pandas DataFrame. :meth:`ObsSequence.to_arrow` and
+:meth:`ObsSequence.to_polars` export it to an Arrow table or a Polars DataFrame without
+copying the numeric columns.
+
+The functions in this module are the Polars equivalents of :func:`stats.diag_stats`,
+:func:`stats.bin_by_layer`, :func:`stats.bin_by_time`, :func:`stats.grand_statistics`,
+:func:`stats.layer_statistics` and :func:`stats.time_statistics`. They are written as
+Polars expressions, so they run multi-threaded and work on both a polars.DataFrame and a
+polars.LazyFrame, returning the same kind of frame. The statistics of both phases are
+computed in a single group by.
+
+Requires pyarrow and polars, optional dependencies of pydartdiags.
+"""
+
+import numpy as np
+import pandas as pd
+from pydartdiags.stats import stats
+
+
+def _import_pyarrow():
+    """Import pyarrow, with an error message explaining how to install it."""
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError(
+            "The Arrow backend requires pyarrow. Install it with: pip install pyarrow"
+        ) from e
+    return pyarrow
+
+
+def _import_polars():
+    """Import polars, with an error message explaining how to install it."""
+    try:
+        import polars
+    except ImportError as e:
+        raise ImportError(
+            "The Polars backend requires polars. Install it with: pip install polars"
+        ) from e
+    return polars
+
+
+def to_arrow(df, columns=None):
+    """
+    Convert observations to an Arrow table.
+
+    Numeric and time columns share memory with the DataFrame. NaN values become nulls.
+
+    Args:
+        df (pandas.DataFrame): The observations, e.g. ObsSequence.df.
+        columns (list of str, optional): The columns to convert. Default is all columns.
+
+    Returns:
+        pyarrow.Table: The observations.
+    """
+    pa = _import_pyarrow()
+    if columns is not None:
+        columns = list(columns)
+    return pa.Table.from_pandas(df, columns=columns, preserve_index=False)
+
+
+def to_polars(df, columns=None):
+    """
+    Convert observations to a Polars DataFrame, through Arrow.
+
+    Args:
+        df (pandas.DataFrame): The observations, e.g. ObsSequence.df.
+        columns (list of str, optional): The columns to convert. Default is all columns.
+
+    Returns:
+        polars.DataFrame: The observations.
+    """
+    pl = _import_polars()
+    return pl.from_arrow(to_arrow(df, columns))
+
+
+def _columns(frame):
+    """The column names of a polars DataFrame or LazyFrame."""
+    return frame.collect_schema().names()
+
+
+def _phases(columns, column):
+    """The phases ('prior', 'posterior') with a {phase}_{column} column."""
+    return [phase for phase in ["prior", "posterior"] if f"{phase}_{column}" in columns]
+
+
+def select_used_qcs(frame):
+    """
+    Select the observations that were used, with a DART quality control flag of 0 or 2.
+
+    Args:
+        frame (polars.DataFrame or polars.LazyFrame): The observations.
+
+    Returns:
+        polars.DataFrame or polars.LazyFrame: The used observations.
+    """
+    pl = _import_polars()
+    qc = pl.col("DART_quality_control")
+    return frame.filter((qc == 0) | (qc == 2))
+
+
+def diag_stats(frame):
+    """
+    Add the diagnostic statistics of :func:`stats.diag_stats` for each phase.
+
+    Args:
+        frame (polars.DataFrame or polars.LazyFrame): The observations.
+
+    Returns:
+        polars.DataFrame or polars.LazyFrame: The observations with the columns
+        '{phase}_sq_err', '{phase}_bias' and '{phase}_totalvar' added.
+    """
+    pl = _import_polars()
+    observation = pl.col("observation")
+    expressions = []
+    for phase in _phases(_columns(frame), "ensemble_spread"):
+        error = pl.col(f"{phase}_ensemble_mean") - observation
+        expressions += [
+            (error**2).alias(f"{phase}_sq_err"),
+            error.alias(f"{phase}_bias"),
+            (pl.col("obs_err_var") + pl.col(f"{phase}_ensemble_spread") ** 2).alias(
+                f"{phase}_totalvar"
+            ),
+        ]
+    return frame.with_columns(expressions)
+
+
+def _mapped(code, values, dtype=None):
+    """An expression mapping integer bin codes to values, null for code -1."""
+    return code.replace_strict(
+        dict(enumerate(values)), default=None, return_dtype=dtype
+    )
+
+
+def bin_by_layer(frame, levels, verticalUnit="pressure (Pa)"):
+    """
+    Bin observations by vertical layers, as :func:`stats.bin_by_layer`.
+
+    Args:
+        frame (polars.DataFrame or polars.LazyFrame): The observations.
+        levels (list): The bin edges of the vertical layers, increasing.
+        verticalUnit (str, optional): The vertical unit of the observations to bin.
+            Default is 'pressure (Pa)'.
+
+    Returns:
+        polars.DataFrame or polars.LazyFrame: The observations with two columns added:
+            - 'vlevels': The layer, labelled as the pandas interval, e.g. '(100.0, 200.0]'.
+            - 'midpoint': The midpoint of the layer.
+
+        Both are null for observations outside the layers or with another vertical unit.
+    """
+    pl = _import_polars()
+    edges = np.asarray(levels, dtype=float)
+    intervals = stats._layer_intervals(edges)
+    vertical = pl.col("vertical")
+
+    # bins are closed on the right, and the first bin also includes its left edge
+    code = (
+        pl.lit(pl.Series(edges)).search_sorted(vertical, side="left").cast(pl.Int64) - 1
+    )
+    code = pl.when(vertical == edges[0]).then(0).otherwise(code)
+    code = (
+        pl.when(
+            (code >= 0)
+            & (code < len(edges) - 1)
+            & vertical.is_not_null()
+            & (pl.col("vert_unit") == verticalUnit)
+        )
+        .then(code)
+        .otherwise(-1)
+    )
+
+    labels = [str(interval) for interval in intervals]
+    code_column = pl.col("_layer_code")
+    return (
+        frame.with_columns(code.alias("_layer_code"))
+        .with_columns(
+            _mapped(code_column, labels, pl.Enum(labels)).alias("vlevels"),
+            _mapped(code_column, intervals.mid, pl.Float64).alias("midpoint"),
+        )
+        .drop("_layer_code")
+    )
+
+
+def bin_by_time(frame, time_value):
+    """
+    Bin observations by time, as :func:`stats.bin_by_time`.
+
+    The first bin starts 1 second before the minimum time, and bins are closed on the right.
+
+    Args:
+        frame (polars.DataFrame or polars.LazyFrame): The observations.
+        time_value (str): The width of each time bin (e.g., '3600s' for 1 hour).
+
+    Returns:
+        polars.DataFrame or polars.LazyFrame: The observations with the columns
+        'time_bin_start', 'time_bin_end' and 'time_bin_midpoint' added.
+    """
+    pl = _import_polars()
+    width = pd.Timedelta(time_value).to_pytimedelta()
+    width_ns = pd.Timedelta(time_value).value
+    start = pl.col("time").min() - pl.duration(seconds=1)
+    code = ((pl.col("time") - start).dt.total_nanoseconds() / width_ns).ceil() - 1
+    bin_start = start + pl.duration(nanoseconds=code.cast(pl.Int64) * width_ns)
+    return frame.with_columns(
+        bin_start.alias("time_bin_start"),
+        (bin_start + width).alias("time_bin_end"),
+        (bin_start + width / 2).alias("time_bin_midpoint"),
+    )
+
+
+def _statistics(frame, by, first=()):
+    """
+    RMSE, bias and total spread of each phase per group, in one group by.
+
+    Groups with a null key are dropped, and only groups with observations are returned.
+    """
+    pl = _import_polars()
+    columns = _columns(frame)
+
+    def mean(column):
+        # pandas skips NaN in means, polars only skips nulls
+        return pl.col(column).fill_nan(None).mean()
+
+    aggregations = []
+    spread_skill = []
+    for phase in _phases(columns, "ensemble_mean"):
+        aggregations += [
+            mean(f"{phase}_sq_err").sqrt().alias(f"{phase}_rmse"),
+            mean(f"{phase}_bias").alias(f"{phase}_bias"),
+            mean(f"{phase}_totalvar").sqrt().alias(f"{phase}_totalspread"),
+        ]
+        if f"{phase}_crps" in columns:
+            aggregations.append(mean(f"{phase}_crps").alias(f"{phase}_crps"))
+            spread_skill.append(
+                (pl.col(f"{phase}_totalspread") / pl.col(f"{phase}_rmse")).alias(
+                    f"{phase}_spread_skill"
+                )
+            )
+    aggregations += [pl.col(column).first() for column in first]
+
+    return (
+        frame.drop_nulls(by)
+        .group_by(by)
+        .agg(aggregations)
+        .sort(by)
+        .with_columns(spread_skill)
+    )
+
+
+def grand_statistics(frame):
+    """
+    Calculate grand statistics (RMSE, bias, total spread) for each observation type,
+    as :func:`stats.grand_statistics`.
+
+    Assumes that :func:`diag_stats` has been called.
+
+    Args:
+        frame (polars.DataFrame or polars.LazyFrame): The observations.
+
+    Returns:
+        polars.DataFrame or polars.LazyFrame: A row per type, with the columns 'type',
+        '{phase}_rmse', '{phase}_bias' and '{phase}_totalspread' for each phase.
+    """
+    return _statistics(frame, ["type"])
+
+
+def layer_statistics(frame):
+    """
+    Calculate statistics (RMSE, bias, total spread) for each observation type and vertical
+    layer, as :func:`stats.layer_statistics`.
+
+    Assumes that :func:`diag_stats` and :func:`bin_by_layer` have been called.
+    Unlike the pandas version, layers without observations of a type are not included.
+
+    Args:
+        frame (polars.DataFrame or polars.LazyFrame): The observations.
+
+    Returns:
+        polars.DataFrame or polars.LazyFrame: A row per layer and type, with the columns
+        'midpoint', 'type', the statistics of each phase, 'vert_unit' and 'vlevels'.
+    """
+    return _statistics(frame, ["midpoint", "type"], first=["vert_unit", "vlevels"])
+
+
+def time_statistics(frame):
+    """
+    Calculate statistics (RMSE, bias, total spread) for each observation type and time bin,
+    as :func:`stats.time_statistics`.
+
+    Assumes that :func:`diag_stats` and :func:`bin_by_time` have been called.
+    Unlike the pandas version, time bins without observations of a type are not included.
+
+    Args:
+        frame (polars.DataFrame or polars.LazyFrame): The observations.
+
+    Returns:
+        polars.DataFrame or polars.LazyFrame: A row per time bin and type, with the columns
+        'time_bin_midpoint', 'type', the statistics of each phase, 'time_bin_start',
+        'time_bin_end' and 'time', the first time in the bin.
+    """
+    return _statistics(
+        frame,
+        ["time_bin_midpoint", "type"],
+        first=["time_bin_start", "time_bin_end", "time"],
+    )
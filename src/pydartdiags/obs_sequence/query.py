@@ -0,0 +1,220 @@
+# SPDX-License-Identifier: Apache-2.0
+"""
+Lazy queries over the observations of an ObsSequence.
+
+A query records filters, a column selection, diagnostic statistics and an aggregation, and
+runs them in one pass when collected. Type, time and region filters are answered from the
+type, time and spatial indexes of the ObsSequence. The other filters are combined into a
+single mask evaluated only on the rows the indexes select. Only the selected columns of the
+selected rows are copied.
+"""
+
+import numpy as np
+import pandas as pd
+from pydartdiags.stats import stats
+
+
+class Query:
+    """
+    A lazy query over the observations of an ObsSequence.
+
+    Each method returns a new query with the step added, so queries can be chained and
+    reused. Nothing is computed until :meth:`collect` is called. Create a query with
+    :meth:`pydartdiags.obs_sequence.obs_sequence.ObsSequence.query`.
+
+    Args:
+        obs_seq (ObsSequence): The observation sequence to query.
+
+    Examples:
+
+        .. code-block:: python
+
+            grand = (
+                obs_seq.query()
+                .used()
+                .types("RADIOSONDE_TEMPERATURE", "ACARS_TEMPERATURE")
+                .time("2019-12-01 00:00", "2019-12-01 06:00")
+                .box(235.0, 295.0, 25.0, 50.0)
+                .diag_stats()
+                .aggregate(stats.grand_statistics)
+                .collect()
+            )
+    """
+
+    def __init__(self, obs_seq):
+        self.obs_seq = obs_seq
+        self._indexed = []  # functions returning sorted row positions
+        self._masks = []  # (column, function of the column values returning a mask)
+        self._columns = None
+        self._diag_stats = False
+        self._aggregation = None
+
+    def _add(self, indexed=None, mask=None, **changes):
+        """A copy of the query with a step added."""
+        query = Query(self.obs_seq)
+        query._indexed = self._indexed + ([indexed] if indexed else [])
+        query._masks = self._masks + ([mask] if mask else [])
+        query._columns = self._columns
+        query._diag_stats = self._diag_stats
+        query._aggregation = self._aggregation
+        for name, value in changes.items():
+            setattr(query, f"_{name}", value)
+        return query
+
+    def types(self, *types):
+        """Keep the observations of any of the given types."""
+
+        def rows():
+            type_rows = self.obs_seq._type_rows()
+            found = [type_rows[type] for type in types if type in type_rows]
+            return np.sort(np.concatenate(found)) if found else np.array([], dtype=int)
+
+        return self._add(indexed=rows)
+
+    def time(self, start=None, end=None):
+        """Keep the observations with start <= time < end, see ObsSequence.select_time."""
+
+        def rows():
+            times, order = self.obs_seq._sorted_times()
+            lo = 0 if start is None else times.searchsorted(pd.Timestamp(start).asm8)
+            hi = (
+                len(times)
+                if end is None
+                else times.searchsorted(pd.Timestamp(end).asm8)
+            )
+            if order is None:
+                return np.arange(lo, hi)
+            return np.sort(order[lo:hi])
+
+        return self._add(indexed=rows)
+
+    def within(self, longitude, latitude, distance_km):
+        """Keep the observations within a great-circle distance in km of a point."""
+        return self._add(
+            indexed=lambda: self.obs_seq.spatial_index().within(
+                longitude, latitude, distance_km
+            )
+        )
+
+    def box(self, lon_min, lon_max, lat_min, lat_max):
+        """Keep the observations in a latitude/longitude box, see ObsSequence.select_box."""
+        return self._add(
+            indexed=lambda: self.obs_seq.spatial_index().box(
+                lon_min, lon_max, lat_min, lat_max
+            )
+        )
+
+    def qc(self, *qcs):
+        """Keep the observations with any of the given DART quality control flags."""
+        return self._add(
+            mask=("DART_quality_control", lambda values: np.isin(values, qcs))
+        )
+
+    def used(self):
+        """Keep the observations that were used, DART quality control flag 0 or 2."""
+        return self.qc(0, 2)
+
+    def vertical(self, low=None, high=None, vert_unit=None):
+        """Keep the observations with low <= vertical <= high, and with vert_unit if given."""
+        query = self
+        if vert_unit is not None:
+            query = query._add(mask=("vert_unit", lambda values: values == vert_unit))
+        if low is not None:
+            query = query._add(mask=("vertical", lambda values: values >= low))
+        if high is not None:
+            query = query._add(mask=("vertical", lambda values: values <= high))
+        return query
+
+    def where(self, column, function):
+        """
+        Keep the observations for which function returns True.
+
+        Args:
+            column (str): The column to filter on.
+            function (callable): Takes a numpy array of the column values and returns a
+                boolean array, e.g. ``lambda values: values < 4.0``.
+        """
+        return self._add(mask=(column, function))
+
+    def select(self, *columns):
+        """Keep only the given columns, and the statistics added by :meth:`diag_stats`."""
+        return self._add(columns=list(columns))
+
+    def diag_stats(self):
+        """Add the diagnostic statistics of :func:`stats.diag_stats` to the selected rows."""
+        return self._add(diag_stats=True)
+
+    def aggregate(self, function, *args, **kwargs):
+        """
+        Aggregate the selected rows, e.g. with :func:`stats.grand_statistics`.
+
+        Args:
+            function (callable): Called as function(df, \\*args, \\*\\*kwargs) on the selected
+                rows, and its result is returned by :meth:`collect`.
+        """
+        return self._add(aggregation=(function, args, kwargs))
+
+    def rows(self):
+        """
+        The positions in obs_seq.df of the rows selected by the filters.
+
+        Returns:
+            numpy.ndarray: The sorted row positions.
+        """
+        df = self.obs_seq.df
+        rows = None
+        for indexed in self._indexed:
+            found = indexed()
+            rows = (
+                found
+                if rows is None
+                else np.intersect1d(rows, found, assume_unique=True)
+            )
+
+        if self._masks:
+            keep = None
+            for column, function in self._masks:
+                values = df[column].to_numpy()
+                mask = function(values if rows is None else values[rows])
+                keep = mask if keep is None else keep & mask
+            rows = np.flatnonzero(keep) if rows is None else rows[keep]
+
+        return np.arange(len(df)) if rows is None else rows
+
+    def collect(self):
+        """
+        Run the query.
+
+        Returns:
+            pandas.DataFrame: A copy of the selected rows and columns, with the diagnostic
+            statistics if requested, or the result of the aggregation if there is one.
+
+        Raises:
+            KeyError: If a selected column, or a column diag_stats needs, is not in the
+                DataFrame.
+        """
+        df = self.obs_seq.df
+        columns = list(df.columns) if self._columns is None else list(self._columns)
+        extra = []
+        if self._diag_stats:
+            inputs = ["observation", "obs_err_var"]
+            for phase in ["prior", "posterior"]:
+                if f"{phase}_ensemble_spread" in df.columns:
+                    inputs += [f"{phase}_ensemble_mean", f"{phase}_ensemble_spread"]
+            extra = [column for column in inputs if column not in columns]
+
+        positions = df.columns.get_indexer(columns + extra)
+        if (positions < 0).any():
+            missing = [c for c, p in zip(columns + extra, positions) if p < 0]
+            raise KeyError(f"Columns not in the DataFrame: {missing}")
+
+        rows = self.rows()
+        result = df.iloc[rows, positions].copy()
+        if self._diag_stats:
+            stats.diag_stats(result)
+            result = result.drop(columns=extra)
+
+        if self._aggregation is not None:
+            function, args, kwargs = self._aggregation
+            return function(result, *args, **kwargs)
+        return result
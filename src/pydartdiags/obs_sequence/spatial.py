@@ -0,0 +1,394 @@
+# SPDX-License-Identifier: Apache-2.0
+"""
+Spatial lookup of observation locations.
+
+Locations are converted to Cartesian coordinates on the unit sphere, so distances do not
+depend on longitude wrapping or the convergence of meridians near the poles. Great-circle
+distances are compared as the equivalent chord lengths.
+"""
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0
+
+# Large odd constants for hashing the integer cell coordinates
+_HASH_PRIMES = np.array(
+    [0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93],
+    dtype=np.uint64,
+)
+
+
+def unit_vectors(longitude, latitude):
+    """
+    Cartesian coordinates on the unit sphere.
+
+    Args:
+        longitude (array-like): Longitudes in degrees.
+        latitude (array-like): Latitudes in degrees.
+
+    Returns:
+        numpy.ndarray: Array of shape (n, 3) of x, y, z coordinates.
+    """
+    lon = np.deg2rad(np.asarray(longitude, dtype=np.float64))
+    lat = np.deg2rad(np.asarray(latitude, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def chord_length(distance_km):
+    """The chord length on the unit sphere for a great-circle distance in km."""
+    return 2.0 * np.sin(np.minimum(distance_km / EARTH_RADIUS_KM, np.pi) / 2.0)
+
+
+def _hash_cells(cells, groups):
+    """Hash integer cell coordinates (n, 3) and group codes to uint64 keys."""
+    keys = cells.astype(np.uint64) * _HASH_PRIMES[:3]
+    return (
+        keys[:, 0]
+        ^ keys[:, 1]
+        ^ keys[:, 2]
+        ^ (groups.astype(np.uint64) * _HASH_PRIMES[3])
+    )
+
+
+class SpatialHash:
+    """
+    A spatial hashing index over observation locations.
+
+    The unit sphere is divided into cubic cells of a fixed size, and every location is
+    stored under the hash of its cell (and optional group code, e.g. the observation type).
+    All locations within cell_km of a point lie in the 27 cells around it, so pairs of nearby
+    locations are found by looking up the neighbouring cells in a hash table, rather than by
+    comparing all pairs.
+
+    Args:
+        longitude (array-like): Longitudes in degrees.
+        latitude (array-like): Latitudes in degrees.
+        cell_km (float): The cell size as a great-circle distance in km. Pairs can be found
+            up to this distance.
+        groups (array-like of int, optional): Only locations with the same group code are
+            paired. Default is a single group.
+
+    Raises:
+        ValueError: If cell_km is not positive.
+
+    Examples:
+
+        .. code-block:: python
+
+            index = SpatialHash(df["longitude"], df["latitude"], cell_km=10.0)
+            for i, j in index.pairs_within(10.0):
+                ...
+    """
+
+    def __init__(self, longitude, latitude, cell_km, groups=None):
+        if cell_km <= 0:
+            raise ValueError("cell_km must be positive.")
+        self.xyz = unit_vectors(longitude, latitude)
+        self.cell_km = float(cell_km)
+        self.cell = chord_length(self.cell_km)
+        if groups is None:
+            groups = np.zeros(len(self.xyz), dtype=np.int64)
+        self.groups = np.asarray(groups, dtype=np.int64)
+        self.cells = np.floor(self.xyz / self.cell).astype(np.int64)
+        keys = _hash_cells(self.cells, self.groups)
+        self.order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[self.order]
+
+        # Hash table from each occupied cell key to its run of locations in self.order
+        new_run = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        self.starts = np.flatnonzero(new_run)
+        self.counts = np.diff(np.r_[self.starts, len(sorted_keys)])
+        self.lookup = pd.Index(sorted_keys[self.starts])
+
+    def __len__(self):
+        return len(self.xyz)
+
+    def pairs_within(self, distance_km, chunk_size=1000000):
+        """
+        Find all pairs of locations in the same group within a great-circle distance.
+
+        Each pair is returned once. The pairs are generated in chunks of query points to
+        bound the memory used.
+
+        Args:
+            distance_km (float): The maximum distance in km. Must not be more than cell_km.
+            chunk_size (int, optional): The number of query points per chunk. Default is 1000000.
+
+        Yields:
+            tuple: Arrays (i, j) of the positions of the locations in each pair.
+
+        Raises:
+            ValueError: If distance_km is more than the cell size.
+        """
+        if distance_km > self.cell_km:
+            raise ValueError(
+                f"distance_km ({distance_km}) must not be more than cell_km ({self.cell_km})."
+            )
+        max_chord = chord_length(distance_km)
+        # Half of the 27 neighbouring cell offsets, each unordered pair is found once
+        offsets = [
+            np.array((dx, dy, dz))
+            for dx in (-1, 0, 1)
+            for dy in (-1, 0, 1)
+            for dz in (-1, 0, 1)
+            if (dx, dy, dz) >= (0, 0, 0)
+        ]
+        for start in range(0, len(self), chunk_size):
+            query = np.arange(start, min(start + chunk_size, len(self)))
+            for offset in offsets:
+                neighbour = self.cells[query] + offset
+                run = self.lookup.get_indexer(
+                    _hash_cells(neighbour, self.groups[query])
+                )
+                found = run >= 0
+                lo = self.starts[run[found]]
+                counts = self.counts[run[found]]
+                total = counts.sum()
+                if total == 0:
+                    continue
+                i = np.repeat(query[found], counts)
+                first = np.repeat(lo - np.cumsum(counts) + counts, counts)
+                j = self.order[first + np.arange(total)]
+
+                # Hash collisions: keep only the true neighbouring cell and group
+                keep = (self.cells[j] == self.cells[i] + offset).all(axis=1)
+                keep &= self.groups[j] == self.groups[i]
+                if not offset.any():
+                    keep &= j > i
+                i, j = i[keep], j[keep]
+                chord = np.sqrt(((self.xyz[i] - self.xyz[j]) ** 2).sum(axis=1))
+                close = chord <= max_chord
+                yield i[close], j[close]
+
+
+def great_circle_km(chord):
+    """The great-circle distance in km for a chord length on the unit sphere."""
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.minimum(chord, 2.0) / 2.0)
+
+
+class SpatialIndex:
+    """
+    A spatial index over observation locations for radius, nearest-neighbour and box queries.
+
+    Locations are sorted into latitude bands, and by longitude within each band. A query
+    looks up the longitude range it covers in each latitude band it covers with a binary
+    search. The candidates are then checked exactly. Distances are measured on the unit sphere
+    and so are correct across the dateline and near the poles.
+
+    Args:
+        longitude (array-like): Longitudes in degrees.
+        latitude (array-like): Latitudes in degrees.
+        band_deg (float, optional): The width of the latitude bands in degrees. Default is 1.0.
+
+    Raises:
+        ValueError: If band_deg is not positive.
+
+    Examples:
+
+        .. code-block:: python
+
+            index = SpatialIndex(df["longitude"], df["latitude"])
+            nearby = df.iloc[index.within(255.0, 40.0, distance_km=200.0)]
+    """
+
+    def __init__(self, longitude, latitude, band_deg=1.0):
+        if band_deg <= 0:
+            raise ValueError("band_deg must be positive.")
+        self.longitude = np.mod(np.asarray(longitude, dtype=np.float64), 360.0)
+        self.latitude = np.asarray(latitude, dtype=np.float64)
+        self.xyz = unit_vectors(self.longitude, self.latitude)
+        self.band_deg = float(band_deg)
+        self.n_bands = int(np.ceil(180.0 / self.band_deg))
+
+        # keys increase with band, then longitude
+        keys = self._bands(self.latitude) * 1000.0 + self.longitude
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.xyz)
+
+    def _bands(self, latitude):
+        bands = np.floor(
+            (np.asarray(latitude, dtype=np.float64) + 90.0) / self.band_deg
+        )
+        return np.clip(bands, 0, self.n_bands - 1).astype(np.int64)
+
+    def _candidates(self, lat_min, lat_max, lon_ranges):
+        """Positions of the locations in the bands from lat_min to lat_max and lon_ranges."""
+        bands = np.arange(self._bands(lat_min), self._bands(lat_max) + 1) * 1000.0
+        lo = np.concatenate(
+            [
+                np.searchsorted(self.keys, bands + start, "left")
+                for start, _ in lon_ranges
+            ]
+        )
+        hi = np.concatenate(
+            [np.searchsorted(self.keys, bands + end, "right") for _, end in lon_ranges]
+        )
+        counts = hi - lo
+        first = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        return self.order[first + np.arange(counts.sum())]
+
+    @staticmethod
+    def _lon_ranges(lon_min, lon_max):
+        """Longitude ranges in [0, 360], split at the dateline."""
+        if lon_max - lon_min >= 360.0:
+            return [(0.0, 360.0)]
+        lon_min, lon_max = np.mod(lon_min, 360.0), np.mod(lon_max, 360.0)
+        if lon_min <= lon_max:
+            return [(lon_min, lon_max)]
+        return [(lon_min, 360.0), (0.0, lon_max)]
+
+    def within(self, longitude, latitude, distance_km):
+        """
+        Find the locations within a great-circle distance of a point.
+
+        Args:
+            longitude (float): The longitude of the point in degrees.
+            latitude (float): The latitude of the point in degrees.
+            distance_km (float): The maximum distance in km.
+
+        Returns:
+            numpy.ndarray: The sorted positions of the locations.
+        """
+        angle = np.rad2deg(min(distance_km / EARTH_RADIUS_KM, np.pi))
+        lat_min, lat_max = latitude - angle, latitude + angle
+        cos_lat = np.cos(np.deg2rad(latitude))
+        sin_angle = np.sin(np.deg2rad(angle))
+        if lat_min <= -90.0 or lat_max >= 90.0 or sin_angle >= cos_lat:
+            # the circle contains a pole
+            lon_ranges = [(0.0, 360.0)]
+        else:
+            dlon = np.rad2deg(np.arcsin(sin_angle / cos_lat))
+            lon_ranges = self._lon_ranges(longitude - dlon, longitude + dlon)
+        candidates = self._candidates(
+            max(lat_min, -90.0), min(lat_max, 90.0), lon_ranges
+        )
+
+        point = unit_vectors([longitude], [latitude])[0]
+        chord = np.sqrt(((self.xyz[candidates] - point) ** 2).sum(axis=1))
+        return np.sort(candidates[chord <= chord_length(distance_km)])
+
+    def _ranges(self, longitude, latitude, distance_km):
+        """
+        The ranges of self.keys to search for the locations within a distance of each point.
+
+        The vectorized form of the search in :meth:`within`: for each point, each latitude
+        band the circle covers, and each of up to two longitude ranges (split at the
+        dateline), the first and last position in self.keys.
+
+        Returns:
+            tuple: Arrays (point, lo, hi), the point each range belongs to and its bounds.
+        """
+        angle = np.rad2deg(min(distance_km / EARTH_RADIUS_KM, np.pi))
+        lat_min, lat_max = latitude - angle, latitude + angle
+        sin_angle = np.sin(np.deg2rad(angle))
+        cos_lat = np.cos(np.deg2rad(latitude))
+        # circles containing a pole cover all longitudes
+        full = (lat_min <= -90.0) | (lat_max >= 90.0) | (sin_angle >= cos_lat)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dlon = np.rad2deg(np.arcsin(np.minimum(sin_angle / cos_lat, 1.0)))
+        west = np.where(full, 0.0, np.mod(longitude - dlon, 360.0))
+        east = np.where(full, 360.0, np.mod(longitude + dlon, 360.0))
+        wrap = west > east
+        # the second range, after the dateline, is empty unless the first range wraps
+        starts = np.concatenate([west, np.where(wrap, 0.0, 1.0)])
+        ends = np.concatenate([np.where(wrap, 360.0, east), np.where(wrap, east, 0.0)])
+
+        first_band = np.tile(self._bands(np.maximum(lat_min, -90.0)), 2)
+        n_bands = np.tile(self._bands(np.minimum(lat_max, 90.0)), 2) - first_band + 1
+        ranges = np.repeat(np.arange(len(starts)), n_bands)
+        band = (
+            first_band[ranges]
+            + np.arange(len(ranges))
+            - np.repeat(np.cumsum(n_bands) - n_bands, n_bands)
+        ) * 1000.0
+        lo = np.searchsorted(self.keys, band + starts[ranges], "left")
+        hi = np.searchsorted(self.keys, band + ends[ranges], "right")
+        return ranges % len(latitude), lo, np.maximum(hi, lo)
+
+    def nearest(self, longitude, latitude, k=1, chunk_size=1000):
+        """
+        Find the k nearest locations to each of a set of points.
+
+        The search radius around each point is doubled, starting from the band width, until
+        it contains at least k locations. All the points still searching are searched
+        together at each radius, chunk_size points at a time, so the cost is a few array
+        operations per radius rather than a Python loop over the points.
+
+        Args:
+            longitude (float or array-like): The longitudes of the points in degrees.
+            latitude (float or array-like): The latitudes of the points in degrees.
+            k (int, optional): The number of nearest locations. Default is 1.
+            chunk_size (int, optional): The number of points searched at a time, to bound
+                the memory used. Default is 1000.
+
+        Returns:
+            tuple: Arrays (distance_km, positions) of shape (number of points, k), nearest
+            first. If there are fewer than k locations, or the point is NaN, the missing
+            positions are -1 and the distances are inf.
+        """
+        longitude = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+        latitude = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+        distances = np.full((len(longitude), k), np.inf)
+        positions = np.full((len(longitude), k), -1, dtype=np.int64)
+        points = unit_vectors(longitude, latitude)
+        max_km = np.pi * EARTH_RADIUS_KM
+
+        valid = np.flatnonzero(~(np.isnan(longitude) | np.isnan(latitude)))
+        for chunk_start in range(0, len(valid), chunk_size):
+            pending = valid[chunk_start : chunk_start + chunk_size]
+            radius = np.deg2rad(self.band_deg) * EARTH_RADIUS_KM
+            while len(pending) > 0:
+                point, lo, hi = self._ranges(
+                    longitude[pending], latitude[pending], radius
+                )
+                counts = hi - lo
+                query = np.repeat(point, counts)
+                first = np.repeat(lo - np.cumsum(counts) + counts, counts)
+                found = self.order[first + np.arange(counts.sum())]
+                chord = np.sqrt(
+                    ((self.xyz[found] - points[pending[query]]) ** 2).sum(axis=1)
+                )
+                inside = chord <= chord_length(radius)
+                query, found, chord = query[inside], found[inside], chord[inside]
+
+                n_found = np.bincount(query, minlength=len(pending))
+                done = (n_found >= k) | (radius >= max_km)
+                keep = done[query]
+                query, found, chord = query[keep], found[keep], chord[keep]
+                # nearest first, ties by position as in a stable sort of within()
+                order = np.lexsort((found, chord, query))
+                query, found, chord = query[order], found[order], chord[order]
+                rank = np.arange(len(query)) - np.searchsorted(query, query, "left")
+                nearest = rank < k
+                rows = pending[query[nearest]]
+                distances[rows, rank[nearest]] = great_circle_km(chord[nearest])
+                positions[rows, rank[nearest]] = found[nearest]
+
+                pending = pending[~done]
+                radius *= 2.0
+        return distances, positions
+
+    def box(self, lon_min, lon_max, lat_min, lat_max):
+        """
+        Find the locations in a latitude/longitude box.
+
+        Args:
+            lon_min (float): The western edge of the box in degrees. If lon_min is more than
+                lon_max, the box crosses the dateline (0/360 degrees).
+            lon_max (float): The eastern edge of the box in degrees.
+            lat_min (float): The southern edge of the box in degrees.
+            lat_max (float): The northern edge of the box in degrees.
+
+        Returns:
+            numpy.ndarray: The sorted positions of the locations, edges included.
+        """
+        candidates = self._candidates(
+            max(lat_min, -90.0), min(lat_max, 90.0), self._lon_ranges(lon_min, lon_max)
+        )
+        lat = self.latitude[candidates]
+        return np.sort(candidates[(lat >= lat_min) & (lat <= lat_max)])
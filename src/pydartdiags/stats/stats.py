@@ -1,8 +1,11 @@
 # SPDX-License-Identifier: Apache-2.0
 import pandas as pd
 import numpy as np
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 from functools import wraps
 from datetime import datetime, timedelta
+from pydartdiags.obs_sequence.spatial import SpatialHash, unit_vectors
 
 
 def apply_to_phases_in_place(func):
@@ -155,6 +158,20 @@ def mean_then_sqrt(x):
     return np.sqrt(np.mean(x))
 
 
+def _set_column(df, column, values):
+    """
+    Set a column of df in place, adding it if it is new.
+
+    DataFrame.insert and DataFrame.isetitem set the column of df itself, so df may be a
+    slice of another DataFrame, e.g. df[df["type"] == t], without a SettingWithCopyWarning
+    and without turning on pandas copy-on-write.
+    """
+    if column in df.columns:
+        df.isetitem(df.columns.get_loc(column), values)
+    else:
+        df.insert(len(df.columns), column, values)
+
+
 @apply_to_phases_in_place
 def diag_stats(df, phase):
     """
@@ -185,8 +202,6 @@ def diag_stats(df, phase):
         - Spread is the standard deviation of the ensemble.
         - The function modifies the input DataFrame by adding new columns for the calculated statistics.
     """
-    pd.options.mode.copy_on_write = True
-
     # input from the observation sequence
     spread_column = f"{phase}_ensemble_spread"
     mean_column = f"{phase}_ensemble_mean"
@@ -196,9 +211,187 @@ def diag_stats(df, phase):
     bias_column = f"{phase}_bias"
     totalvar_column = f"{phase}_totalvar"
 
-    df[sq_err_column] = (df[mean_column] - df["observation"]) ** 2
-    df[bias_column] = df[mean_column] - df["observation"]
-    df[totalvar_column] = df["obs_err_var"] + df[spread_column] ** 2
+    _set_column(df, sq_err_column, (df[mean_column] - df["observation"]) ** 2)
+    _set_column(df, bias_column, df[mean_column] - df["observation"])
+    _set_column(df, totalvar_column, df["obs_err_var"] + df[spread_column] ** 2)
+
+
+def _member_columns(df, phase):
+    """The ensemble member columns for a phase."""
+    return [c for c in df.columns if c.startswith(f"{phase}_ensemble_member")]
+
+
+def _crps_ensemble(members, obs):
+    """
+    CRPS of each ensemble (row of members) against the observation.
+
+    Uses CRPS = mean|x_i - y| - 1/(2m^2) sum_ij |x_i - x_j|, with the sum over member
+    pairs computed from the sorted members as 2 sum_i (2i - m - 1) x_(i).
+    """
+    m = members.shape[1]
+    weights = 2.0 * np.arange(1, m + 1) - m - 1
+    abs_err = np.abs(members - obs[:, None]).mean(axis=1)
+    return abs_err - (np.sort(members, axis=1) @ weights) / m**2
+
+
+@apply_to_phases_in_place
+def crps(df, phase, chunk_size=100000):
+    """
+    Calculate the continuous ranked probability score (CRPS) of the ensemble for each observation.
+
+    Note:
+        This function is decorated with @apply_to_phases_in_place, which modifies its usage.
+        You should call it as crps(df), and the decorator will automatically apply the
+        function to all relevant phases (‘prior’ and ‘posterior’) modifying the DataFrame
+        in place.
+
+    The CRPS is calculated from the ensemble member copies, sorting the members of each
+    observation. The members are processed chunk_size observations at a time to bound the
+    memory used. Phases without ensemble member copies are skipped.
+
+    Once calculated, the mean CRPS and the spread-skill ratio (total spread / RMSE) are
+    included in the output of :func:`grand_statistics`, :func:`layer_statistics`,
+    :func:`time_statistics` and :func:`binned_statistics`.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing observation data and ensemble
+            member copies '{phase}_ensemble_member_N'.
+        chunk_size (int, optional): The number of observations processed at a time. Default is 100000.
+
+    Returns:
+        None: The function modifies the DataFrame in place by adding the column
+        'prior_crps' and/or 'posterior_crps'.
+    """
+    member_columns = _member_columns(df, phase)
+    if not member_columns:
+        return
+
+    positions = df.columns.get_indexer(member_columns)
+    obs = df["observation"].to_numpy(dtype=np.float64)
+    scores = np.empty(len(df))
+    for start in range(0, len(df), chunk_size):
+        stop = start + chunk_size
+        members = df.iloc[start:stop, positions].to_numpy(dtype=np.float64)
+        scores[start:stop] = _crps_ensemble(members, obs[start:stop])
+    _set_column(df, f"{phase}_crps", scores)
+
+
+def ensemble_mean_spread(df, members=None, chunk_size=100000):
+    """
+    Recompute the ensemble mean and spread copies from the ensemble member copies.
+
+    Use this after subsetting the ensemble members (for example with
+    :meth:`ObsSequence.join` and copies=), so that '{phase}_ensemble_mean' and
+    '{phase}_ensemble_spread' match the members kept. The members are accumulated in
+    float64, chunk_size observations at a time. The spread is the sample standard deviation
+    (ddof=1), as in DART. Observations with missing members (e.g. the NaN posterior members
+    for DART QC 2) get a NaN mean and spread.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing ensemble member copies
+            '{phase}_ensemble_member_N'.
+        members (list of int, optional): The member numbers N to use. Default is all the
+            members in the DataFrame.
+        chunk_size (int, optional): The number of observations processed at a time. Default is 100000.
+
+    Returns:
+        pandas.DataFrame: The DataFrame, modified in place, with the columns
+        '{phase}_ensemble_mean' and '{phase}_ensemble_spread' for each phase with member copies.
+
+    Raises:
+        ValueError: If a requested member is not in the DataFrame.
+
+    Examples:
+
+        .. code-block:: python
+
+            ensemble_mean_spread(obs_seq.df, members=range(1, 21))
+    """
+    for phase in ["prior", "posterior"]:
+        if members is None:
+            member_columns = _member_columns(df, phase)
+        else:
+            member_columns = [f"{phase}_ensemble_member_{n}" for n in members]
+            absent = [c for c in member_columns if c not in df.columns]
+            if absent and len(absent) < len(member_columns):
+                raise ValueError(f"Members not in the DataFrame: {absent}")
+            if absent:
+                continue
+        if not member_columns:
+            continue
+
+        positions = df.columns.get_indexer(member_columns)
+        mean = np.empty(len(df))
+        spread = np.full(len(df), np.nan)
+        for start in range(0, len(df), chunk_size):
+            stop = start + chunk_size
+            block = df.iloc[start:stop, positions].to_numpy(dtype=np.float64)
+            mean[start:stop] = block.mean(axis=1)
+            if block.shape[1] > 1:
+                spread[start:stop] = block.std(axis=1, ddof=1)
+        _set_column(df, f"{phase}_ensemble_mean", mean)
+        _set_column(df, f"{phase}_ensemble_spread", spread)
+    return df
+
+
+def _ensemble_score_aggs(df, phase):
+    """Aggregations for the ensemble scores, if they have been calculated with :func:`crps`."""
+    if f"{phase}_crps" in df.columns:
+        return {f"{phase}_crps": "mean"}
+    return {}
+
+
+def _add_spread_skill(stats_df, phase):
+    """Add the spread-skill ratio (total spread / RMSE) alongside the ensemble scores."""
+    if f"{phase}_crps" in stats_df.columns:
+        stats_df[f"{phase}_spread_skill"] = (
+            stats_df[f"{phase}_totalspread"] / stats_df[f"{phase}_rmse"]
+        )
+
+
+def _bin_codes(values, edges, include_lowest=True):
+    """
+    Integer bin codes for values against monotonically increasing bin edges.
+
+    Bins are closed on the right, (edge[i], edge[i+1]], matching ``pd.cut``.
+    If include_lowest is True the first bin also includes its left edge.
+    Values outside the edges, and NaN/NaT values, are given the code -1.
+
+    Args:
+        values (array-like): The values to bin.
+        edges (array-like): The bin edges, monotonically increasing.
+        include_lowest (bool, optional): Include the first edge in the first bin. Default is True.
+
+    Returns:
+        numpy.ndarray: An int64 array of bin codes, one per value.
+    """
+    values = np.asarray(values)
+    edges = np.asarray(edges)
+    codes = np.searchsorted(edges, values, side="left").astype(np.int64) - 1
+    if include_lowest:
+        codes[values == edges[0]] = 0
+    codes[(codes < 0) | (codes >= len(edges) - 1)] = -1
+    return codes
+
+
+def _layer_intervals(levels):
+    """The IntervalIndex that pd.cut(..., levels, include_lowest=True) labels its bins with."""
+    edges = np.asarray(levels, dtype=float)
+    return pd.cut(edges, edges, include_lowest=True).categories
+
+
+def _time_edges(time, time_value):
+    """
+    Time bin edges of width time_value covering all the times.
+
+    The first edge is 1 second before the minimum time, so the minimum time is included
+    in the first bin. The last edge is the first edge at or after the maximum time.
+    """
+    start = time.min() - timedelta(seconds=1)
+    time_delta = pd.Timedelta(time_value)
+    n_bins = int(np.ceil((time.max() - start) / time_delta))
+
+    return pd.date_range(start=start, periods=n_bins + 1, freq=time_delta)
 
 
 def bin_by_layer(df, levels, verticalUnit="pressure (Pa)"):
@@ -228,11 +421,16 @@ def bin_by_layer(df, levels, verticalUnit="pressure (Pa)"):
         - The function modifies the input DataFrame by adding 'vlevels' and 'midpoint' columns.
         - The 'midpoint' values are calculated as half the midpoint of each vertical level bin.
     """
-    pd.options.mode.copy_on_write = True
-    df.loc[df["vert_unit"] == verticalUnit, "vlevels"] = pd.cut(
-        df.loc[df["vert_unit"] == verticalUnit, "vertical"], levels, include_lowest=True
+    codes = _bin_codes(df["vertical"].to_numpy(dtype=float), levels)
+    codes[(df["vert_unit"] != verticalUnit).to_numpy()] = -1
+
+    intervals = _layer_intervals(levels)
+    _set_column(
+        df, "vlevels", pd.Categorical.from_codes(codes, intervals, ordered=True)
+    )
+    _set_column(
+        df, "midpoint", pd.Categorical.from_codes(codes, intervals.mid, ordered=True)
     )
-    df.loc[:, "midpoint"] = df["vlevels"].apply(lambda x: x.mid)
 
 
 def bin_by_time(df, time_value):
@@ -248,24 +446,19 @@ def bin_by_time(df, time_value):
     Returns:
         None: The function modifies the DataFrame in place by adding 'time_bin' and 'time_bin_midpoint' columns.
     """
-    # Create time bins
-    start = df["time"].min() - timedelta(seconds=1)
-    end = df["time"].max()
-    # Determine if the end time aligns with the bin boundary
-    time_delta = pd.Timedelta(time_value)
-    aligned_end = (pd.Timestamp(end) + time_delta).floor(time_value)
-
-    time_bins = pd.date_range(
-        start=start,
-        end=aligned_end,
-        freq=time_value,
+    time_bins = _time_edges(df["time"], time_value)
+    codes = _bin_codes(
+        df["time"].to_numpy(), time_bins.to_numpy(), include_lowest=False
     )
 
-    df["time_bin"] = pd.cut(df["time"], bins=time_bins)
-
-    # Calculate the midpoint of each time bin
-    df["time_bin_midpoint"] = df["time_bin"].apply(
-        lambda x: x.left + (x.right - x.left) / 2 if pd.notnull(x) else None
+    intervals = pd.IntervalIndex.from_breaks(time_bins, closed="right")
+    _set_column(
+        df, "time_bin", pd.Categorical.from_codes(codes, intervals, ordered=True)
+    )
+    _set_column(
+        df,
+        "time_bin_midpoint",
+        pd.Categorical.from_codes(codes, intervals.mid, ordered=True),
     )
 
 
@@ -302,6 +495,7 @@ def grand_statistics(df, phase):
                 f"{phase}_sq_err": mean_then_sqrt,
                 f"{phase}_bias": "mean",
                 f"{phase}_totalvar": mean_then_sqrt,
+                **_ensemble_score_aggs(df, phase),
             }
         )
         .reset_index()
@@ -309,6 +503,7 @@ def grand_statistics(df, phase):
 
     grand.rename(columns={f"{phase}_sq_err": f"{phase}_rmse"}, inplace=True)
     grand.rename(columns={f"{phase}_totalvar": f"{phase}_totalspread"}, inplace=True)
+    _add_spread_skill(grand, phase)
 
     return grand
 
@@ -353,6 +548,7 @@ def layer_statistics(df, phase):
                 f"{phase}_totalvar": mean_then_sqrt,
                 "vert_unit": "first",
                 "vlevels": "first",
+                **_ensemble_score_aggs(df, phase),
             }
         )
         .reset_index()
@@ -362,6 +558,7 @@ def layer_statistics(df, phase):
     layer_stats.rename(
         columns={f"{phase}_totalvar": f"{phase}_totalspread"}, inplace=True
     )
+    _add_spread_skill(layer_stats, phase)
 
     return layer_stats
 
@@ -405,6 +602,7 @@ def time_statistics(df, phase):
                 f"{phase}_totalvar": mean_then_sqrt,
                 "time_bin": "first",
                 "time": "first",
+                **_ensemble_score_aggs(df, phase),
             }
         )
         .reset_index()
@@ -414,6 +612,7 @@ def time_statistics(df, phase):
     time_stats.rename(
         columns={f"{phase}_totalvar": f"{phase}_totalspread"}, inplace=True
     )
+    _add_spread_skill(time_stats, phase)
 
     return time_stats
 
@@ -508,3 +707,1372 @@ def possible_vs_used_by_time(df):
 
     # Combine possible and used into a single DataFrame
     return pd.concat([possible, used], axis=1).reset_index()
+
+
+def bin_observations(
+    df,
+    by=("type",),
+    levels=None,
+    verticalUnit="pressure (Pa)",
+    time_value=None,
+    lat_bins=None,
+    lon_bins=None,
+    resolution=None,
+    equal_area=False,
+    time_range=None,
+):
+    """
+    Assign every observation an integer group code for any combination of binning dimensions.
+
+    Each dimension is reduced to an integer code per observation (a factorization for
+    categorical columns, ``np.searchsorted`` against the bin edges for numeric dimensions).
+    The per-dimension codes are combined into a single code with ``np.ravel_multi_index``
+    and compressed to the groups that actually contain observations.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing observation data.
+        by (list of str, optional): Columns to group by category, e.g. 'type' or
+            'DART_quality_control'. Default is ('type',).
+        levels (list, optional): Vertical bin edges. Only observations with vert_unit equal
+            to verticalUnit are binned.
+        verticalUnit (str, optional): The unit of the vertical levels. Default is 'pressure (Pa)'.
+        time_value (str, optional): The width of each time bin (e.g. '6h'). Bins are laid out
+            as in :func:`bin_by_time`.
+        lat_bins (list, optional): Latitude bin edges in degrees.
+        lon_bins (list, optional): Longitude bin edges in degrees.
+        resolution (float, optional): Bin by the cells of the global grid from
+            :func:`grid_edges` with this spacing in degrees, instead of lat_bins and lon_bins.
+            The cells are found with index arithmetic rather than a search of the edges.
+            Cannot be given with lat_bins or lon_bins.
+        equal_area (bool, optional): Use an equal-area grid for resolution. Default is False.
+        time_range (tuple, optional): The (minimum, maximum) times to lay out the time bins
+            over, instead of the minimum and maximum times in df. Use the same time_range to
+            give the same time bins for several DataFrames, e.g. the partitions of a larger
+            DataFrame.
+
+    Returns:
+        tuple: A tuple containing two elements:
+         - codes (numpy.ndarray): The group code for each row of df, -1 for rows that fall
+           outside the bins (or have a different vertical unit).
+         - keys (pandas.DataFrame): One row per group code describing the group, with a column
+           for each 'by' column and 'midpoint', 'time_bin_midpoint', 'lat_midpoint' and
+           'lon_midpoint' for the binned dimensions.
+
+    Raises:
+        ValueError: If no binning dimension is given, or resolution is given with lat_bins
+            or lon_bins.
+
+    Examples:
+
+        .. code-block:: python
+
+            codes, keys = bin_observations(
+                df, by=["type"], levels=levels, time_value="6h",
+                lat_bins=np.arange(-90, 91, 10), lon_bins=np.arange(0, 361, 10)
+            )
+    """
+    if resolution is not None and (lat_bins is not None or lon_bins is not None):
+        raise ValueError("Give either resolution or lat_bins and lon_bins, not both.")
+
+    dim_codes = []  # per-row integer codes for each dimension
+    dim_labels = {}  # label for each code of each dimension
+
+    for column in by:
+        codes, uniques = pd.factorize(df[column], sort=True)
+        dim_codes.append(codes.astype(np.int64))
+        dim_labels[column] = np.asarray(uniques, dtype=object)
+
+    if levels is not None:
+        codes = _bin_codes(df["vertical"].to_numpy(dtype=float), levels)
+        codes[(df["vert_unit"] != verticalUnit).to_numpy()] = -1
+        dim_codes.append(codes)
+        dim_labels["midpoint"] = _layer_intervals(levels).mid.to_numpy()
+
+    if time_value is not None:
+        times = df["time"] if time_range is None else pd.Series(time_range)
+        if times.notna().any():
+            edges = _time_edges(times, time_value)
+        else:
+            # no times to lay the bins out over, so no time bins
+            edges = pd.DatetimeIndex([])
+        dim_codes.append(
+            _bin_codes(df["time"].to_numpy(), edges.to_numpy(), include_lowest=False)
+        )
+        dim_labels["time_bin_midpoint"] = pd.IntervalIndex.from_breaks(
+            edges, closed="right"
+        ).mid
+
+    if resolution is not None:
+        lat_edges, lon_edges = grid_edges(resolution, equal_area)
+        dim_codes.extend(_grid_cell_codes(df, resolution, equal_area))
+        dim_labels["lat_midpoint"] = (lat_edges[:-1] + lat_edges[1:]) / 2
+        dim_labels["lon_midpoint"] = (lon_edges[:-1] + lon_edges[1:]) / 2
+
+    for column, edges in (("latitude", lat_bins), ("longitude", lon_bins)):
+        if edges is not None:
+            edges = np.asarray(edges, dtype=float)
+            dim_codes.append(_bin_codes(df[column].to_numpy(dtype=float), edges))
+            dim_labels[f"{column[:3]}_midpoint"] = (edges[:-1] + edges[1:]) / 2
+
+    if not dim_codes:
+        raise ValueError("At least one binning dimension is required.")
+
+    sizes = tuple(len(labels) for labels in dim_labels.values())
+    valid = np.ones(len(df), dtype=bool)
+    for codes in dim_codes:
+        valid &= codes >= 0
+
+    combined = np.ravel_multi_index([codes[valid] for codes in dim_codes], sizes)
+    groups, inverse = np.unique(combined, return_inverse=True)
+
+    codes = np.full(len(df), -1, dtype=np.int64)
+    codes[valid] = inverse.reshape(-1)
+
+    keys = pd.DataFrame(
+        {
+            name: labels[group_codes]
+            for (name, labels), group_codes in zip(
+                dim_labels.items(), np.unravel_index(groups, sizes)
+            )
+        }
+    )
+
+    return codes, keys
+
+
+def _group_sum_count(codes, n_groups, values):
+    """
+    Per-group sum and count of values using np.bincount, skipping NaNs.
+
+    Rows with a negative code are not in any group.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    keep = (codes >= 0) & ~np.isnan(values)
+    sums = np.bincount(codes[keep], weights=values[keep], minlength=n_groups)
+    counts = np.bincount(codes[keep], minlength=n_groups)
+    return sums, counts
+
+
+def _phase_sums(codes, n_groups, df, phase):
+    """
+    Per-group sums of the squared error, bias and total variance of a phase, and their count.
+
+    Only rows where all three are valid are summed, so the RMSE, bias and total spread are
+    means over the same observations, as in :func:`bootstrap_statistics`.
+    """
+    values = [
+        df[f"{phase}_{stat}"].to_numpy(dtype=np.float64)
+        for stat in ["sq_err", "bias", "totalvar"]
+    ]
+    valid = ~(np.isnan(values[0]) | np.isnan(values[1]) | np.isnan(values[2]))
+    codes = np.where(valid, codes, -1)
+    sums = [_group_sum_count(codes, n_groups, v)[0] for v in values]
+    return sums, np.bincount(codes[codes >= 0], minlength=n_groups)
+
+
+def _binned_sums(df, codes, keys):
+    """
+    Partial aggregates (sums and counts) of the diagnostic statistics for each group.
+
+    The sums can be added together across DataFrames that share the same binning and
+    turned into statistics with :func:`_finalize_sums`.
+    """
+    n_groups = len(keys)
+    sums = keys.copy()
+    sums["count"] = np.bincount(codes[codes >= 0], minlength=n_groups)
+    for phase in ["prior", "posterior"]:
+        if f"{phase}_sq_err" not in df.columns:
+            continue
+        totals, n = _phase_sums(codes, n_groups, df, phase)
+        for stat, total in zip(["sq_err", "bias", "totalvar"], totals):
+            sums[f"{phase}_{stat}_sum"] = total
+        sums[f"{phase}_n"] = n
+        if f"{phase}_crps" in df.columns:
+            total, n = _group_sum_count(codes, n_groups, df[f"{phase}_crps"])
+            sums[f"{phase}_crps_sum"] = total
+            sums[f"{phase}_crps_n"] = n
+    return sums
+
+
+def _finalize_sums(sums):
+    """
+    Convert partial aggregates from :func:`_binned_sums` to RMSE, bias and total spread,
+    and CRPS and spread-skill ratio if the CRPS was aggregated.
+    """
+    stats_df = sums.drop(
+        columns=[c for c in sums.columns if c.endswith(("_sum", "_n"))]
+    )
+    for phase in ["prior", "posterior"]:
+        if f"{phase}_n" not in sums.columns:
+            continue
+        n = sums[f"{phase}_n"].to_numpy(dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            stats_df[f"{phase}_rmse"] = np.sqrt(sums[f"{phase}_sq_err_sum"] / n)
+            stats_df[f"{phase}_bias"] = sums[f"{phase}_bias_sum"] / n
+            stats_df[f"{phase}_totalspread"] = np.sqrt(
+                sums[f"{phase}_totalvar_sum"] / n
+            )
+            if f"{phase}_crps_sum" in sums.columns:
+                stats_df[f"{phase}_crps"] = (
+                    sums[f"{phase}_crps_sum"] / sums[f"{phase}_crps_n"]
+                )
+        _add_spread_skill(stats_df, phase)
+    return stats_df
+
+
+def binned_statistics(df, by=("type",), **kwargs):
+    """
+    Calculate statistics (RMSE, bias, total spread) for any combination of binning dimensions.
+
+    This is a general version of :func:`grand_statistics`, :func:`layer_statistics` and
+    :func:`time_statistics`. Observations are grouped with :func:`bin_observations`, which
+    can bin by any combination of categorical columns (type, QC flag), vertical layer,
+    time window and latitude/longitude box, and the statistics are aggregated over the
+    integer group codes with ``np.bincount``. Only groups containing observations are returned.
+
+    This function assumes that diagnostic statistics have already been computed with
+    :func:`diag_stats` and are present in the DataFrame. The statistics are calculated for
+    all phases ('prior' and 'posterior') present. Observations where any of the squared
+    error, bias or total variance of a phase is NaN (e.g. posterior values for observations
+    with DART QC 2) are left out of the statistics of that phase.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing diagnostic statistics for observations.
+        by (list of str, optional): Columns to group by category. Default is ('type',).
+        **kwargs: Binning options passed to :func:`bin_observations`: levels, verticalUnit,
+            time_value, lat_bins, lon_bins, resolution, equal_area, time_range.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with a column for each binning dimension and columns:
+            - 'count': The number of observations in the group.
+            - '{phase}_rmse': The root mean square error for the phase.
+            - '{phase}_bias': The mean bias for the phase.
+            - '{phase}_totalspread': The total spread for the phase.
+
+    Examples:
+
+        .. code-block:: python
+
+            diag_stats(obs_seq.df)
+            used = select_used_qcs(obs_seq.df)
+            result = binned_statistics(
+                used,
+                by=["type"],
+                levels=[i * 100 for i in [0, 100, 200, 300, 500, 700, 850, 1000]],
+                time_value="6h",
+                lat_bins=np.arange(-90, 91, 10),
+                lon_bins=np.arange(0, 361, 10),
+            )
+    """
+    codes, keys = bin_observations(df, by=by, **kwargs)
+    return _finalize_sums(_binned_sums(df, codes, keys))
+
+
+def reliability(
+    df, threshold, phase="prior", n_bins=10, by=("type",), chunk_size=100000, **kwargs
+):
+    """
+    Calculate reliability diagram data for the event 'observation > threshold'.
+
+    The forecast probability of the event for each observation is the fraction of ensemble
+    members above the threshold. The forecast probabilities are binned into n_bins equal
+    width bins, and for each group and probability bin the mean forecast probability is
+    compared with the observed frequency of the event. A reliable ensemble has an observed
+    frequency equal to the forecast probability.
+
+    The groups are the same as for :func:`binned_statistics`, so the reliability can be
+    calculated per type, vertical layer, time bin or region. Observations whose ensemble
+    members are missing (e.g. posterior for DART QC 2) are ignored.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing observation data and ensemble
+            member copies '{phase}_ensemble_member_N'.
+        threshold (float): The event threshold.
+        phase (str, optional): The phase, 'prior' or 'posterior'. Default is 'prior'.
+        n_bins (int, optional): The number of forecast probability bins. Default is 10.
+        by (list of str, optional): Columns to group by category. Default is ('type',).
+        chunk_size (int, optional): The number of observations processed at a time. Default is 100000.
+        **kwargs: Binning options passed to :func:`bin_observations`: levels, verticalUnit,
+            time_value, lat_bins, lon_bins, resolution, equal_area, time_range.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with a column for each binning dimension and columns:
+            - 'probability_bin': The midpoint of the forecast probability bin.
+            - 'count': The number of observations in the group and probability bin.
+            - 'forecast_probability': The mean forecast probability.
+            - 'observed_frequency': The fraction of observations above the threshold.
+
+    Raises:
+        ValueError: If the DataFrame has no ensemble member copies for the phase.
+    """
+    member_columns = _member_columns(df, phase)
+    if not member_columns:
+        raise ValueError(f"No {phase} ensemble member copies in the DataFrame.")
+
+    codes, keys = bin_observations(df, by=by, **kwargs)
+    positions = df.columns.get_indexer(member_columns)
+    probability = np.empty(len(df))
+    missing = np.empty(len(df), dtype=bool)
+    for start in range(0, len(df), chunk_size):
+        stop = start + chunk_size
+        members = df.iloc[start:stop, positions].to_numpy(dtype=np.float64)
+        probability[start:stop] = (members > threshold).mean(axis=1)
+        missing[start:stop] = np.isnan(members).any(axis=1)
+    event = (df["observation"].to_numpy(dtype=np.float64) > threshold).astype(float)
+
+    valid = (codes >= 0) & ~missing
+    probability_codes = np.minimum((probability * n_bins).astype(np.int64), n_bins - 1)
+    combined = codes[valid] * n_bins + probability_codes[valid]
+    size = len(keys) * n_bins
+
+    count = np.bincount(combined, minlength=size)
+    forecast = np.bincount(combined, weights=probability[valid], minlength=size)
+    observed = np.bincount(combined, weights=event[valid], minlength=size)
+
+    nonempty = np.flatnonzero(count)
+    result = keys.iloc[nonempty // n_bins].reset_index(drop=True)
+    result["probability_bin"] = (nonempty % n_bins + 0.5) / n_bins
+    result["count"] = count[nonempty]
+    result["forecast_probability"] = forecast[nonempty] / count[nonempty]
+    result["observed_frequency"] = observed[nonempty] / count[nonempty]
+    return result
+
+
+def qc_breakdown(df, levels=None, verticalUnit="pressure (Pa)", time_value=None):
+    """
+    Count the observations for every DART quality control value by type.
+
+    The full type x DART_quality_control contingency table, optionally also by vertical
+    layer and/or time bin, is computed with a single ``np.bincount`` over the combined
+    integer group and QC codes.
+
+    DART QC values:
+
+    - 0: assimilated
+    - 1: evaluated only
+    - 2: assimilated, but the posterior forward operator failed
+    - 3: evaluated only, but the posterior forward operator failed
+    - 4: prior forward operator failed
+    - 5: not used, by namelist control
+    - 6: rejected by the incoming data QC
+    - 7: rejected by the outlier threshold
+    - 8: vertical conversion failed
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing observation data.
+        levels (list, optional): Vertical bin edges. If given, the counts are also by layer,
+            and only observations with vert_unit equal to verticalUnit that fall within the
+            levels are counted.
+        verticalUnit (str, optional): The unit of the vertical levels. Default is 'pressure (Pa)'.
+        time_value (str, optional): The width of each time bin (e.g. '6h'). If given, the
+            counts are also by time bin.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with columns 'type', 'midpoint' (if levels are given),
+        'time_bin_midpoint' (if time_value is given), 'qc_0' to 'qc_8' with the count for
+        each DART QC value, 'possible' with the count of all observations, and 'used' with the
+        count of observations with DART QC 0 or 2.
+
+    Examples:
+
+        .. code-block:: python
+
+            table = qc_breakdown(obs_seq.df, levels=levels)
+    """
+    n_qc = 9
+    codes, keys = bin_observations(
+        df,
+        by=["type"],
+        levels=levels,
+        verticalUnit=verticalUnit,
+        time_value=time_value,
+    )
+    qc = df["DART_quality_control"].to_numpy()
+    in_range = (codes >= 0) & (qc >= 0) & (qc < n_qc)
+    combined = codes[in_range] * n_qc + qc[in_range].astype(np.int64)
+    counts = np.bincount(combined, minlength=len(keys) * n_qc).reshape(-1, n_qc)
+
+    result = keys.copy()
+    for value in range(n_qc):
+        result[f"qc_{value}"] = counts[:, value]
+    result["possible"] = np.bincount(codes[codes >= 0], minlength=len(keys))
+    result["used"] = counts[:, 0] + counts[:, 2]
+    return result
+
+
+def outlier_threshold_sweep(df, thresholds, by=("type",), qcs=(0, 2, 7), **kwargs):
+    """
+    Calculate the effect of different DART outlier thresholds on the prior statistics.
+
+    DART rejects an observation (DART QC 7) if its normalized innovation
+    |observation - prior mean| / sqrt(prior spread^2 + obs_err_var) is above the
+    outlier_threshold. This function reports, for each threshold, the number of
+    observations that would be rejected and the prior RMSE and bias of the observations
+    that would be kept, without rerunning filter.
+
+    The observations considered are those with a DART QC in qcs, by default the
+    observations that passed every other check (0, 2 and 7). The normalized innovations
+    are located in the sorted thresholds with one ``np.searchsorted``, the sums for each
+    group and threshold interval are computed with one ``np.bincount``, and a cumulative
+    sum over the thresholds gives the statistics for every threshold. The groups are the
+    same as for :func:`binned_statistics`.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing observation data.
+        thresholds (list of float): The outlier thresholds. A negative threshold means no
+            outlier check, as in DART.
+        by (list of str, optional): Columns to group by category. Default is ('type',).
+        qcs (list of int, optional): The DART QC values of the observations considered.
+            Default is (0, 2, 7).
+        **kwargs: Binning options passed to :func:`bin_observations`: levels, verticalUnit,
+            time_value, lat_bins, lon_bins, resolution, equal_area, time_range.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with a row for each group and threshold, with a column
+        for each binning dimension and columns:
+            - 'threshold': The outlier threshold.
+            - 'considered': The number of observations considered.
+            - 'rejected': The number of observations that would be rejected.
+            - 'used': The number of observations that would be kept.
+            - 'prior_rmse': The prior RMSE of the kept observations.
+            - 'prior_bias': The prior bias of the kept observations.
+
+    Examples:
+
+        .. code-block:: python
+
+            sweep = outlier_threshold_sweep(obs_seq.df, [2.0, 3.0, 4.0, -1], levels=levels)
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    n_thresholds = len(thresholds)
+    effective = np.where(thresholds < 0, np.inf, thresholds)
+    order = np.argsort(effective, kind="stable")
+    sorted_thresholds = effective[order]
+    position = np.empty(n_thresholds, dtype=np.int64)
+    position[order] = np.arange(n_thresholds)  # sorted position of each threshold
+
+    codes, keys = bin_observations(df, by=by, **kwargs)
+    bias = (df["prior_ensemble_mean"] - df["observation"]).to_numpy(dtype=np.float64)
+    totalvar = (df["prior_ensemble_spread"] ** 2 + df["obs_err_var"]).to_numpy(
+        dtype=np.float64
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = np.abs(bias) / np.sqrt(totalvar)
+
+    valid = (
+        (codes >= 0) & df["DART_quality_control"].isin(qcs).to_numpy() & ~np.isnan(z)
+    )
+    # Kept for the k-th sorted threshold if z <= threshold, i.e. if first <= k
+    first = np.searchsorted(sorted_thresholds, z[valid], side="left")
+    combined = codes[valid] * (n_thresholds + 1) + first
+    size = len(keys) * (n_thresholds + 1)
+
+    shape = (len(keys), n_thresholds + 1)
+    count = np.bincount(combined, minlength=size).reshape(shape)
+    sum_bias = np.bincount(combined, weights=bias[valid], minlength=size).reshape(shape)
+    sum_sq_err = np.bincount(
+        combined, weights=bias[valid] ** 2, minlength=size
+    ).reshape(shape)
+
+    considered = count.sum(axis=1)
+    used = np.cumsum(count, axis=1)[:, :n_thresholds]
+    sum_bias = np.cumsum(sum_bias, axis=1)[:, :n_thresholds]
+    sum_sq_err = np.cumsum(sum_sq_err, axis=1)[:, :n_thresholds]
+
+    result = keys.loc[keys.index.repeat(n_thresholds)].reset_index(drop=True)
+    result["threshold"] = np.tile(thresholds, len(keys))
+    # Back from the sorted thresholds to the order given
+    used = used[:, position].reshape(-1)
+    result["considered"] = np.repeat(considered, n_thresholds)
+    result["rejected"] = result["considered"] - used
+    result["used"] = used
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result["prior_rmse"] = np.sqrt(sum_sq_err[:, position].reshape(-1) / used)
+        result["prior_bias"] = sum_bias[:, position].reshape(-1) / used
+    return result
+
+
+def station_ids(df, source="location", decimals=2):
+    """
+    Identify the station or platform of each observation as an integer coded column.
+
+    Adds a categorical column 'station' to the DataFrame. Categoricals are stored as integer
+    codes, so grouping by station scales to many distinct stations.
+
+    Observations from fixed stations (radiosondes, surface networks) usually carry no
+    station identifier in the obs_seq file, so by default a station is identified by its
+    horizontal location, rounded to the given number of decimals. Observation types that
+    carry an identifier in their obs_def metadata can use the first metadata entry instead.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing observation data.
+        source (str, optional): 'location' to identify stations by longitude and latitude,
+            or 'metadata' to use the first metadata entry. Default is 'location'.
+        decimals (int, optional): The number of decimals the longitude and latitude are
+            rounded to for source='location'. Default is 2.
+
+    Returns:
+        pandas.DataFrame: The DataFrame, modified in place, with a categorical column 'station'.
+        Observations with a missing longitude or latitude for source='location', or without
+        metadata for source='metadata', have a missing station.
+
+    Raises:
+        ValueError: If source is not 'location' or 'metadata'.
+    """
+    if source == "location":
+        lon_codes, lons = pd.factorize(df["longitude"].round(decimals), sort=True)
+        lat_codes, lats = pd.factorize(df["latitude"].round(decimals), sort=True)
+        # NaN longitudes or latitudes have the code -1, and no station
+        located = (lon_codes >= 0) & (lat_codes >= 0)
+        combined = lon_codes[located].astype(np.int64) * len(lats) + lat_codes[located]
+        station_codes, stations = pd.factorize(combined, sort=True)
+        codes = np.full(len(df), -1, dtype=np.int64)
+        codes[located] = station_codes
+        labels = (
+            pd.Series(lons[stations // len(lats)]).map(f"{{:.{decimals}f}}".format)
+            + "_"
+            + pd.Series(lats[stations % len(lats)]).map(f"{{:.{decimals}f}}".format)
+        )
+        _set_column(df, "station", pd.Categorical.from_codes(codes, labels))
+    elif source == "metadata":
+        # the first metadata entry of each row, then whitespace is normalized once per
+        # distinct entry rather than once per row
+        exploded = pd.Series(df["metadata"].to_numpy()).explode()
+        first = exploded[~exploded.index.duplicated()].to_numpy()
+        entry_codes, entries = pd.factorize(first)
+        station_codes, labels = pd.factorize(
+            pd.Index(entries.astype(str)).str.split().str.join(" "), sort=True
+        )
+        codes = np.append(station_codes, -1)[entry_codes]  # -1 for no metadata
+        _set_column(df, "station", pd.Categorical.from_codes(codes, labels))
+    else:
+        raise ValueError(f"source must be 'location' or 'metadata', not {source!r}")
+    return df
+
+
+def station_statistics(df, by=("type",), min_count=1, **kwargs):
+    """
+    Calculate statistics (RMSE, bias, total spread) for each station and observation type.
+
+    The stations are identified with :func:`station_ids`, which is called with its defaults
+    if the DataFrame has no 'station' column. The statistics are calculated as in
+    :func:`binned_statistics` and the mean longitude and latitude of each station are added.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing diagnostic statistics for observations.
+        by (list of str, optional): Columns to group by category, in addition to station.
+            Default is ('type',).
+        min_count (int, optional): Only return groups with at least min_count observations.
+            Default is 1.
+        **kwargs: Binning options passed to :func:`bin_observations`: levels, verticalUnit,
+            time_value, lat_bins, lon_bins, resolution, equal_area, time_range.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with columns 'station', a column for each binning
+        dimension, 'count', 'longitude', 'latitude', '{phase}_rmse', '{phase}_bias' and
+        '{phase}_totalspread'.
+
+    Examples:
+
+        .. code-block:: python
+
+            diag_stats(obs_seq.df)
+            used = select_used_qcs(obs_seq.df)
+            sondes = used[used["type"] == "RADIOSONDE_TEMPERATURE"]
+            bias_table = station_statistics(sondes, min_count=10)
+    """
+    if "station" not in df.columns:
+        station_ids(df)
+
+    codes, keys = bin_observations(df, by=["station", *by], **kwargs)
+    sums = _binned_sums(df, codes, keys)
+    for i, column in enumerate(["longitude", "latitude"]):
+        total, n = _group_sum_count(codes, len(keys), df[column])
+        sums.insert(len(keys.columns) + 1 + i, column, total / np.maximum(n, 1))
+    result = _finalize_sums(sums)
+    return result[result["count"] >= min_count].reset_index(drop=True)
+
+
+def observation_density(df, resolution=1.0, by=("type",), **kwargs):
+    """
+    Count the observations in each cell of a global latitude/longitude grid.
+
+    The grid cell of each observation is found by index arithmetic (see
+    :func:`bin_observations` with resolution), so the counts scale to tens of millions of
+    observations. Only cells containing observations are returned.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing observation data.
+        resolution (float, optional): The grid spacing in degrees. Default is 1.0.
+        by (list of str, optional): Columns to group by category. Default is ('type',).
+        **kwargs: Binning options passed to :func:`bin_observations`: levels, verticalUnit,
+            time_value, equal_area.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with a column for each binning dimension, including
+        'lat_midpoint' and 'lon_midpoint', and 'count', the number of observations in the cell.
+
+    Examples:
+
+        .. code-block:: python
+
+            density = observation_density(obs_seq.df, resolution=0.5, time_value="1h")
+            crowded = density[density["count"] > 10]
+    """
+    codes, keys = bin_observations(df, by=by, resolution=resolution, **kwargs)
+    keys["count"] = np.bincount(codes[codes >= 0], minlength=len(keys))
+    return keys
+
+
+def neighbor_counts(
+    df,
+    distance_km,
+    by=("type",),
+    vertical_tolerance=0.0,
+    time_tolerance="0s",
+    chunk_size=1000000,
+):
+    """
+    Count the near-duplicates of each observation.
+
+    A near-duplicate of an observation is another observation with the same 'by' columns
+    and vertical unit, within distance_km horizontally, within vertical_tolerance vertically
+    and within time_tolerance in time. The pairs are found with a
+    :class:`~pydartdiags.obs_sequence.spatial.SpatialHash` index with cells of distance_km,
+    so only observations in neighbouring cells are compared.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing loc3d observation data.
+        distance_km (float): The horizontal great-circle distance in km. Must be positive.
+        by (list of str, optional): Columns that must match. Default is ('type',).
+        vertical_tolerance (float, optional): The largest vertical difference. Default is 0.0.
+        time_tolerance (str or timedelta, optional): The largest time difference.
+            Default is '0s', the same time.
+        chunk_size (int, optional): The number of observations queried at a time. Default is 1000000.
+
+    Returns:
+        numpy.ndarray: The number of near-duplicates of each observation.
+    """
+    time_tolerance = pd.Timedelta(time_tolerance)
+    same = [*by] + [c for c in ["vert_unit"] if c in df.columns]
+    if time_tolerance == pd.Timedelta(0):
+        same.append("time")  # only pair observations at exactly the same time
+    groups, _ = bin_observations(df, by=same)
+
+    index = SpatialHash(df["longitude"], df["latitude"], distance_km, groups=groups)
+    vertical = df["vertical"].to_numpy(dtype=np.float64)
+    time = df["time"].to_numpy()
+    counts = np.zeros(len(df), dtype=np.int64)
+    for i, j in index.pairs_within(distance_km, chunk_size=chunk_size):
+        close = (
+            (groups[i] >= 0)
+            & (np.abs(vertical[i] - vertical[j]) <= vertical_tolerance)
+            & (np.abs(time[i] - time[j]) <= time_tolerance.to_timedelta64())
+        )
+        counts += np.bincount(i[close], minlength=len(df))
+        counts += np.bincount(j[close], minlength=len(df))
+    return counts
+
+
+def duplicate_statistics(
+    df, distance_km, by=("type",), vertical_tolerance=0.0, time_tolerance="0s"
+):
+    """
+    Count the duplicate and near-duplicate observations by type.
+
+    Duplicates have the same 'by' columns, location and time as an earlier observation.
+    Near-duplicates are found with :func:`neighbor_counts`.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing loc3d observation data.
+        distance_km (float): The horizontal great-circle distance in km. Must be positive.
+        by (list of str, optional): Columns to group by, which must also match for
+            (near-)duplicates. Default is ('type',).
+        vertical_tolerance (float, optional): The largest vertical difference. Default is 0.0.
+        time_tolerance (str or timedelta, optional): The largest time difference.
+            Default is '0s', the same time.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with a column for each 'by' column and columns:
+            - 'count': The number of observations.
+            - 'duplicates': The number of observations that duplicate an earlier one.
+            - 'near_duplicates': The number of observations with at least one near-duplicate.
+            - 'max_neighbors': The largest number of near-duplicates of an observation.
+
+    Examples:
+
+        .. code-block:: python
+
+            duplicate_statistics(obs_seq.df, distance_km=10.0, vertical_tolerance=100.0)
+    """
+    location = ["longitude", "latitude", "vertical", "vert_unit", "time"]
+    duplicated = df.duplicated(
+        subset=[*by] + [c for c in location if c in df.columns]
+    ).to_numpy()
+    neighbors = neighbor_counts(
+        df,
+        distance_km,
+        by=by,
+        vertical_tolerance=vertical_tolerance,
+        time_tolerance=time_tolerance,
+    )
+
+    codes, keys = bin_observations(df, by=by)
+    valid = codes >= 0
+    n_groups = len(keys)
+    result = keys.copy()
+    result["count"] = np.bincount(codes[valid], minlength=n_groups)
+    result["duplicates"] = np.bincount(
+        codes[valid], weights=duplicated[valid], minlength=n_groups
+    ).astype(np.int64)
+    result["near_duplicates"] = np.bincount(
+        codes[valid], weights=neighbors[valid] > 0, minlength=n_groups
+    ).astype(np.int64)
+    max_neighbors = np.zeros(n_groups, dtype=np.int64)
+    np.maximum.at(max_neighbors, codes[valid], neighbors[valid])
+    result["max_neighbors"] = max_neighbors
+    return result
+
+
+def thin_observations(
+    df,
+    resolution=1.0,
+    time_value=None,
+    levels=None,
+    verticalUnit="pressure (Pa)",
+    equal_area=False,
+):
+    """
+    Select one observation per type, grid cell, time window and vertical level.
+
+    The observation closest to the centre of its grid cell is kept. The grid cells are
+    found by index arithmetic as in :func:`observation_density`.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing loc3d observation data.
+        resolution (float, optional): The grid spacing in degrees. Default is 1.0.
+        time_value (str, optional): The width of each time window (e.g. '1h'). If None,
+            observations are thinned regardless of time.
+        levels (list, optional): Vertical bin edges. If None, each vertical coordinate value
+            (e.g. a profile level or satellite channel level) is thinned separately. If given,
+            only observations with vert_unit equal to verticalUnit within the levels are kept.
+        verticalUnit (str, optional): The unit of the vertical levels. Default is 'pressure (Pa)'.
+        equal_area (bool, optional): Use an equal-area grid. Default is False.
+
+    Returns:
+        numpy.ndarray: The sorted row positions of the observations to keep.
+    """
+    by = ["type"] if levels is not None else ["type", "vert_unit", "vertical"]
+    codes, keys = bin_observations(
+        df,
+        by=by,
+        levels=levels,
+        verticalUnit=verticalUnit,
+        time_value=time_value,
+        resolution=resolution,
+        equal_area=equal_area,
+    )
+    rows = np.flatnonzero(codes >= 0)
+    codes = codes[rows]
+
+    # Squared chord distance to the cell centre
+    position = unit_vectors(
+        df["longitude"].to_numpy()[rows], df["latitude"].to_numpy()[rows]
+    )
+    centre = unit_vectors(
+        keys["lon_midpoint"].to_numpy()[codes], keys["lat_midpoint"].to_numpy()[codes]
+    )
+    distance = ((position - centre) ** 2).sum(axis=1)
+
+    order = np.lexsort((distance, codes))
+    first = np.r_[True, codes[order][1:] != codes[order][:-1]]
+    return np.sort(rows[order][first])
+
+
+def _regular_bin_codes(values, start, end, n_bins):
+    """
+    Integer bin codes for n_bins equal width bins between start and end.
+
+    The same as :func:`_bin_codes` for evenly spaced edges, but computed with
+    index arithmetic rather than a search of the edges.
+    """
+    with np.errstate(invalid="ignore"):
+        codes = np.ceil((values - start) * (n_bins / (end - start))) - 1
+        codes[values == start] = 0
+        codes[~((codes >= 0) & (codes < n_bins))] = -1
+    return codes.astype(np.int64)
+
+
+def grid_edges(resolution=1.0, equal_area=False):
+    """
+    Latitude and longitude edges of a global grid.
+
+    Args:
+        resolution (float, optional): The grid spacing in degrees. Default is 1.0.
+        equal_area (bool, optional): If True, the latitude edges are spaced evenly in
+            sin(latitude) so every grid cell has the same area. The number of latitude
+            bands is the same as for the regular grid. Default is False.
+
+    Returns:
+        tuple: A tuple containing two elements:
+         - lat_edges (numpy.ndarray): Latitude edges in degrees from -90 to 90.
+         - lon_edges (numpy.ndarray): Longitude edges in degrees from 0 to 360.
+    """
+    nlat = int(round(180.0 / resolution))
+    nlon = int(round(360.0 / resolution))
+    if equal_area:
+        lat_edges = np.rad2deg(np.arcsin(np.linspace(-1.0, 1.0, nlat + 1)))
+    else:
+        lat_edges = np.linspace(-90.0, 90.0, nlat + 1)
+    lon_edges = np.linspace(0.0, 360.0, nlon + 1)
+    return lat_edges, lon_edges
+
+
+def _grid_cell_codes(df, resolution=1.0, equal_area=False):
+    """
+    Latitude and longitude cell codes on the grid from :func:`grid_edges`.
+
+    Computed with index arithmetic; the grid is regular in sin(latitude) for equal area.
+    Longitudes are wrapped to [0, 360).
+    """
+    nlat = int(round(180.0 / resolution))
+    nlon = int(round(360.0 / resolution))
+    lat = df["latitude"].to_numpy(dtype=float)
+    if equal_area:
+        lat_codes = _regular_bin_codes(np.sin(np.deg2rad(lat)), -1.0, 1.0, nlat)
+    else:
+        lat_codes = _regular_bin_codes(lat, -90.0, 90.0, nlat)
+    lon = np.mod(df["longitude"].to_numpy(dtype=float), 360.0)
+    lon_codes = _regular_bin_codes(lon, 0.0, 360.0, nlon)
+    return lat_codes, lon_codes
+
+
+def gridded_statistics(df, resolution=1.0, equal_area=False):
+    """
+    Calculate maps of statistics (RMSE, bias, total spread) on a global latitude/longitude grid.
+
+    Observations are binned onto the grid from :func:`grid_edges` with integer index
+    arithmetic, and the statistics for every observation type and grid cell are aggregated
+    with a single ``np.bincount`` per statistic. Grid cells with no observations are NaN.
+
+    This function assumes that diagnostic statistics have already been computed with
+    :func:`diag_stats` and are present in the DataFrame. The statistics are calculated for
+    all phases ('prior' and 'posterior') present.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing diagnostic statistics for observations.
+            Longitudes are wrapped to [0, 360).
+        resolution (float, optional): The grid spacing in degrees. Default is 1.0.
+        equal_area (bool, optional): Use an equal-area grid, see :func:`grid_edges`. Default is False.
+
+    Returns:
+        dict: A dictionary with the following keys:
+            - 'type': The observation types, the first dimension of the grid arrays.
+            - 'lat_edges', 'lon_edges': The grid cell edges.
+            - 'latitude', 'longitude': The grid cell centers.
+            - 'count': The number of observations per type and grid cell.
+            - '{phase}_rmse', '{phase}_bias', '{phase}_totalspread': The statistics per type and grid cell.
+
+            The grid arrays have shape (number of types, number of latitudes, number of longitudes).
+
+    Examples:
+
+        .. code-block:: python
+
+            diag_stats(obs_seq.df)
+            grid = gridded_statistics(select_used_qcs(obs_seq.df), resolution=2.0)
+            itype = list(grid["type"]).index("RADIOSONDE_TEMPERATURE")
+            plt.pcolormesh(grid["lon_edges"], grid["lat_edges"], grid["prior_rmse"][itype])
+    """
+    lat_edges, lon_edges = grid_edges(resolution, equal_area)
+    shape_latlon = (len(lat_edges) - 1, len(lon_edges) - 1)
+    type_codes, types = pd.factorize(df["type"], sort=True)
+    lat_codes, lon_codes = _grid_cell_codes(df, resolution, equal_area)
+
+    shape = (len(types),) + shape_latlon
+    valid = (type_codes >= 0) & (lat_codes >= 0) & (lon_codes >= 0)
+    codes = np.full(len(df), -1, dtype=np.int64)
+    codes[valid] = np.ravel_multi_index(
+        (type_codes[valid], lat_codes[valid], lon_codes[valid]), shape
+    )
+    n_cells = int(np.prod(shape))
+
+    grid = {
+        "type": np.asarray(types, dtype=object),
+        "lat_edges": lat_edges,
+        "lon_edges": lon_edges,
+        "latitude": (lat_edges[:-1] + lat_edges[1:]) / 2,
+        "longitude": (lon_edges[:-1] + lon_edges[1:]) / 2,
+        "count": np.bincount(codes[valid], minlength=n_cells).reshape(shape),
+    }
+    for phase in ["prior", "posterior"]:
+        if f"{phase}_sq_err" not in df.columns:
+            continue
+        (sq_err, bias, totalvar), n = _phase_sums(codes, n_cells, df, phase)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            grid[f"{phase}_rmse"] = np.sqrt(sq_err / n).reshape(shape)
+            grid[f"{phase}_bias"] = (bias / n).reshape(shape)
+            grid[f"{phase}_totalspread"] = np.sqrt(totalvar / n).reshape(shape)
+
+    return grid
+
+
+# Data shared with the bootstrap worker processes, set by _init_bootstrap_worker
+_bootstrap_data = {}
+
+
+def _init_bootstrap_worker(codes, n_groups, values):
+    """Store the bootstrap data in the worker process, so it is only sent once per worker."""
+    _bootstrap_data["codes"] = codes
+    _bootstrap_data["n_groups"] = n_groups
+    _bootstrap_data["values"] = values
+
+
+def _bootstrap_chunk(n_resamples, seed):
+    """
+    Poisson bootstrap resamples of the grouped statistics.
+
+    Each resample gives every observation a Poisson(1) weight and aggregates the
+    weighted sums per group with np.bincount, so the DataFrame is never resampled.
+
+    Returns:
+        dict: '{phase}_{stat}': array of shape (n_resamples, n_groups) for each phase and
+        statistic (rmse, bias, totalspread).
+    """
+    codes = _bootstrap_data["codes"]
+    n_groups = _bootstrap_data["n_groups"]
+    values = _bootstrap_data["values"]
+    rng = np.random.default_rng(seed)
+
+    results = {}
+    for phase in values:
+        for stat in ["rmse", "bias", "totalspread"]:
+            results[f"{phase}_{stat}"] = np.empty((n_resamples, n_groups))
+
+    for i in range(n_resamples):
+        weights = rng.poisson(1.0, size=len(codes)).astype(np.float64)
+        for phase, (valid, sq_err, bias, totalvar) in values.items():
+            w = weights * valid
+            n = np.bincount(codes, weights=w, minlength=n_groups)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                results[f"{phase}_rmse"][i] = np.sqrt(
+                    np.bincount(codes, weights=w * sq_err, minlength=n_groups) / n
+                )
+                results[f"{phase}_bias"][i] = (
+                    np.bincount(codes, weights=w * bias, minlength=n_groups) / n
+                )
+                results[f"{phase}_totalspread"][i] = np.sqrt(
+                    np.bincount(codes, weights=w * totalvar, minlength=n_groups) / n
+                )
+    return results
+
+
+def bootstrap_statistics(
+    df,
+    by=("type",),
+    n_resamples=1000,
+    confidence=0.95,
+    workers=None,
+    seed=None,
+    **kwargs,
+):
+    """
+    Calculate bootstrap confidence intervals for the statistics (RMSE, bias, total spread).
+
+    The groups are the same as for :func:`binned_statistics`. Confidence intervals are
+    estimated with a Poisson bootstrap: each resample gives every observation a random
+    Poisson(1) weight, and the weighted statistics for all groups are aggregated with
+    ``np.bincount``. The resamples are computed in chunks over a process pool, and the
+    result for a given seed does not depend on the number of workers.
+
+    This function assumes that diagnostic statistics have already been computed with
+    :func:`diag_stats` and are present in the DataFrame. The statistics are calculated for
+    all phases ('prior' and 'posterior') present. NaNs are ignored.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing diagnostic statistics for observations.
+        by (list of str, optional): Columns to group by category. Default is ('type',).
+        n_resamples (int, optional): The number of bootstrap resamples. Default is 1000.
+        confidence (float, optional): The confidence level of the intervals. Default is 0.95.
+        workers (int, optional): The number of worker processes. Default is the number of CPUs.
+            If 1, the resamples are computed in the calling process.
+        seed (int, optional): Seed for the random number generator.
+        **kwargs: Binning options passed to :func:`bin_observations`: levels, verticalUnit,
+            time_value, lat_bins, lon_bins, resolution, equal_area, time_range.
+
+    Returns:
+        pandas.DataFrame: The output of :func:`binned_statistics` with additional columns
+        '{phase}_{stat}_lower' and '{phase}_{stat}_upper' for the confidence interval of
+        each statistic.
+
+    Examples:
+
+        .. code-block:: python
+
+            diag_stats(obs_seq.df)
+            used = select_used_qcs(obs_seq.df)
+            ci = bootstrap_statistics(used, levels=levels, n_resamples=2000, seed=42)
+    """
+    codes, keys = bin_observations(df, by=by, **kwargs)
+    result = _finalize_sums(_binned_sums(df, codes, keys))
+
+    in_group = codes >= 0
+    group_codes = codes[in_group]
+    values = {}
+    for phase in ["prior", "posterior"]:
+        if f"{phase}_sq_err" not in df.columns:
+            continue
+        arrays = [
+            df[f"{phase}_{stat}"].to_numpy(dtype=np.float64)[in_group]
+            for stat in ["sq_err", "bias", "totalvar"]
+        ]
+        valid = ~np.isnan(arrays[0]) & ~np.isnan(arrays[1]) & ~np.isnan(arrays[2])
+        values[phase] = [valid.astype(np.float64)] + [np.nan_to_num(a) for a in arrays]
+
+    # Fixed size chunks with their own seeds, so the result does not depend on workers
+    chunk_size = 50
+    chunks = [
+        min(chunk_size, n_resamples - start)
+        for start in range(0, n_resamples, chunk_size)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    initargs = (group_codes, len(keys), values)
+
+    if workers == 1:
+        _init_bootstrap_worker(*initargs)
+        samples = [_bootstrap_chunk(n, s) for n, s in zip(chunks, seeds)]
+        _bootstrap_data.clear()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_bootstrap_worker,
+            initargs=initargs,
+        ) as executor:
+            samples = list(executor.map(_bootstrap_chunk, chunks, seeds))
+
+    alpha = (1.0 - confidence) / 2.0
+    for column in samples[0]:
+        resampled = np.concatenate([sample[column] for sample in samples], axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)  # all-NaN groups
+            lower, upper = np.nanquantile(resampled, [alpha, 1.0 - alpha], axis=0)
+        result[f"{column}_lower"] = lower
+        result[f"{column}_upper"] = upper
+
+    return result
+
+
+def _observation_keys(df):
+    """
+    A uint64 key for the identity of each observation.
+
+    The key hashes the type, location, time and observation value. Repeated identical
+    observations are numbered in order of appearance and the number is mixed into the
+    key, so each key in a DataFrame is unique.
+    """
+    columns = [
+        column
+        for column in [
+            "type",
+            "longitude",
+            "latitude",
+            "vertical",
+            "location",
+            "time",
+            "observation",
+        ]
+        if column in df.columns
+    ]
+    hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    if pd.Index(hashes).is_unique:
+        return hashes
+
+    # occurrence number of each repeated hash, in order of appearance
+    occurrence = pd.Series(hashes).groupby(hashes, sort=False).cumcount()
+    return hashes ^ (
+        occurrence.to_numpy(dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    )
+
+
+def align_observations(control, experiment):
+    """
+    Match observations in two DataFrames by observation identity.
+
+    Observations are the same if they have the same type, location, time and observation
+    value. The matching is done with a hash of the identity columns and a hash table
+    lookup, rather than a merge of all the columns. Repeated identical observations are
+    matched in order of appearance.
+
+    Args:
+        control (pandas.DataFrame): The control observation sequence DataFrame.
+        experiment (pandas.DataFrame): The experiment observation sequence DataFrame.
+
+    Returns:
+        tuple: A tuple containing two elements:
+         - control_rows (numpy.ndarray): Row positions in control of the matched observations.
+         - experiment_rows (numpy.ndarray): Row positions in experiment of the matched observations.
+
+    Raises:
+        ValueError: If the observation keys are not unique (a hash collision).
+    """
+    experiment_index = pd.Index(_observation_keys(experiment))
+    if not experiment_index.is_unique:
+        raise ValueError("Observation keys are not unique.")
+    matches = experiment_index.get_indexer(_observation_keys(control))
+    control_rows = np.flatnonzero(matches >= 0)
+    return control_rows, matches[control_rows]
+
+
+# Chebyshev fit of erfc, Numerical Recipes (2nd ed.) erfcc: relative error below 1.2e-7
+_ERFC_COEFFICIENTS = [
+    0.17087277,
+    -0.82215223,
+    1.48851587,
+    -1.13520398,
+    0.27886807,
+    -0.18628806,
+    0.09678418,
+    0.37409196,
+    1.00002368,
+    -1.26551223,
+]
+
+
+def _two_sided_pvalue(t):
+    """
+    Two-sided p-value of test statistics using the normal approximation, erfc(|t| / sqrt(2)).
+
+    erfc is evaluated for all the statistics at once with the Chebyshev fit in
+    _ERFC_COEFFICIENTS. NaN statistics give NaN p-values.
+    """
+    z = np.abs(np.asarray(t, dtype=np.float64)) / np.sqrt(2.0)
+    u = 1.0 / (1.0 + 0.5 * z)
+    return u * np.exp(-z * z + np.polyval(_ERFC_COEFFICIENTS, u))
+
+
+def paired_statistics(control, experiments, by=("type",), **kwargs):
+    """
+    Compare experiments against a control with paired statistics on matched observations.
+
+    Observations are matched with :func:`align_observations`. For the matched observations,
+    grouped with :func:`bin_observations` using the control values, this function computes
+    the RMSE and bias of the control and each experiment, their differences (experiment minus
+    control), and a paired significance test of each difference. The tests are paired t-tests
+    on the per-observation differences in squared error and bias, with p-values from the
+    normal approximation, which is appropriate for the large number of observations per group.
+
+    This function assumes that diagnostic statistics have already been computed with
+    :func:`diag_stats` for all the DataFrames. The statistics are calculated for all phases
+    ('prior' and 'posterior') present in both control and experiment. Pairs where either
+    value is NaN are ignored.
+
+    Args:
+        control (pandas.DataFrame): The control observation sequence DataFrame.
+        experiments (pandas.DataFrame or dict): An experiment DataFrame, or a dictionary
+            of experiment name: DataFrame to compare against the control.
+        by (list of str, optional): Columns to group by category. Default is ('type',).
+        **kwargs: Binning options passed to :func:`bin_observations`: levels, verticalUnit,
+            time_value, lat_bins, lon_bins, resolution, equal_area, time_range.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with columns:
+            - 'experiment': The experiment name (only if experiments is a dictionary).
+            - A column for each binning dimension.
+            - 'count': The number of matched observations in the group.
+            - '{phase}_rmse_control', '{phase}_rmse_experiment', '{phase}_rmse_diff'
+            - '{phase}_sq_err_pvalue': p-value of the paired difference in squared error.
+            - '{phase}_bias_control', '{phase}_bias_experiment', '{phase}_bias_diff'
+            - '{phase}_bias_pvalue': p-value of the paired difference in bias.
+
+    Examples:
+
+        .. code-block:: python
+
+            control = ObsSequence("control/obs_seq.final")
+            experiment = ObsSequence("experiment/obs_seq.final")
+            diag_stats(control.df)
+            diag_stats(experiment.df)
+            result = paired_statistics(control.df, experiment.df, levels=levels)
+    """
+    if isinstance(experiments, pd.DataFrame):
+        return _paired_statistics(control, experiments, by, **kwargs)
+
+    results = []
+    for name, experiment in experiments.items():
+        result = _paired_statistics(control, experiment, by, **kwargs)
+        result.insert(0, "experiment", name)
+        results.append(result)
+    return pd.concat(results, ignore_index=True)
+
+
+def _paired_statistics(control, experiment, by, **kwargs):
+    """Paired statistics for a single experiment, see :func:`paired_statistics`."""
+    control_rows, experiment_rows = align_observations(control, experiment)
+    matched = control.iloc[control_rows]
+    codes, keys = bin_observations(matched, by=by, **kwargs)
+    n_groups = len(keys)
+
+    result = keys.copy()
+    result["count"] = np.bincount(codes[codes >= 0], minlength=n_groups)
+    for phase in ["prior", "posterior"]:
+        if (
+            f"{phase}_sq_err" not in control.columns
+            or f"{phase}_sq_err" not in experiment.columns
+        ):
+            continue
+        for stat in ["sq_err", "bias"]:
+            values_control = matched[f"{phase}_{stat}"].to_numpy(dtype=np.float64)
+            values_experiment = experiment[f"{phase}_{stat}"].to_numpy(
+                dtype=np.float64
+            )[experiment_rows]
+            difference = values_experiment - values_control  # NaN if either is NaN
+            valid_codes = np.where(np.isnan(difference), -1, codes)
+
+            sum_control, n = _group_sum_count(valid_codes, n_groups, values_control)
+            sum_experiment, _ = _group_sum_count(
+                valid_codes, n_groups, values_experiment
+            )
+            sum_diff, _ = _group_sum_count(valid_codes, n_groups, difference)
+            sum_diff_sq, _ = _group_sum_count(valid_codes, n_groups, difference**2)
+
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean_control = sum_control / n
+                mean_experiment = sum_experiment / n
+                mean_diff = sum_diff / n
+                var_diff = (sum_diff_sq - n * mean_diff**2) / (n - 1)
+                t = mean_diff / np.sqrt(var_diff / n)
+
+            if stat == "sq_err":
+                rmse_control = np.sqrt(mean_control)
+                rmse_experiment = np.sqrt(mean_experiment)
+                result[f"{phase}_rmse_control"] = rmse_control
+                result[f"{phase}_rmse_experiment"] = rmse_experiment
+                result[f"{phase}_rmse_diff"] = rmse_experiment - rmse_control
+            else:
+                result[f"{phase}_bias_control"] = mean_control
+                result[f"{phase}_bias_experiment"] = mean_experiment
+                result[f"{phase}_bias_diff"] = mean_diff
+            result[f"{phase}_{stat}_pvalue"] = _two_sided_pvalue(t)
+
+    return result
+
+
+def desroziers_statistics(df, by=("type",), **kwargs):
+    """
+    Calculate Desroziers et al. (2005) observation-space consistency diagnostics.
+
+    With the innovation d_ob = y - H(x_b) (observation minus prior ensemble mean) and
+    the residual d_oa = y - H(x_a) (observation minus posterior ensemble mean), for a
+    well tuned assimilation:
+
+    - E[d_oa d_ob] estimates the observation error variance,
+    - E[(H(x_a) - H(x_b)) d_ob] estimates the background error variance in observation space, HBH^T,
+    - E[d_ob d_ob] estimates their sum.
+
+    The estimates are compared with the mean assigned observation error variance
+    (obs_err_var) and the mean prior ensemble variance. A ratio above 1 means the assigned
+    value is too small. The groups are the same as for :func:`binned_statistics`, so the
+    diagnostics can be calculated per type, vertical layer, time bin and latitude/longitude
+    region in a single pass with ``np.bincount``. Observations with a missing prior or
+    posterior (e.g. DART QC 2) are ignored.
+
+    Args:
+        df (pandas.DataFrame): The input DataFrame containing observation data. The DataFrame
+            must include 'observation', 'obs_err_var', 'prior_ensemble_mean',
+            'prior_ensemble_spread' and 'posterior_ensemble_mean'.
+        by (list of str, optional): Columns to group by category. Default is ('type',).
+        **kwargs: Binning options passed to :func:`bin_observations`: levels, verticalUnit,
+            time_value, lat_bins, lon_bins, resolution, equal_area, time_range.
+
+    Returns:
+        pandas.DataFrame: A DataFrame with a column for each binning dimension and columns:
+            - 'count': The number of observations used.
+            - 'omb_mean': The mean innovation, observation minus prior mean.
+            - 'oma_mean': The mean residual, observation minus posterior mean.
+            - 'assigned_obs_err_var': The mean assigned observation error variance.
+            - 'estimated_obs_err_var': The estimated observation error variance, E[d_oa d_ob].
+            - 'obs_err_var_ratio': estimated_obs_err_var / assigned_obs_err_var.
+            - 'estimated_obs_err_sd': The square root of estimated_obs_err_var (NaN if negative).
+            - 'prior_spread_var': The mean prior ensemble variance.
+            - 'estimated_background_var': The estimated HBH^T, E[(H(x_a) - H(x_b)) d_ob].
+            - 'background_var_ratio': estimated_background_var / prior_spread_var.
+            - 'estimated_total_var': E[d_ob d_ob].
+
+    Raises:
+        ValueError: If a required column is missing.
+
+    Examples:
+
+        .. code-block:: python
+
+            used = obs_seq.df[obs_seq.df["DART_quality_control"] == 0]
+            tuning = desroziers_statistics(
+                used, levels=levels, lat_bins=[-90, -20, 20, 90]
+            )
+    """
+    required = [
+        "observation",
+        "obs_err_var",
+        "prior_ensemble_mean",
+        "prior_ensemble_spread",
+        "posterior_ensemble_mean",
+    ]
+    missing = [column for column in required if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}")
+
+    codes, keys = bin_observations(df, by=by, **kwargs)
+    obs = df["observation"].to_numpy(dtype=np.float64)
+    prior = df["prior_ensemble_mean"].to_numpy(dtype=np.float64)
+    posterior = df["posterior_ensemble_mean"].to_numpy(dtype=np.float64)
+    omb = obs - prior
+    oma = obs - posterior
+    terms = {
+        "omb_mean": omb,
+        "oma_mean": oma,
+        "assigned_obs_err_var": df["obs_err_var"].to_numpy(dtype=np.float64),
+        "estimated_obs_err_var": oma * omb,
+        "prior_spread_var": df["prior_ensemble_spread"].to_numpy(dtype=np.float64) ** 2,
+        "estimated_background_var": (posterior - prior) * omb,
+        "estimated_total_var": omb * omb,
+    }
+
+    # Only observations with every term present, so all estimates use the same sample
+    valid = codes >= 0
+    for values in terms.values():
+        valid &= ~np.isnan(values)
+    valid_codes = np.where(valid, codes, -1)
+
+    result = keys.copy()
+    n = None
+    for name, values in terms.items():
+        total, n = _group_sum_count(valid_codes, len(keys), values)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[name] = total / n
+    result.insert(len(keys.columns), "count", n)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result["obs_err_var_ratio"] = (
+            result["estimated_obs_err_var"] / result["assigned_obs_err_var"]
+        )
+        result["estimated_obs_err_sd"] = np.sqrt(
+            result["estimated_obs_err_var"].where(result["estimated_obs_err_var"] >= 0)
+        )
+        result["background_var_ratio"] = (
+            result["estimated_background_var"] / result["prior_spread_var"]
+        )
+
+    columns = list(keys.columns) + [
+        "count",
+        "omb_mean",
+        "oma_mean",
+        "assigned_obs_err_var",
+        "estimated_obs_err_var",
+        "obs_err_var_ratio",
+        "estimated_obs_err_sd",
+        "prior_spread_var",
+        "estimated_background_var",
+        "background_var_ratio",
+        "estimated_total_var",
+    ]
+    return result[columns]
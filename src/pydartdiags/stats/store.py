@@ -0,0 +1,296 @@
+# SPDX-License-Identifier: Apache-2.0
+"""
+Incremental, cycle-by-cycle statistics store.
+
+A :class:`StatsStore` keeps partial aggregates (sums and counts) of the diagnostic
+statistics for each cycle, observation type, vertical level and region. Each new
+observation sequence is reduced to its partial aggregates and appended to the store,
+so time series of the statistics across all cycles can be produced without reading
+the earlier observation sequence files again.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+from pydartdiags.stats import stats
+from pydartdiags.obs_sequence import obs_sequence as obsq
+
+
+class StatsStore:
+    """
+    A store of partial aggregates of the diagnostic statistics, keyed by cycle, type,
+    vertical level and region.
+
+    The store can be kept in memory (path=None) or persisted to a directory. A persisted
+    store holds its configuration in 'config.json' and its aggregates in 'aggregates.csv';
+    each cycle added is appended to 'aggregates.csv', which is rewritten instead if the
+    cycle has different columns, e.g. no posterior statistics.
+
+    Args:
+        path (str, optional): Directory for the persistent store. Created if it does not
+            exist. If None, the store is kept in memory only.
+        levels (list, optional): Vertical bin edges. If None, observations are not binned
+            by vertical level.
+        verticalUnit (str, optional): The unit of the vertical levels. Default is 'pressure (Pa)'.
+        regions (dict, optional): Regions to aggregate over, name: (lat_min, lat_max, lon_min, lon_max)
+            in degrees, with longitude in [0, 360]. Regions may overlap.
+            Default is {'global': (-90, 90, 0, 360)}.
+
+    Raises:
+        ValueError: If the store at path was created with a different configuration.
+
+    Examples:
+
+        .. code-block:: python
+
+            store = StatsStore("stats_store", levels=levels)
+            store.add("obs_seq.final.2019120100", cycle="2019-12-01 00:00")
+            store.add("obs_seq.final.2019120106", cycle="2019-12-01 06:00")
+            rmse = store.time_statistics(type="RADIOSONDE_TEMPERATURE")
+    """
+
+    key_columns = ["cycle", "region", "type", "midpoint"]
+    date_format = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(
+        self, path=None, levels=None, verticalUnit="pressure (Pa)", regions=None
+    ):
+        config = {
+            "levels": None if levels is None else [float(x) for x in levels],
+            "verticalUnit": verticalUnit,
+            "regions": {
+                name: [float(x) for x in bounds]
+                for name, bounds in (regions or {"global": (-90, 90, 0, 360)}).items()
+            },
+        }
+        self.path = path
+        self.aggregates = pd.DataFrame()
+
+        if path is not None:
+            config_file = os.path.join(path, "config.json")
+            if os.path.exists(config_file):
+                with open(config_file, "r") as f:
+                    stored_config = json.load(f)
+                if (levels is not None or regions is not None) and (
+                    stored_config != config
+                ):
+                    raise ValueError(
+                        f"The store at {path} was created with a different configuration."
+                    )
+                config = stored_config
+                self.aggregates = self._read_aggregates()
+            else:
+                os.makedirs(path, exist_ok=True)
+                with open(config_file, "w") as f:
+                    json.dump(config, f, indent=2)
+
+        self.levels = config["levels"]
+        self.verticalUnit = config["verticalUnit"]
+        self.regions = config["regions"]
+
+    @property
+    def _aggregates_file(self):
+        return os.path.join(self.path, "aggregates.csv")
+
+    def _read_aggregates(self):
+        """Read the aggregates from the persistent store."""
+        if not os.path.exists(self._aggregates_file):
+            return pd.DataFrame()
+        return pd.read_csv(
+            self._aggregates_file, parse_dates=["cycle"], dtype={"type": str}
+        )
+
+    def cycles(self):
+        """
+        The cycles in the store.
+
+        Returns:
+            list: The cycle times, in time order.
+        """
+        if self.aggregates.empty:
+            return []
+        return sorted(pd.to_datetime(self.aggregates["cycle"].unique()))
+
+    def add(self, obs_seq, cycle=None):
+        """
+        Add the partial aggregates of an observation sequence to the store.
+
+        Statistics are aggregated over the used observations (DART QC 0 or 2), and
+        possible vs. used counts over all observations in the bins of the store. With
+        levels, observations outside the levels or with a different vertical unit are in no
+        bin, so they are not counted. If the cycle is already in the store it is replaced.
+        The observation sequence is not modified.
+
+        Args:
+            obs_seq (ObsSequence or str): The observation sequence, or an obs_seq file name.
+            cycle (datetime-like, optional): The cycle time. Default is the midpoint of the
+                observation times.
+
+        Returns:
+            pandas.DataFrame: The partial aggregates added for this cycle.
+        """
+        if not isinstance(obs_seq, obsq.ObsSequence):
+            obs_seq = obsq.ObsSequence(obs_seq)
+        df = obs_seq.df
+
+        if cycle is None:
+            cycle = df["time"].min() + (df["time"].max() - df["time"].min()) / 2
+        cycle = pd.Timestamp(cycle)
+
+        new = self.partial_aggregates(df)
+        new.insert(0, "cycle", cycle)
+        self._set_cycle(cycle, new)
+        return new
+
+    def accumulate(self, obs_seq, cycle):
+        """
+        Add the partial aggregates of more observations to a cycle.
+
+        Unlike :meth:`add`, the aggregates are added to those already in the store for the
+        cycle, so a cycle can be built up from observations as they are produced, e.g. by
+        :class:`pydartdiags.obs_sequence.follow.Follower`.
+
+        Args:
+            obs_seq (ObsSequence or pandas.DataFrame): The new observations.
+            cycle (datetime-like): The cycle time.
+
+        Returns:
+            pandas.DataFrame: The partial aggregates of the cycle, including the new observations.
+        """
+        df = obs_seq.df if isinstance(obs_seq, obsq.ObsSequence) else obs_seq
+        cycle = pd.Timestamp(cycle)
+
+        new = self.partial_aggregates(df)
+        new.insert(0, "cycle", cycle)
+        if cycle in set(self.cycles()):
+            keys = [c for c in self.key_columns if c in new.columns]
+            previous = self.aggregates[self.aggregates["cycle"] == cycle]
+            new = (
+                pd.concat([previous, new], ignore_index=True)
+                .groupby(keys, sort=True, dropna=False)
+                .sum(numeric_only=True)
+                .reset_index()
+            )
+        self._set_cycle(cycle, new)
+        return new
+
+    def _set_cycle(self, cycle, new):
+        """Replace or add the aggregates of a cycle, in memory and in the persistent store."""
+        replace = cycle in set(self.cycles())
+        header = self.aggregates.columns
+        if replace:
+            self.aggregates = self.aggregates[self.aggregates["cycle"] != cycle]
+        self.aggregates = pd.concat([self.aggregates, new], ignore_index=True)
+
+        if self.path is not None:
+            # a cycle with other columns, e.g. without posterior statistics, changes the
+            # header, so the whole file is rewritten
+            if replace or set(new.columns) != set(header):
+                self.aggregates.to_csv(
+                    self._aggregates_file, index=False, date_format=self.date_format
+                )
+            else:
+                new[header].to_csv(
+                    self._aggregates_file,
+                    mode="a",
+                    header=not os.path.exists(self._aggregates_file),
+                    index=False,
+                    date_format=self.date_format,
+                )
+
+    def partial_aggregates(self, df):
+        """
+        Reduce a DataFrame of observations to partial aggregates for each region, type and level.
+
+        The diagnostic statistics are calculated on a shallow copy, so df is not modified.
+        Observations outside the regions, and with levels, outside the levels or with a
+        different vertical unit, are not counted.
+
+        Args:
+            df (pandas.DataFrame): The observation sequence DataFrame.
+
+        Returns:
+            pandas.DataFrame: A DataFrame with columns 'region', 'type', 'midpoint' (if binned
+            by level), 'possible', 'used', and the sums and counts of the diagnostic statistics
+            for the used observations.
+        """
+        df = df.copy(deep=False)
+        stats.diag_stats(df)
+        used = (df["DART_quality_control"] == 0) | (df["DART_quality_control"] == 2)
+        lat = df["latitude"].to_numpy()
+        lon = df["longitude"].to_numpy()
+
+        kwargs = {}
+        if self.levels is not None:
+            kwargs = {"levels": self.levels, "verticalUnit": self.verticalUnit}
+
+        results = []
+        for name, (lat_min, lat_max, lon_min, lon_max) in self.regions.items():
+            in_region = (
+                (lat >= lat_min)
+                & (lat <= lat_max)
+                & (lon >= lon_min)
+                & (lon <= lon_max)
+            )
+            region_df = df[in_region]
+            codes, keys = stats.bin_observations(region_df, by=["type"], **kwargs)
+
+            used_codes = np.where(used[in_region].to_numpy(), codes, -1)
+            sums = stats._binned_sums(region_df, used_codes, keys)
+            sums = sums.rename(columns={"count": "used"})
+            sums.insert(
+                len(keys.columns),
+                "possible",
+                np.bincount(codes[codes >= 0], minlength=len(keys)),
+            )
+            sums.insert(0, "region", name)
+            results.append(sums)
+
+        return pd.concat(results, ignore_index=True)
+
+    def _select(self, type=None, region=None):
+        """Select the aggregates for a type and/or region."""
+        selected = self.aggregates
+        if type is not None:
+            selected = selected[selected["type"] == type]
+        if region is not None:
+            selected = selected[selected["region"] == region]
+        return selected
+
+    def time_statistics(self, type=None, region=None):
+        """
+        Time series of the statistics (RMSE, bias, total spread) across all cycles in the store.
+
+        Equivalent to :func:`stats.time_statistics` with one time bin per cycle.
+
+        Args:
+            type (str, optional): Only return this observation type.
+            region (str, optional): Only return this region.
+
+        Returns:
+            pandas.DataFrame: A DataFrame with columns 'cycle', 'region', 'type', 'midpoint'
+            (if binned by level), '{phase}_rmse', '{phase}_bias' and '{phase}_totalspread'.
+        """
+        selected = self._select(type, region)
+        keys = [c for c in self.key_columns if c in selected.columns]
+        summed = selected.groupby(keys, sort=True).sum(numeric_only=True).reset_index()
+        return stats._finalize_sums(summed.drop(columns=["possible", "used"]))
+
+    def possible_vs_used(self, type=None, region=None):
+        """
+        Time series of the count of possible vs. used observations across all cycles in the store.
+
+        Args:
+            type (str, optional): Only return this observation type.
+            region (str, optional): Only return this region.
+
+        Returns:
+            pandas.DataFrame: A DataFrame with columns 'cycle', 'region', 'type', 'midpoint'
+            (if binned by level), 'possible' and 'used'.
+        """
+        selected = self._select(type, region)
+        keys = [c for c in self.key_columns if c in selected.columns]
+        return (
+            selected.groupby(keys, sort=True)[["possible", "used"]].sum().reset_index()
+        )
@@ -0,0 +1,223 @@
+# SPDX-License-Identifier: Apache-2.0
+import datetime as dt
+import json
+import os
+import shutil
+import struct
+import pandas as pd
+import pytest
+from pydartdiags.obs_sequence import obs_sequence as obsq
+from pydartdiags.obs_sequence import catalog
+from pydartdiags.obs_sequence import compression
+
+test_dir = os.path.dirname(__file__)
+
+
+def data_file(name):
+    return os.path.join(test_dir, "data", name)
+
+
+class TestScanFile:
+
+    @pytest.mark.parametrize(
+        "name",
+        [
+            "obs_seq.final.ascii.small",
+            "obs_seq.final.binary.small",
+            "obs_seq.1d.final",
+            "obs_seq.final.wrfhydro",
+            "obs_seq.final.ascii.small.more-types",
+        ],
+    )
+    def test_matches_obs_sequence(self, name):
+        obs_seq = obsq.ObsSequence(data_file(name))
+        entry = catalog.scan_file(data_file(name))
+        assert entry["num_obs"] == len(obs_seq.df)
+        assert entry["loc_mod"] == obs_seq.loc_mod
+        assert entry["copies"] == obs_seq.non_qc_copie_names
+        assert entry["qc_copies"] == obs_seq.qc_copie_names
+        assert entry["types"] == sorted(obs_seq.types.values())
+        assert pd.Timestamp(entry["first_time"]) == obs_seq.df["time"].min()
+        assert pd.Timestamp(entry["last_time"]) == obs_seq.df["time"].max()
+        assert entry["type_counts"] is None
+
+    def test_binary_format(self):
+        assert (
+            catalog.scan_file(data_file("obs_seq.final.binary.small"))["format"]
+            == "binary"
+        )
+        assert (
+            catalog.scan_file(data_file("obs_seq.final.ascii.small"))["format"]
+            == "ascii"
+        )
+
+    def test_count_types(self):
+        name = "obs_seq.final.ascii.small.more-types"
+        obs_seq = obsq.ObsSequence(data_file(name))
+        entry = catalog.scan_file(data_file(name), count_types=True)
+        assert entry["type_counts"] == obs_seq.df["type"].value_counts().to_dict()
+        assert len(entry["types"]) > len(entry["type_counts"])
+
+    @pytest.mark.parametrize(
+        "name", ["obs_seq.final.ascii.small", "obs_seq.final.binary.small"]
+    )
+    def test_compressed(self, tmpdir, name):
+        file = os.path.join(tmpdir, name + ".gz")
+        with open(data_file(name), "rb") as f:
+            content = f.read()
+        with compression.open_file(file, "wb") as f:
+            f.write(content)
+        assert catalog.scan_file(file) == catalog.scan_file(data_file(name))
+
+    def test_out_of_order_file_is_read(self, tmpdir):
+        # the first record is not the head of the linked list
+        with open(data_file("obs_seq.final.ascii.small")) as f:
+            text = f.read()
+        text = text.replace("first:            1", "first:            2", 1)
+        file = os.path.join(tmpdir, "obs_seq.reordered")
+        with open(file, "w") as f:
+            f.write(text)
+        entry = catalog.scan_file(file)
+        assert entry["first_time"] == "2019-12-01T21:00:03"
+        assert entry["last_time"] == "2019-12-01T21:00:07"
+
+    def test_binary_loc1d(self, tmpdir):
+        # the loc3d binary file with each 28 byte location record replaced by one real
+        name = "obs_seq.final.binary.small"
+        obs_seq = obsq.ObsSequence(data_file(name))
+        n_header = len(obsq.ObsSequence._read_binary_header(data_file(name))) - 1
+        records = []
+        with open(data_file(name), "rb") as f:
+            while f.read(4):
+                f.seek(-4, os.SEEK_CUR)
+                records.append(catalog._read_record(f))
+        location = n_header + obs_seq.n_copies + 1
+        step = (len(records) - n_header) // len(obs_seq.df)
+        for i in range(location, len(records), step):
+            assert len(records[i]) == 28
+            records[i] = records[i][:8]
+        file = os.path.join(tmpdir, "obs_seq.1d.binary")
+        with open(file, "wb") as f:
+            for record in records:
+                length = struct.pack("i", len(record))
+                f.write(length + record + length)
+
+        entry = catalog.scan_file(file)
+        assert entry["loc_mod"] == "loc1d"
+        # loc1d times are seconds and days after 2000-01-01, as in ObsSequence
+        times = [
+            dt.datetime(2000, 1, 1) + dt.timedelta(days=int(days), seconds=int(seconds))
+            for seconds, days in zip(obs_seq.df["seconds"], obs_seq.df["days"])
+        ]
+        assert entry["first_time"] == min(times).isoformat()
+        assert entry["last_time"] == max(times).isoformat()
+
+
+class TestCatalog:
+
+    @pytest.fixture
+    def root(self, tmpdir):
+        # three days of files, in a directory per day
+        for day in range(3):
+            obs_seq = obsq.ObsSequence(data_file("obs_seq.final.ascii.small"))
+            obs_seq.df["days"] += day
+            obs_seq.df["time"] += pd.Timedelta(days=day)
+            directory = os.path.join(tmpdir, f"day{day}")
+            os.makedirs(directory)
+            obs_seq.write_obs_seq(os.path.join(directory, f"obs_seq.final.{day}"))
+        shutil.copy(
+            data_file("obs_seq.final.ascii.small.not-so-many-types"),
+            os.path.join(tmpdir, "day0", "obs_seq.final.types"),
+        )
+        shutil.copy(data_file("composite_acars.yaml"), tmpdir)
+        return str(tmpdir)
+
+    def test_scan(self, root):
+        cat = catalog.Catalog(root)
+        assert list(cat.df["file"]) == [
+            os.path.join(root, "day0", "obs_seq.final.0"),
+            os.path.join(root, "day0", "obs_seq.final.types"),
+            os.path.join(root, "day1", "obs_seq.final.1"),
+            os.path.join(root, "day2", "obs_seq.final.2"),
+        ]
+        assert list(cat.df["num_obs"]) == [10, 3, 10, 10]
+        assert cat.df["first_time"].iloc[2] == pd.Timestamp("2019-12-02 21:00:03")
+        assert os.path.exists(os.path.join(root, ".obs_seq_catalog.json"))
+
+    def test_files_by_time(self, root):
+        cat = catalog.Catalog(root)
+        assert cat.files(start="2019-12-02", end="2019-12-03") == [
+            os.path.join(root, "day1", "obs_seq.final.1")
+        ]
+        # the window is half open
+        assert cat.files(end="2019-12-02 21:00:03") == [
+            os.path.join(root, "day0", "obs_seq.final.0"),
+            os.path.join(root, "day0", "obs_seq.final.types"),
+        ]
+        assert len(cat.files()) == 4
+
+    def test_files_by_type(self, root):
+        cat = catalog.Catalog(root)
+        assert cat.files(types="ACARS_TEMPERATURE") == [
+            os.path.join(root, f"day{day}", f"obs_seq.final.{day}") for day in range(3)
+        ]
+        assert cat.files(types=["AIRCRAFT_TEMPERATURE", "ACARS_TEMPERATURE"]) == list(
+            cat.df["file"]
+        )
+        assert cat.files(types="RADIOSONDE_TEMPERATURE") == []
+
+    def test_files_by_type_counts(self, root):
+        cat = catalog.Catalog(root, count_types=True)
+        types = cat.df["type_counts"].iloc[1]
+        assert sum(types.values()) == 3
+        for type in cat.entries["day0/obs_seq.final.types"]["types"]:
+            files = cat.files(types=type)
+            assert (os.path.join(root, "day0", "obs_seq.final.types") in files) == (
+                type in types
+            )
+
+    def test_incremental_update(self, root):
+        cat = catalog.Catalog(root)
+        assert cat.update() == []
+
+        # a new file, a changed file and a deleted file
+        obs_seq = obsq.ObsSequence(os.path.join(root, "day2", "obs_seq.final.2"))
+        obs_seq.df["days"] += 1
+        obs_seq.df["time"] += pd.Timedelta(days=1)
+        os.makedirs(os.path.join(root, "day3"))
+        obs_seq.write_obs_seq(os.path.join(root, "day3", "obs_seq.final.3"))
+        shutil.copy(
+            data_file("obs_seq.final.binary.small"),
+            os.path.join(root, "day1", "obs_seq.final.1"),
+        )
+        os.remove(os.path.join(root, "day0", "obs_seq.final.types"))
+
+        assert sorted(cat.update()) == ["day1/obs_seq.final.1", "day3/obs_seq.final.3"]
+        assert len(cat.df) == 4
+        assert cat.entries["day1/obs_seq.final.1"]["format"] == "binary"
+        assert cat.files(start="2019-12-04") == [
+            os.path.join(root, "day3", "obs_seq.final.3")
+        ]
+
+    def test_index_is_reused(self, root):
+        catalog.Catalog(root)
+        index = os.path.join(root, ".obs_seq_catalog.json")
+        with open(index) as f:
+            saved = json.load(f)
+        assert saved["version"] == 1
+        assert len(saved["files"]) == 4
+
+        cat = catalog.Catalog(root)
+        assert cat.update() == []
+        assert cat.entries == saved["files"]
+
+    def test_index_location_and_pattern(self, root, tmpdir_factory):
+        index = os.path.join(str(tmpdir_factory.mktemp("index")), "catalog.json")
+        cat = catalog.Catalog(root, pattern="obs_seq.final.[0-9]", index=index)
+        assert len(cat.df) == 3
+        assert os.path.exists(index)
+        assert not os.path.exists(os.path.join(root, ".obs_seq_catalog.json"))
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,126 @@
+# SPDX-License-Identifier: Apache-2.0
+import gzip
+import lzma
+import os
+import pandas as pd
+import pytest
+from pydartdiags.obs_sequence import obs_sequence as obsq
+from pydartdiags.obs_sequence import compression
+
+test_dir = os.path.dirname(__file__)
+
+# the first bytes of a gzip, xz and Zstandard file
+MAGIC = {".gz": b"\x1f\x8b", ".xz": b"\xfd7zXZ", ".zst": b"\x28\xb5\x2f\xfd"}
+
+
+def data_file(name):
+    return os.path.join(test_dir, "data", name)
+
+
+@pytest.fixture(params=[".gz", ".xz", ".zst"])
+def suffix(request):
+    if request.param == ".zst":
+        pytest.importorskip("zstandard")
+    return request.param
+
+
+def compress(source, file):
+    with open(source, "rb") as f:
+        content = f.read()
+    with compression.open_file(file, "wb") as f:
+        f.write(content)
+    return content
+
+
+class TestOpenFile:
+
+    def test_codec(self):
+        assert compression.codec("obs_seq.final.gz") == "gzip"
+        assert compression.codec("obs_seq.final.XZ") == "xz"
+        assert compression.codec("obs_seq.final.zst") == "zstd"
+        assert compression.codec("obs_seq.final") is None
+        assert compression.codec("obs_seq.final.ascii.small") is None
+
+    def test_round_trip(self, tmpdir, suffix):
+        file = os.path.join(tmpdir, "obs_seq.final" + suffix)
+        content = compress(data_file("obs_seq.final.binary.small"), file)
+        with open(file, "rb") as f:
+            assert f.read(len(MAGIC[suffix])) == MAGIC[suffix]
+        with compression.open_file(file, "rb") as f:
+            assert f.read() == content
+
+    def test_text(self, tmpdir, suffix):
+        file = os.path.join(tmpdir, "obs_seq.final" + suffix)
+        with compression.open_file(file, "w") as f:
+            f.write(" obs_sequence\nobs_type_definitions\n")
+        with compression.open_file(file) as f:
+            assert list(f) == [" obs_sequence\n", "obs_type_definitions\n"]
+
+    def test_empty_file(self, tmpdir, suffix):
+        file = os.path.join(tmpdir, "obs_seq.final" + suffix)
+        with compression.open_file(file, "wb"):
+            pass
+        with compression.open_file(file, "rb") as f:
+            assert f.read() == b""
+
+    @pytest.mark.parametrize("suffix, open_", [(".gz", gzip.open), (".xz", lzma.open)])
+    def test_parallel_blocks(self, tmpdir, monkeypatch, suffix, open_):
+        # blocks compressed in parallel are read back as one file by gzip and lzma
+        monkeypatch.setattr(compression, "_BLOCK_SIZE", 1000)
+        file = os.path.join(tmpdir, "obs_seq.final" + suffix)
+        with open(data_file("obs_seq.final.ascii.small"), "rb") as f:
+            content = f.read()
+        with compression.open_file(file, "wb", threads=4) as f:
+            for start in range(0, len(content), 300):
+                f.write(content[start : start + 300])
+        with open_(file, "rb") as f:
+            assert f.read() == content
+
+    def test_uncompressed(self, tmpdir):
+        file = os.path.join(tmpdir, "obs_seq.final")
+        with compression.open_file(file, "w") as f:
+            f.write("obs_sequence\n")
+        with open(file) as f:
+            assert f.read() == "obs_sequence\n"
+
+    def test_invalid_mode(self, tmpdir):
+        with pytest.raises(ValueError, match="can only be read or written"):
+            compression.open_file(os.path.join(tmpdir, "obs_seq.final.gz"), "a")
+
+
+class TestCompressedObsSequence:
+
+    @pytest.mark.parametrize(
+        "name",
+        [
+            "obs_seq.final.ascii.small",
+            "obs_seq.final.binary.small",
+            "obs_seq.1d.final",
+            "obs_seq.final.post.small",
+        ],
+    )
+    def test_read(self, tmpdir, suffix, name):
+        file = os.path.join(tmpdir, name + suffix)
+        compress(data_file(name), file)
+        expected = obsq.ObsSequence(data_file(name))
+        obs_seq = obsq.ObsSequence(file)
+        assert obs_seq.header == expected.header
+        assert obs_seq.loc_mod == expected.loc_mod
+        pd.testing.assert_frame_equal(obs_seq.df, expected.df)
+
+    def test_write(self, tmpdir, suffix):
+        expected = obsq.ObsSequence(data_file("obs_seq.final.ascii.small"))
+        plain = os.path.join(tmpdir, "obs_seq.final")
+        file = os.path.join(tmpdir, "obs_seq.final" + suffix)
+        expected.write_obs_seq(plain)
+        expected.write_obs_seq(file)
+        with open(plain, "rb") as f:
+            content = f.read()
+        with compression.open_file(file, "rb") as f:
+            assert f.read() == content
+        assert os.path.getsize(file) < len(content)
+        pd.testing.assert_frame_equal(obsq.ObsSequence(file).df, expected.df)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,84 @@
+# SPDX-License-Identifier: Apache-2.0
+import os
+import pandas as pd
+import pytest
+from pydartdiags.obs_sequence import obs_sequence as obsq
+from pydartdiags.stats import stats
+
+dask = pytest.importorskip("dask")
+pytest.importorskip("dask.dataframe")
+from pydartdiags.obs_sequence import dask_backend  # noqa: E402
+
+
+class TestDaskBackend:
+    @pytest.fixture
+    def files(self, tmpdir):
+        # three cycles of the same observations, a day apart
+        test_dir = os.path.dirname(__file__)
+        files = []
+        for day in range(3):
+            obs_seq = obsq.ObsSequence(
+                os.path.join(test_dir, "data", "obs_seq.final.post.small")
+            )
+            obs_seq.df["days"] += day
+            obs_seq.df["time"] += pd.Timedelta(days=day)
+            obs_seq.df["observation"] += day
+            file = os.path.join(tmpdir, f"obs_seq.final.{day}")
+            obs_seq.write_obs_seq(file)
+            files.append(file)
+        return files
+
+    @pytest.fixture
+    def full_df(self, files):
+        return pd.concat(
+            [obsq.ObsSequence(file).df for file in files], ignore_index=True
+        )
+
+    def test_read_obs_seqs(self, files, full_df):
+        ddf = dask_backend.read_obs_seqs(files)
+        assert ddf.npartitions == 3
+        pd.testing.assert_frame_equal(ddf.compute().reset_index(drop=True), full_df)
+
+    def test_read_columns(self, files, full_df):
+        ddf = dask_backend.read_obs_seqs(files, columns=["type", "observation"])
+        result = ddf.compute().reset_index(drop=True)
+        pd.testing.assert_frame_equal(result, full_df[["type", "observation"]])
+
+    def test_read_no_files(self):
+        with pytest.raises(ValueError):
+            dask_backend.read_obs_seqs([])
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {},
+            {"levels": [0, 50000, 110000]},
+            {"time_value": "1D"},
+            {"time_value": "12h", "resolution": 90.0},
+        ],
+    )
+    def test_binned_statistics(self, files, full_df, kwargs, scheduler="threads"):
+        ddf = dask_backend.read_obs_seqs(files)
+        ddf = dask_backend.diag_stats(dask_backend.select_used_qcs(ddf))
+        with dask.config.set(scheduler=scheduler):
+            result = dask_backend.binned_statistics(ddf, by=["type"], **kwargs)
+
+        stats.diag_stats(full_df)
+        expected = stats.binned_statistics(
+            stats.select_used_qcs(full_df), by=["type"], **kwargs
+        )
+        pd.testing.assert_frame_equal(result, expected.reset_index(drop=True))
+
+    def test_binned_statistics_processes(self, files, full_df):
+        self.test_binned_statistics(
+            files, full_df, {"levels": [0, 50000, 110000]}, scheduler="processes"
+        )
+
+    def test_possible_vs_used(self, files, full_df):
+        ddf = dask_backend.read_obs_seqs(files)
+        with dask.config.set(scheduler="threads"):
+            result = dask_backend.possible_vs_used(ddf)
+
+        expected = obsq.ObsSequence(files[0]).possible_vs_used()
+        expected[["possible", "used"]] *= 3
+        pd.testing.assert_frame_equal(result, expected)
@@ -0,0 +1,125 @@
+# SPDX-License-Identifier: Apache-2.0
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from pydartdiags.obs_sequence import obs_sequence as obsq
+from pydartdiags.obs_sequence.follow import Follower
+from pydartdiags.stats.store import StatsStore
+
+
+def data_file(name):
+    return os.path.join(os.path.dirname(__file__), "data", name)
+
+
+class TestFollower:
+
+    @pytest.fixture
+    def source(self):
+        return data_file("obs_seq.final.post.small")
+
+    @pytest.fixture
+    def content(self, source):
+        with open(source, "rb") as f:
+            return f.read()
+
+    @pytest.fixture
+    def levels(self):
+        return [i * 100 for i in [0, 300, 500, 700, 1100]]
+
+    def append(self, file, data):
+        with open(file, "ab") as f:
+            f.write(data)
+
+    def test_missing_file(self, tmpdir):
+        follower = Follower(os.path.join(tmpdir, "obs_seq.final"))
+        assert follower.poll().empty
+        assert follower.n_obs == 0
+
+    def test_partial_header(self, tmpdir, content):
+        file = os.path.join(tmpdir, "obs_seq.final")
+        self.append(file, content[:500])
+        follower = Follower(file)
+        assert follower.poll().empty
+        assert follower.offset == 0
+
+    def test_follow_in_chunks(self, tmpdir, source, content, levels):
+        file = os.path.join(tmpdir, "obs_seq.final")
+        store = StatsStore(levels=levels)
+        follower = Follower(file, store=store, cycle="2019-12-01 21:00")
+
+        # append the file in pieces that split the header and the observations
+        frames = []
+        for start in range(0, len(content), 4000):
+            self.append(file, content[start : start + 4000])
+            frames.append(follower.poll())
+            with open(file, "rb") as f:
+                f.seek(follower.offset)
+                rest = f.read()
+            # nothing, the incomplete header, or an incomplete observation is left
+            assert (
+                rest == b"" or follower.offset == 0 or rest.lstrip().startswith(b"OBS")
+            )
+
+        obs_seq = obsq.ObsSequence(source)
+        assert follower.n_obs == len(obs_seq.df)
+        assert follower.offset == len(content)
+        followed = pd.concat(frames, ignore_index=True)
+        pd.testing.assert_frame_equal(
+            followed[obs_seq.df.columns], obs_seq.df, check_dtype=False
+        )
+
+        expected = StatsStore(levels=levels)
+        expected.add(source, cycle="2019-12-01 21:00")
+        result = store.time_statistics()
+        pd.testing.assert_frame_equal(result, expected.time_statistics())
+        pd.testing.assert_frame_equal(
+            store.possible_vs_used(), expected.possible_vs_used()
+        )
+
+    def test_last_observation_waits(self, tmpdir, content):
+        # without the num_obs in the header, the last observation waits for final=True
+        text = content.decode("utf-8")
+        text = text.replace("num_obs:           11", "num_obs:           99", 1)
+        file = os.path.join(tmpdir, "obs_seq.final")
+        self.append(file, text.encode("utf-8"))
+
+        follower = Follower(file)
+        assert len(follower.poll()) == 10
+        assert follower.poll().empty
+        assert len(follower.poll(final=True)) == 1
+        assert follower.n_obs == 11
+        assert follower.poll(final=True).empty
+
+    def test_accumulate_into_persistent_store(self, tmpdir, source, content):
+        path = os.path.join(tmpdir, "store")
+        file = os.path.join(tmpdir, "obs_seq.final")
+        follower = Follower(file, store=StatsStore(path))
+        half = len(content) // 2
+        self.append(file, content[:half])
+        follower.poll()
+        self.append(file, content[half:])
+        follower.poll()
+
+        obs_seq = obsq.ObsSequence(source)
+        assert follower.cycle == obs_seq.df["time"].iloc[0]
+        reopened = StatsStore(path)
+        expected = StatsStore()
+        expected.add(source, cycle=follower.cycle)
+        result = reopened.time_statistics()
+        for stat in ["prior_rmse", "prior_bias", "posterior_totalspread"]:
+            assert np.allclose(
+                result[stat], expected.time_statistics()[stat], equal_nan=True
+            )
+
+    def test_binary(self):
+        with pytest.raises(ValueError, match="Only ASCII obs_seq files"):
+            Follower(data_file("obs_seq.final.binary.small")).poll()
+
+    def test_compressed(self, tmpdir):
+        with pytest.raises(ValueError, match="Compressed obs_seq files"):
+            Follower(os.path.join(tmpdir, "obs_seq.final.gz"))
+
+
+if __name__ == "__main__":
+    pytest.main()
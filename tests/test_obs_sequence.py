@@ -504,6 +504,57 @@ class TestJoin:
         assert obs_seq_mega.has_posterior() == False
 
 
+class TestFromFiles:
+    @pytest.fixture
+    def files(self):
+        test_dir = os.path.dirname(__file__)
+        return [
+            os.path.join(test_dir, "data", "obs_seq.final.ascii.small"),
+            os.path.join(test_dir, "data", "obs_seq.final.binary.small"),
+            os.path.join(test_dir, "data", "obs_seq.final.ascii.small"),
+        ]
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_matches_join(self, files, workers):
+        joined = obsq.ObsSequence.join([obsq.ObsSequence(file) for file in files])
+        loaded = obsq.ObsSequence.from_files(files, workers=workers)
+        pd.testing.assert_frame_equal(loaded.df, joined.df)
+        assert loaded.copie_names == joined.copie_names
+        assert loaded.qc_copie_names == joined.qc_copie_names
+        assert loaded.types == joined.types
+        assert loaded.header == joined.header
+        assert loaded.loc_mod == "loc3d"
+
+    def test_copies(self, files):
+        copies = ["prior_ensemble_mean", "observation", "DART_quality_control"]
+        joined = obsq.ObsSequence.join(
+            [obsq.ObsSequence(file) for file in files], copies
+        )
+        loaded = obsq.ObsSequence.from_files(files, workers=2, copies=copies)
+        pd.testing.assert_frame_equal(loaded.df, joined.df)
+        assert loaded.copie_names == joined.copie_names
+
+    def test_empty_list(self):
+        with pytest.raises(
+            ValueError, match="The list of observation sequences is empty."
+        ):
+            obsq.ObsSequence.from_files([])
+
+    def test_diff_locs(self, files):
+        test_dir = os.path.dirname(__file__)
+        files = files + [os.path.join(test_dir, "data", "obs_seq.1d.final")]
+        with pytest.raises(
+            ValueError, match="All observation sequences must have the same loc_mod."
+        ):
+            obsq.ObsSequence.from_files(files, workers=2)
+
+    def test_missing_file(self, files, tmpdir):
+        with pytest.raises(FileNotFoundError):
+            obsq.ObsSequence.from_files(
+                files + [os.path.join(tmpdir, "obs_seq.missing")], workers=2
+            )
+
+
 class TestCreateHeader:
     def test_create_header(self):
         obj = obsq.ObsSequence(file=None)
@@ -853,6 +904,9 @@ class TestCompositeTypes:
         # Test that composite_types does not raise an error
         obs_seq.composite_types(raise_on_duplicate=False)
 
+        # Each duplicate u is paired with one duplicate v
+        assert (obs_seq.df["type"] == "ACARS_HORIZONTAL_WIND").sum() == 2
+
         # Verify that the DataFrame has the expected types
         types = obs_seq.df["type"].unique()
         expected_composite_types = [
@@ -925,6 +979,40 @@ class TestCompositeTypes:
                 == orig_df.loc[orig_df["type"] == "ACARS_TEMPERATURE", col].values[0]
             )
 
+    def test_composite_types_single_pass(self):
+        test_dir = os.path.dirname(__file__)
+        file_path = os.path.join(test_dir, "data", "obs_seq.final.post.small")
+        obs_seq = obsq.ObsSequence(file_path)
+        orig_df = obs_seq.df.copy()
+
+        obs_seq.composite_types()
+
+        counts = obs_seq.df["type"].value_counts()
+        # the unpaired u component is not used
+        assert counts["ACARS_HORIZONTAL_WIND"] == 2
+        assert counts["AIRCRAFT_HORIZONTAL_WIND"] == 1
+        assert len(obs_seq.df) == len(orig_df) + 3
+
+        for composite in ["ACARS", "AIRCRAFT"]:
+            u = orig_df[orig_df["type"] == f"{composite}_U_WIND_COMPONENT"]
+            v = orig_df[orig_df["type"] == f"{composite}_V_WIND_COMPONENT"]
+            merged = pd.merge(
+                u, v, on=["latitude", "longitude", "vertical", "time"], suffixes=("", "_v")
+            )
+            wind = obs_seq.df[obs_seq.df["type"] == f"{composite}_HORIZONTAL_WIND"]
+            assert np.allclose(
+                wind["observation"],
+                np.sqrt(merged["observation"] ** 2 + merged["observation_v"] ** 2),
+            )
+            assert np.allclose(
+                wind["prior_ensemble_mean"],
+                np.sqrt(
+                    merged["prior_ensemble_mean"] ** 2
+                    + merged["prior_ensemble_mean_v"] ** 2
+                ),
+            )
+            assert (wind["obs_num"].values == merged["obs_num"].values).all()
+
     def test_no_yaml_file(self):
         with pytest.raises(Exception):
             obsq._load_yaml_to_dict("nonexistent.yaml")
@@ -1323,5 +1411,314 @@ class TestQC2Replacement:
         ).all()
 
 
+class TestThin:
+    @pytest.fixture
+    def obs_seq(self):
+        test_dir = os.path.dirname(__file__)
+        file_path = os.path.join(test_dir, "data", "obs_seq.final.post.small")
+        return obsq.ObsSequence(file_path)
+
+    def test_thin(self, obs_seq):
+        thinned = obs_seq.thin(resolution=180.0, levels=[0, 200000])
+
+        assert len(thinned.df) == 6
+        assert (thinned.df["type"].value_counts() == 1).all()
+        assert len(obs_seq.df) == 11  # original is unchanged
+        assert thinned.df["obs_num"].tolist() == list(range(1, 7))
+
+    def test_thin_by_vertical(self, obs_seq):
+        # without levels, each vertical coordinate is thinned separately
+        thinned = obs_seq.thin(resolution=180.0)
+        assert len(thinned.df) == len(obs_seq.df)
+
+    def test_thin_write(self, obs_seq):
+        thinned = obs_seq.thin(resolution=180.0, levels=[0, 200000])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "obs_seq.thinned")
+            thinned.write_obs_seq(file_path)
+            reread = obsq.ObsSequence(file_path)
+
+        assert len(reread.df) == 6
+        assert sorted(reread.df["type"]) == sorted(thinned.df["type"])
+        assert np.allclose(reread.df["observation"], thinned.df["observation"])
+
+    def test_thin_loc1d(self):
+        test_dir = os.path.dirname(__file__)
+        obs_seq = obsq.ObsSequence(os.path.join(test_dir, "data", "obs_seq.1d.final"))
+        with pytest.raises(ValueError):
+            obs_seq.thin()
+
+
+class TestSuperob:
+    @pytest.fixture
+    def obs_seq(self):
+        test_dir = os.path.dirname(__file__)
+        file_path = os.path.join(test_dir, "data", "obs_seq.final.post.small")
+        return obsq.ObsSequence(file_path)
+
+    def test_superob(self, obs_seq):
+        superobs = obs_seq.superob(resolution=180.0, levels=[0, 200000])
+
+        assert len(superobs.df) == 6
+        assert (superobs.df["type"].value_counts() == 1).all()
+        assert len(obs_seq.df) == 11  # original is unchanged
+
+        # the third ACARS temperature is rejected (DART QC 6) and not averaged
+        temperature = obs_seq.df[obs_seq.df["type"] == "ACARS_TEMPERATURE"].iloc[:2]
+        superob = superobs.df[superobs.df["type"] == "ACARS_TEMPERATURE"].iloc[0]
+        assert (temperature["DART_quality_control"] == 0).all()
+        assert np.isclose(superob["observation"], temperature["observation"].mean())
+        assert np.isclose(superob["obs_err_var"], temperature["obs_err_var"].mean() / 2)
+        assert superob["DART_quality_control"] == 0
+        assert np.isclose(
+            superob["prior_ensemble_spread"],
+            np.sqrt((temperature["prior_ensemble_spread"] ** 2).mean()),
+        )
+
+    def test_superob_rejected_observations(self, obs_seq):
+        # a rejected observation shares the grid cell with two used observations
+        temperature = obs_seq.df[obs_seq.df["type"] == "ACARS_TEMPERATURE"]
+        assert temperature["DART_quality_control"].tolist() == [0, 0, 6]
+
+        superobs = obs_seq.superob(resolution=180.0, levels=[0, 200000], qc=None)
+        superob = superobs.df[superobs.df["type"] == "ACARS_TEMPERATURE"].iloc[0]
+        assert np.isclose(superob["observation"], temperature["observation"].mean())
+        assert superob["DART_quality_control"] == 6
+
+        superobs = obs_seq.superob(resolution=180.0, levels=[0, 200000], qc=[6])
+        superob = superobs.df[superobs.df["type"] == "ACARS_TEMPERATURE"].iloc[0]
+        assert np.isclose(superob["observation"], temperature["observation"].iloc[2])
+        assert len(superobs.df) == 2
+
+    def test_superob_write(self, obs_seq):
+        superobs = obs_seq.superob(resolution=180.0, levels=[0, 200000])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, "obs_seq.superob")
+            superobs.write_obs_seq(file_path)
+            reread = obsq.ObsSequence(file_path)
+
+        assert len(reread.df) == 6
+        assert np.allclose(reread.df["observation"], superobs.df["observation"])
+        assert np.allclose(reread.df["obs_err_var"], superobs.df["obs_err_var"])
+        assert (reread.df["time"] == superobs.df["time"]).all()
+
+    def test_superob_longitude_wrap(self, obs_seq):
+        # -0.2 and 359.6 are in the same grid cell
+        df = obs_seq.df.iloc[[0, 3]].copy()
+        df["longitude"] = [-0.2, 359.6]
+        df["latitude"] = [10.5, 10.5]
+        df["vertical"] = 50000.0
+        obs_seq.df = df
+        superobs = obs_seq.superob(resolution=1.0)
+
+        assert len(superobs.df) == 1
+        assert np.isclose(superobs.df["longitude"].iloc[0], 359.7)
+        assert np.isclose(superobs.df["latitude"].iloc[0], 10.5, atol=1e-4)
+
+    def test_superob_loc1d(self):
+        test_dir = os.path.dirname(__file__)
+        obs_seq = obsq.ObsSequence(os.path.join(test_dir, "data", "obs_seq.1d.final"))
+        with pytest.raises(ValueError):
+            obs_seq.superob()
+
+
+class TestSpatialQueries:
+    @pytest.fixture
+    def obs_seq(self):
+        test_dir = os.path.dirname(__file__)
+        file_path = os.path.join(test_dir, "data", "obs_seq.final.post.small")
+        return obsq.ObsSequence(file_path)
+
+    def test_spatial_index_cached(self, obs_seq):
+        index = obs_seq.spatial_index()
+        assert obs_seq.spatial_index() is index
+        assert len(index) == len(obs_seq.df)
+
+        # rebuilt when the DataFrame is replaced
+        obs_seq.df = obs_seq.df.iloc[:5].copy()
+        assert obs_seq.spatial_index() is not index
+        assert len(obs_seq.spatial_index()) == 5
+
+        index = obs_seq.spatial_index()
+        obs_seq.update_attributes_from_df()
+        assert obs_seq.spatial_index() is not index
+
+    def test_spatial_index_locations_changed_in_place(self, obs_seq):
+        assert len(obs_seq.select_within(274.46, 40.01, distance_km=1.0)) == 3
+        obs_seq.df.loc[obs_seq.df["longitude"] == 274.46, "longitude"] = 100.0
+        assert obs_seq.select_within(274.46, 40.01, distance_km=1.0).empty
+        assert len(obs_seq.select_box(90.0, 110.0, 30.0, 45.0)) == 3
+
+    def test_spatial_index_rows_dropped_in_place(self, obs_seq):
+        assert len(obs_seq.select_within(274.46, 40.01, distance_km=1.0)) == 3
+        obs_seq.df.drop(obs_seq.df.index[:3], inplace=True)
+        assert len(obs_seq.spatial_index()) == len(obs_seq.df)
+        selected = obs_seq.select_within(258.5, 37.0, distance_km=1500.0)
+        assert sorted(selected.index) == [3, 4, 5]
+
+    def test_select_within(self, obs_seq):
+        # three observations at each of two ACARS locations
+        selected = obs_seq.select_within(274.46, 40.01, distance_km=1.0)
+        assert len(selected) == 3
+        assert (selected["longitude"] == 274.46).all()
+
+        selected = obs_seq.select_within(258.5, 37.0, distance_km=1500.0)
+        assert sorted(selected.index) == [0, 1, 2, 3, 4, 5]
+
+    def test_select_box(self, obs_seq):
+        selected = obs_seq.select_box(240.0, 280.0, 30.0, 45.0)
+        assert sorted(selected.index) == [0, 1, 2, 3, 4, 5]
+
+        # across the 0/360 degree meridian
+        selected = obs_seq.select_box(350.0, 10.0, 50.0, 52.0)
+        assert (selected["type"].str.startswith("AIRCRAFT")).all()
+        assert len(selected) == 3
+
+    def test_spatial_index_loc1d(self):
+        test_dir = os.path.dirname(__file__)
+        obs_seq = obsq.ObsSequence(os.path.join(test_dir, "data", "obs_seq.1d.final"))
+        with pytest.raises(ValueError):
+            obs_seq.spatial_index()
+
+
+class TestSelectTime:
+    @pytest.fixture
+    def obs_seq(self):
+        obs_seq = obsq.ObsSequence(file=None)
+        times = pd.Timestamp("2020-01-01") + pd.to_timedelta(
+            [0, 600, 3599, 3600, 3600, 5400, 7200, 10000], unit="s"
+        )
+        obs_seq.df = pd.DataFrame({"time": times, "observation": np.arange(8.0)})
+        return obs_seq
+
+    @staticmethod
+    def expected(df, start, end):
+        mask = (df["time"] >= pd.Timestamp(start)) & (df["time"] < pd.Timestamp(end))
+        return df[mask].sort_values("time", kind="stable")
+
+    @pytest.mark.parametrize(
+        "start, end",
+        [
+            ("2020-01-01 00:00", "2020-01-01 01:00"),
+            ("2020-01-01 01:00", "2020-01-01 02:00"),
+            ("2020-01-01 02:30", "2020-01-01 02:40"),
+            ("2019-12-31", "2020-01-02"),
+        ],
+    )
+    def test_select_time(self, obs_seq, start, end):
+        selected = obs_seq.select_time(start, end)
+        pd.testing.assert_frame_equal(selected, self.expected(obs_seq.df, start, end))
+
+    def test_select_time_unsorted(self, obs_seq):
+        obs_seq.df = obs_seq.df.sample(frac=1, random_state=0)
+        selected = obs_seq.select_time("2020-01-01 01:00", "2020-01-01 02:00")
+        pd.testing.assert_frame_equal(
+            selected,
+            self.expected(obs_seq.df, "2020-01-01 01:00", "2020-01-01 02:00"),
+        )
+
+    def test_select_time_open_ended(self, obs_seq):
+        assert obs_seq.select_time(end="2020-01-01 01:00")["observation"].tolist() == [
+            0.0,
+            1.0,
+            2.0,
+        ]
+        assert obs_seq.select_time(start="2020-01-01 02:00")[
+            "observation"
+        ].tolist() == [6.0, 7.0]
+        assert len(obs_seq.select_time()) == len(obs_seq.df)
+
+    def test_select_time_index_rebuilt(self, obs_seq):
+        assert len(obs_seq.select_time("2020-01-01", "2020-01-01 01:00")) == 3
+        obs_seq.df = obs_seq.df.iloc[1:].copy()
+        assert len(obs_seq.select_time("2020-01-01", "2020-01-01 01:00")) == 2
+
+    def test_select_time_values_changed_in_place(self, obs_seq):
+        assert len(obs_seq.select_time("2020-01-01", "2020-01-01 01:00")) == 3
+        obs_seq.df["time"] += pd.Timedelta("10D")
+        assert obs_seq.select_time("2020-01-01", "2020-01-01 01:00").empty
+        assert len(obs_seq.select_time("2020-01-11", "2020-01-11 01:00")) == 3
+
+        obs_seq.df.loc[obs_seq.df["observation"] == 7.0, "time"] = pd.NaT
+        selected = obs_seq.select_time("2020-01-11", "2020-01-12")
+        assert selected["observation"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+
+    def test_select_time_rows_changed_in_place(self, obs_seq):
+        assert len(obs_seq.select_time("2020-01-01", "2020-01-01 01:00")) == 3
+        obs_seq.df.drop(obs_seq.df.index[[0, 6, 7]], inplace=True)
+        selected = obs_seq.select_time("2020-01-01", "2020-01-01 01:00")
+        assert selected["observation"].tolist() == [1.0, 2.0]
+
+        obs_seq.df.sort_values("observation", ascending=False, inplace=True)
+        selected = obs_seq.select_time("2020-01-01 01:00", "2020-01-01 02:00")
+        pd.testing.assert_frame_equal(
+            selected,
+            self.expected(obs_seq.df, "2020-01-01 01:00", "2020-01-01 02:00"),
+        )
+
+    def test_select_time_from_file(self):
+        test_dir = os.path.dirname(__file__)
+        file_path = os.path.join(test_dir, "data", "obs_seq.final.post.small")
+        obs_seq = obsq.ObsSequence(file_path)
+        start = obs_seq.df["time"].min()
+        selected = obs_seq.select_time(start, start + pd.Timedelta("1s"))
+        pd.testing.assert_frame_equal(
+            selected, obs_seq.df[obs_seq.df["time"] == start]
+        )
+
+
+class TestSelectType:
+    @pytest.fixture
+    def obs_seq(self):
+        test_dir = os.path.dirname(__file__)
+        file_path = os.path.join(test_dir, "data", "obs_seq.final.post.small")
+        return obsq.ObsSequence(file_path)
+
+    def test_select_type(self, obs_seq):
+        for type in obs_seq.df["type"].unique():
+            pd.testing.assert_frame_equal(
+                obs_seq.select_type(type), obs_seq.df[obs_seq.df["type"] == type]
+            )
+
+    def test_select_type_missing(self, obs_seq):
+        selected = obs_seq.select_type("NOT_A_TYPE")
+        assert selected.empty
+        assert selected.columns.equals(obs_seq.df.columns)
+
+    def test_select_type_identity(self):
+        obs_seq = obsq.ObsSequence(file=None)
+        obs_seq.df = pd.DataFrame(
+            {"type": ["A", -5, "B", "A", -5, None], "observation": np.arange(6.0)}
+        )
+        assert obs_seq.select_type("A")["observation"].tolist() == [0.0, 3.0]
+        assert obs_seq.select_type(-5)["observation"].tolist() == [1.0, 4.0]
+        assert obs_seq.select_type("B")["observation"].tolist() == [2.0]
+
+    def test_select_type_index_rebuilt(self, obs_seq):
+        assert len(obs_seq.select_type("ACARS_TEMPERATURE")) == 3
+        obs_seq.df = obs_seq.df.iloc[1:].copy()
+        assert len(obs_seq.select_type("ACARS_TEMPERATURE")) == 2
+
+        # new columns are included without rebuilding the index
+        obs_seq.df["new"] = 1.0
+        assert "new" in obs_seq.select_type("ACARS_TEMPERATURE").columns
+
+    def test_select_type_values_changed_in_place(self, obs_seq):
+        assert len(obs_seq.select_type("ACARS_TEMPERATURE")) == 3
+        mask = obs_seq.df["type"] == "ACARS_TEMPERATURE"
+        obs_seq.df.loc[mask, "type"] = "NEW"
+        assert obs_seq.select_type("ACARS_TEMPERATURE").empty
+        pd.testing.assert_frame_equal(obs_seq.select_type("NEW"), obs_seq.df[mask])
+
+    def test_select_type_rows_dropped_in_place(self, obs_seq):
+        assert len(obs_seq.select_type("ACARS_TEMPERATURE")) == 3
+        obs_seq.df.drop(obs_seq.df.index[:-2], inplace=True)
+        for type in obs_seq.df["type"].unique():
+            pd.testing.assert_frame_equal(
+                obs_seq.select_type(type), obs_seq.df[obs_seq.df["type"] == type]
+            )
+        assert len(obs_seq.select_type("ACARS_TEMPERATURE")) == 1
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -0,0 +1,126 @@
+# SPDX-License-Identifier: Apache-2.0
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from pydartdiags.obs_sequence import obs_sequence as obsq
+from pydartdiags.stats import stats
+
+pl = pytest.importorskip("polars")
+pytest.importorskip("pyarrow")
+
+from pydartdiags.obs_sequence import polars_backend as plb  # noqa: E402
+
+
+class TestPolarsBackend:
+
+    @pytest.fixture
+    def obs_seq(self):
+        test_dir = os.path.dirname(__file__)
+        file_path = os.path.join(test_dir, "data", "obs_seq.final.post.small")
+        return obsq.ObsSequence(file_path)
+
+    @pytest.fixture
+    def used(self, obs_seq):
+        df = stats.select_used_qcs(obs_seq.df).copy()
+        stats.diag_stats(df)
+        return df
+
+    @pytest.fixture
+    def frame(self, obs_seq):
+        return plb.diag_stats(plb.select_used_qcs(obs_seq.to_polars()))
+
+    def test_to_arrow_shares_memory(self, obs_seq):
+        table = obs_seq.to_arrow(columns=["observation", "type", "time"])
+        assert table.column_names == ["observation", "type", "time"]
+        assert table.num_rows == len(obs_seq.df)
+        buffer = table.column("observation").chunk(0).buffers()[1]
+        assert buffer.address == obs_seq.df["observation"].to_numpy().ctypes.data
+
+    def test_to_polars(self, obs_seq):
+        frame = obs_seq.to_polars()
+        assert frame.columns == list(obs_seq.df.columns)
+        assert frame.height == len(obs_seq.df)
+        assert frame["time"].to_list() == list(obs_seq.df["time"])
+
+    def test_nan_becomes_null(self):
+        df = pd.DataFrame({"observation": [1.0, np.nan, 3.0]})
+        assert plb.to_polars(df)["observation"].null_count() == 1
+
+    def test_select_used_qcs(self, obs_seq, used):
+        assert plb.select_used_qcs(obs_seq.to_polars()).height == len(used)
+
+    def test_diag_stats(self, used, frame):
+        for column in ["prior_sq_err", "posterior_bias", "posterior_totalvar"]:
+            np.testing.assert_allclose(
+                frame[column].to_numpy(), used[column].to_numpy(), equal_nan=True
+            )
+
+    def test_grand_statistics(self, used, frame):
+        expected = stats.grand_statistics(used)
+        result = plb.grand_statistics(frame).to_pandas()
+        pd.testing.assert_frame_equal(result[expected.columns], expected)
+
+    def test_lazy_frame(self, used, obs_seq):
+        lazy = plb.grand_statistics(
+            plb.diag_stats(plb.select_used_qcs(obs_seq.to_polars().lazy()))
+        )
+        assert isinstance(lazy, pl.LazyFrame)
+        expected = stats.grand_statistics(used)
+        result = lazy.collect().to_pandas()
+        pd.testing.assert_frame_equal(result[expected.columns], expected)
+
+    def test_layer_statistics(self, used, frame):
+        levels = [0, 10000, 50000, 100000, 101000]
+        stats.bin_by_layer(used, levels)
+        expected = (
+            stats.layer_statistics(used)
+            .dropna(subset=["prior_rmse"])
+            .reset_index(drop=True)
+        )
+        result = plb.layer_statistics(plb.bin_by_layer(frame, levels)).to_pandas()
+        columns = [c for c in expected.columns if c not in ["midpoint", "vlevels"]]
+        pd.testing.assert_frame_equal(result[columns], expected[columns])
+        np.testing.assert_allclose(
+            result["midpoint"], expected["midpoint"].astype(float)
+        )
+        assert list(result["vlevels"]) == [str(v) for v in expected["vlevels"]]
+
+    def test_bin_by_layer_edges(self):
+        frame = pl.DataFrame(
+            {
+                "vertical": [100.0, 150.0, 200.0, 50.0, None, 250.0, 150.0],
+                "vert_unit": ["pressure (Pa)"] * 6 + ["height (m)"],
+            }
+        )
+        result = plb.bin_by_layer(frame, [100.0, 200.0, 300.0])
+        df = frame.to_pandas()
+        stats.bin_by_layer(df, [100.0, 200.0, 300.0])
+        np.testing.assert_allclose(
+            result["midpoint"].to_numpy(),
+            df["midpoint"].astype(float).to_numpy(),
+            equal_nan=True,
+        )
+
+    def test_time_statistics(self, used, frame):
+        stats.bin_by_time(used, "3600s")
+        expected = (
+            stats.time_statistics(used)
+            .dropna(subset=["prior_rmse"])
+            .reset_index(drop=True)
+        )
+        result = plb.time_statistics(plb.bin_by_time(frame, "3600s")).to_pandas()
+        columns = [
+            c for c in expected.columns if c not in ["time_bin_midpoint", "time_bin"]
+        ]
+        pd.testing.assert_frame_equal(
+            result[columns], expected[columns], check_dtype=False
+        )
+        assert list(result["time_bin_midpoint"]) == list(
+            expected["time_bin_midpoint"].astype("datetime64[ns]")
+        )
+        assert list(result["time_bin_start"]) == [b.left for b in expected["time_bin"]]
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,146 @@
+# SPDX-License-Identifier: Apache-2.0
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from pydartdiags.obs_sequence import obs_sequence as obsq
+from pydartdiags.stats import stats
+
+
+def eager(df):
+    """The query in the tests as eager pandas filters."""
+    df = df[(df["DART_quality_control"] == 0) | (df["DART_quality_control"] == 2)]
+    df = df[df["type"].isin(["ACARS_TEMPERATURE", "RADIOSONDE_TEMPERATURE"])]
+    df = df[(df["time"] >= "2020-01-01 03:00") & (df["time"] < "2020-01-01 15:00")]
+    df = df[(df["longitude"] >= 60) & (df["longitude"] <= 300)]
+    df = df[(df["latitude"] >= -45) & (df["latitude"] <= 45)]
+    df = df[(df["vertical"] >= 20000) & (df["vert_unit"] == "pressure (Pa)")]
+    return df
+
+
+def query(obs_seq):
+    return (
+        obs_seq.query()
+        .used()
+        .types("ACARS_TEMPERATURE", "RADIOSONDE_TEMPERATURE")
+        .time("2020-01-01 03:00", "2020-01-01 15:00")
+        .box(60.0, 300.0, -45.0, 45.0)
+        .vertical(low=20000, vert_unit="pressure (Pa)")
+    )
+
+
+class TestQuery:
+    @pytest.fixture
+    def obs_seq(self):
+        rng = np.random.default_rng(6)
+        n = 2000
+        obs_seq = obsq.ObsSequence(file=None)
+        obs_seq.loc_mod = "loc3d"
+        obs_seq.df = pd.DataFrame(
+            {
+                "obs_num": np.arange(1, n + 1),
+                "observation": rng.normal(size=n),
+                "prior_ensemble_mean": rng.normal(size=n),
+                "prior_ensemble_spread": rng.uniform(0.5, 1.5, size=n),
+                "DART_quality_control": rng.choice([0, 2, 4, 7], size=n),
+                "longitude": rng.uniform(0, 360, size=n),
+                "latitude": rng.uniform(-90, 90, size=n),
+                "vertical": rng.uniform(0, 100000, size=n),
+                "vert_unit": rng.choice(["pressure (Pa)", "height (m)"], size=n),
+                "type": rng.choice(
+                    ["ACARS_TEMPERATURE", "RADIOSONDE_TEMPERATURE", "SAT_U"], n
+                ),
+                # not in time order
+                "time": pd.Timestamp("2020-01-01")
+                + pd.to_timedelta(rng.integers(0, 86400, size=n), unit="s"),
+                "obs_err_var": rng.uniform(0.5, 2.0, size=n),
+            }
+        )
+        return obs_seq
+
+    def test_collect(self, obs_seq):
+        expected = eager(obs_seq.df)
+        assert len(expected) > 0
+        pd.testing.assert_frame_equal(query(obs_seq).collect(), expected)
+
+    def test_lazy(self, obs_seq):
+        q = query(obs_seq)
+        # the query runs on the data at collect time
+        obs_seq.df = obs_seq.df.iloc[:1000].copy()
+        pd.testing.assert_frame_equal(q.collect(), eager(obs_seq.df))
+
+    def test_values_changed_in_place(self, obs_seq):
+        q = query(obs_seq)
+        q.collect()
+        obs_seq.df["time"] += pd.Timedelta("6h")
+        obs_seq.df.loc[obs_seq.df["type"] == "SAT_U", "type"] = "ACARS_TEMPERATURE"
+        obs_seq.df["longitude"] = (obs_seq.df["longitude"] + 90.0) % 360.0
+        pd.testing.assert_frame_equal(q.collect(), eager(obs_seq.df))
+
+    def test_chaining_does_not_modify(self, obs_seq):
+        base = obs_seq.query().used()
+        narrowed = base.types("SAT_U")
+        assert len(base.collect()) > len(narrowed.collect())
+        assert (narrowed.collect()["type"] == "SAT_U").all()
+
+    def test_within_and_where(self, obs_seq):
+        result = (
+            obs_seq.query()
+            .within(180.0, 0.0, distance_km=3000.0)
+            .where("obs_err_var", lambda values: values < 1.0)
+            .collect()
+        )
+        expected = obs_seq.select_within(180.0, 0.0, 3000.0)
+        expected = expected[expected["obs_err_var"] < 1.0]
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_select_and_diag_stats(self, obs_seq):
+        result = query(obs_seq).select("type", "vertical").diag_stats().collect()
+
+        expected = eager(obs_seq.df).copy()
+        stats.diag_stats(expected)
+        assert list(result.columns) == [
+            "type",
+            "vertical",
+            "prior_sq_err",
+            "prior_bias",
+            "prior_totalvar",
+        ]
+        pd.testing.assert_frame_equal(result, expected[result.columns])
+        assert "prior_sq_err" not in obs_seq.df.columns  # the sequence is unchanged
+
+    def test_select_unknown_column(self, obs_seq):
+        with pytest.raises(KeyError, match="nonexistent"):
+            obs_seq.query().select("type", "nonexistent").collect()
+
+        # the columns diag_stats needs must be there too
+        obs_seq.df = obs_seq.df.drop(columns="obs_err_var")
+        with pytest.raises(KeyError, match="obs_err_var"):
+            obs_seq.query().select("type").diag_stats().collect()
+
+    def test_aggregate(self, obs_seq):
+        result = (
+            query(obs_seq)
+            .diag_stats()
+            .aggregate(stats.grand_statistics)
+            .collect()
+        )
+
+        expected = eager(obs_seq.df).copy()
+        stats.diag_stats(expected)
+        pd.testing.assert_frame_equal(result, stats.grand_statistics(expected))
+
+    def test_no_filters(self, obs_seq):
+        pd.testing.assert_frame_equal(obs_seq.query().collect(), obs_seq.df)
+        assert len(obs_seq.query().types("NOT_A_TYPE").collect()) == 0
+
+    def test_from_file(self):
+        test_dir = os.path.dirname(__file__)
+        file_path = os.path.join(test_dir, "data", "obs_seq.final.ascii.small")
+        obs_seq = obsq.ObsSequence(file_path)
+        result = obs_seq.query().used().types("ACARS_TEMPERATURE").collect()
+        expected = obs_seq.df[
+            (obs_seq.df["type"] == "ACARS_TEMPERATURE")
+            & obs_seq.df["DART_quality_control"].isin([0, 2])
+        ]
+        pd.testing.assert_frame_equal(result, expected)
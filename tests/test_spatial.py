@@ -0,0 +1,174 @@
+# SPDX-License-Identifier: Apache-2.0
+import numpy as np
+import pytest
+from pydartdiags.obs_sequence import spatial
+
+
+class TestSpatialHash:
+
+    @pytest.fixture
+    def locations(self):
+        rng = np.random.default_rng(4)
+        n = 2000
+        # clustered near the pole and the dateline to exercise wrapping
+        lon = np.concatenate([rng.uniform(0, 360, n // 2), rng.uniform(359, 361, n // 2)])
+        lat = np.concatenate([rng.uniform(85, 90, n // 2), rng.uniform(-1, 1, n // 2)])
+        return np.mod(lon, 360), lat
+
+    @staticmethod
+    def brute_force_pairs(lon, lat, distance_km, groups=None):
+        xyz = spatial.unit_vectors(lon, lat)
+        chord = np.sqrt(((xyz[:, None, :] - xyz[None, :, :]) ** 2).sum(axis=2))
+        close = chord <= spatial.chord_length(distance_km)
+        if groups is not None:
+            close &= groups[:, None] == groups[None, :]
+        i, j = np.nonzero(np.triu(close, k=1))
+        return set(zip(i.tolist(), j.tolist()))
+
+    @staticmethod
+    def found_pairs(index, distance_km, **kwargs):
+        found = []
+        for i, j in index.pairs_within(distance_km, **kwargs):
+            found.extend(zip(np.minimum(i, j).tolist(), np.maximum(i, j).tolist()))
+        return found
+
+    def test_unit_vectors(self):
+        xyz = spatial.unit_vectors([0, 90, 0], [0, 0, 90])
+        assert np.allclose(xyz, [[1, 0, 0], [0, 1, 0], [0, 0, 1]])
+
+    def test_pairs_within(self, locations):
+        lon, lat = locations
+        index = spatial.SpatialHash(lon, lat, cell_km=50.0)
+        found = self.found_pairs(index, 40.0, chunk_size=300)
+
+        assert len(found) == len(set(found))  # each pair once
+        assert set(found) == self.brute_force_pairs(lon, lat, 40.0)
+
+    def test_pairs_within_groups(self, locations):
+        lon, lat = locations
+        groups = np.arange(len(lon)) % 3
+        index = spatial.SpatialHash(lon, lat, cell_km=50.0, groups=groups)
+        found = self.found_pairs(index, 50.0)
+        assert set(found) == self.brute_force_pairs(lon, lat, 50.0, groups)
+
+    def test_identical_locations(self):
+        index = spatial.SpatialHash([10.0, 10.0, 10.0], [5.0, 5.0, 5.0], cell_km=1.0)
+        assert sorted(self.found_pairs(index, 0.5)) == [(0, 1), (0, 2), (1, 2)]
+
+    def test_distance_larger_than_cell(self, locations):
+        index = spatial.SpatialHash(*locations, cell_km=10.0)
+        with pytest.raises(ValueError):
+            next(index.pairs_within(20.0))
+
+    def test_invalid_cell(self):
+        with pytest.raises(ValueError):
+            spatial.SpatialHash([0.0], [0.0], cell_km=0.0)
+
+
+class TestSpatialIndex:
+
+    @pytest.fixture
+    def locations(self):
+        rng = np.random.default_rng(5)
+        n = 5000
+        lon = rng.uniform(-180, 360, n)
+        lat = np.rad2deg(np.arcsin(rng.uniform(-1, 1, n)))
+        lat[:20] = 90.0
+        return lon, lat
+
+    @staticmethod
+    def chords(lon, lat, point_lon, point_lat):
+        xyz = spatial.unit_vectors(lon, lat)
+        point = spatial.unit_vectors([point_lon], [point_lat])[0]
+        return np.sqrt(((xyz - point) ** 2).sum(axis=1))
+
+    @pytest.mark.parametrize(
+        "point_lon, point_lat, distance_km",
+        [
+            (0.0, 0.0, 500.0),
+            (359.9, 10.0, 300.0),  # across the dateline
+            (-0.1, -10.0, 2000.0),
+            (20.0, 89.5, 100.0),  # around the pole
+            (100.0, -60.0, 3000.0),
+            (10.0, 45.0, 25000.0),  # the whole sphere
+        ],
+    )
+    def test_within(self, locations, point_lon, point_lat, distance_km):
+        lon, lat = locations
+        index = spatial.SpatialIndex(lon, lat, band_deg=0.7)
+        chord = self.chords(lon, lat, point_lon, point_lat)
+        expected = np.flatnonzero(chord <= spatial.chord_length(distance_km))
+        assert len(expected) > 0
+        assert np.array_equal(index.within(point_lon, point_lat, distance_km), expected)
+
+    def test_nearest(self, locations):
+        lon, lat = locations
+        index = spatial.SpatialIndex(lon, lat)
+        points = [(0.0, 0.0), (359.99, 0.0), (10.0, 90.0)]
+        distance_km, positions = index.nearest(*zip(*points), k=5)
+
+        assert positions.shape == (3, 5)
+        for q, (point_lon, point_lat) in enumerate(points):
+            chord = self.chords(lon, lat, point_lon, point_lat)
+            assert np.allclose(np.sort(chord)[:5], chord[positions[q]])
+            assert np.allclose(
+                distance_km[q], spatial.great_circle_km(chord[positions[q]])
+            )
+
+    def test_nearest_many_points(self, locations):
+        # points searched together, in chunks, match a brute force search
+        lon, lat = locations
+        index = spatial.SpatialIndex(lon, lat, band_deg=2.0)
+        rng = np.random.default_rng(7)
+        point_lon = rng.uniform(-180, 360, 300)
+        point_lat = np.rad2deg(np.arcsin(rng.uniform(-1, 1, 300)))
+        point_lat[:3] = [90.0, -90.0, 89.9]
+        distance_km, positions = index.nearest(point_lon, point_lat, k=3, chunk_size=64)
+
+        xyz = spatial.unit_vectors(lon, lat)
+        points = spatial.unit_vectors(point_lon, point_lat)
+        chord = np.sqrt(((points[:, None, :] - xyz[None, :, :]) ** 2).sum(axis=2))
+        expected = np.sort(chord, axis=1)[:, :3]
+        assert np.allclose(distance_km, spatial.great_circle_km(expected))
+        assert np.allclose(np.take_along_axis(chord, positions, axis=1), expected)
+
+    def test_nearest_nan_point(self):
+        index = spatial.SpatialIndex([1.0, 2.0], [0.0, 0.0])
+        distance_km, positions = index.nearest([np.nan, 1.2], [0.0, 0.0])
+        assert positions.tolist() == [[-1], [0]]
+        assert np.isinf(distance_km[0, 0])
+
+    def test_nearest_fewer_than_k(self):
+        index = spatial.SpatialIndex([1.0, 2.0], [0.0, 0.0])
+        distance_km, positions = index.nearest(0.0, 0.0, k=3)
+        assert positions.tolist() == [[0, 1, -1]]
+        assert np.isinf(distance_km[0, 2])
+        assert np.isclose(distance_km[0, 0], spatial.EARTH_RADIUS_KM * np.pi / 180)
+
+    @pytest.mark.parametrize(
+        "lon_min, lon_max, lat_min, lat_max",
+        [
+            (10.0, 20.0, -5.0, 5.0),
+            (350.0, 10.0, 40.0, 60.0),  # across the dateline
+            (-10.0, 10.0, -90.0, -80.0),
+            (0.0, 360.0, 80.0, 90.0),
+        ],
+    )
+    def test_box(self, locations, lon_min, lon_max, lat_min, lat_max):
+        lon, lat = locations
+        index = spatial.SpatialIndex(lon, lat)
+        lon = np.mod(lon, 360)
+        lo, hi = np.mod(lon_min, 360), np.mod(lon_max, 360)
+        if lon_max - lon_min >= 360:
+            in_lon = np.ones(len(lon), dtype=bool)
+        elif lo <= hi:
+            in_lon = (lon >= lo) & (lon <= hi)
+        else:
+            in_lon = (lon >= lo) | (lon <= hi)
+        expected = np.flatnonzero(in_lon & (lat >= lat_min) & (lat <= lat_max))
+        assert len(expected) > 0
+        assert np.array_equal(index.box(lon_min, lon_max, lat_min, lat_max), expected)
+
+    def test_invalid_band(self):
+        with pytest.raises(ValueError):
+            spatial.SpatialIndex([0.0], [0.0], band_deg=0.0)
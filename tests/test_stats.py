@@ -1,4 +1,6 @@
 # SPDX-License-Identifier: Apache-2.0
+import math
+import warnings
 import pandas as pd
 import numpy as np
 import pytest
@@ -155,6 +157,36 @@ class TestDiagStats:
         assert np.allclose(df["posterior_bias"], expected_bias)
         assert np.allclose(df["posterior_totalvar"], expected_totalvar)
 
+    def test_slice(self):
+        # columns are added to a slice without a warning or a change to pandas options
+        df = pd.DataFrame(
+            {
+                "observation": [2.5, 3.0, 4.5],
+                "obs_err_var": [0.1, 0.2, 0.3],
+                "prior_ensemble_mean": [2.4, 3.0, 4.5],
+                "prior_ensemble_spread": [0.5, 0.6, 0.7],
+                "type": ["A", "B", "A"],
+                "vertical": [100.0, 200.0, 300.0],
+                "vert_unit": ["pressure (Pa)"] * 3,
+                "time": pd.to_datetime(
+                    ["2025-01-01 00:00", "2025-01-01 01:00", "2025-01-01 02:00"]
+                ),
+            }
+        )
+        copy_on_write = pd.options.mode.copy_on_write
+        subset = df[df["type"] == "A"]
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            stats.diag_stats(subset)
+            stats.diag_stats(subset)
+            stats.bin_by_layer(subset, [0, 200, 400])
+            stats.bin_by_time(subset, "1h")
+        assert pd.options.mode.copy_on_write == copy_on_write
+        assert np.allclose(subset["prior_bias"], [-0.1, 0.0])
+        assert subset["vlevels"].cat.codes.tolist() == [0, 1]
+        assert subset["time_bin"].cat.codes.tolist() == [0, 2]
+        assert "prior_bias" not in df.columns
+
 
 class TestGrandStatistics:
 
@@ -777,6 +809,806 @@ class TestTimeStats:
         # Assert that the DataFrame has the correct number of rows
         assert len(df) == 5, "The DataFrame should have 5 rows."
 
+    def test_bin_by_time_max_in_last_bin(self):
+        """
+        Test bin_by_time where the bins are not aligned with the bin width, so the
+        maximum time is past the last aligned boundary.
+        """
+        data = {
+            "time": pd.to_datetime(
+                [
+                    "2025-01-01 00:10:00",
+                    "2025-01-01 05:00:00",
+                    "2025-01-01 06:05:00",
+                ]
+            )
+        }
+        df = pd.DataFrame(data)
+
+        stats.bin_by_time(df, "6h")
+
+        expected_time_bins = pd.IntervalIndex.from_tuples(
+            [
+                (
+                    pd.Timestamp("2025-01-01 00:09:59"),
+                    pd.Timestamp("2025-01-01 06:09:59"),
+                ),
+            ]
+        )
+        assert all(df["time_bin"].cat.categories == expected_time_bins)
+        assert df["time_bin"].notna().all()
+        assert list(df["time_bin_midpoint"]) == [pd.Timestamp("2025-01-01 03:09:59")] * 3
+
+
+class TestBinnedStatistics:
+
+    @pytest.fixture
+    def df(self):
+        data = {
+            "observation": [2.5, 3.0, 4.5, 5.0, 6.0, 1.0],
+            "obs_err_var": [0.1, 0.2, 0.3, 0.1, 0.2, 0.3],
+            "prior_ensemble_mean": [2.4, 3.1, 4.5, 5.2, 5.9, 1.5],
+            "prior_ensemble_spread": [0.5, 0.6, 0.7, 0.5, 0.6, 0.7],
+            "posterior_ensemble_mean": [2.5, 3.0, np.nan, 5.1, 6.0, 1.2],
+            "posterior_ensemble_spread": [0.4, 0.5, np.nan, 0.4, 0.5, 0.6],
+            "DART_quality_control": [0, 0, 2, 0, 1, 0],
+            "type": ["A", "B", "A", "B", "A", "A"],
+            "vertical": [99, 226, 150, 250, 278, 350],
+            "vert_unit": ["pressure (Pa)"] * 5 + ["height (m)"],
+            "latitude": [-45.0, 10.0, 20.0, -90.0, 89.0, 0.0],
+            "longitude": [0.0, 100.0, 200.0, 300.0, 359.0, 360.0],
+            "time": pd.to_datetime(
+                [
+                    "2025-01-01 00:00:00",
+                    "2025-01-01 00:30:00",
+                    "2025-01-01 01:00:00",
+                    "2025-01-01 01:30:00",
+                    "2025-01-01 02:30:00",
+                    "2025-01-01 02:59:00",
+                ]
+            ),
+        }
+        df = pd.DataFrame(data)
+        stats.diag_stats(df)
+        return df
+
+    def test_bin_codes(self):
+        codes = stats._bin_codes([0, 50, 100, 150, 300, 301, -1, np.nan], [0, 100, 200, 300])
+        assert codes.tolist() == [0, 0, 0, 1, 2, -1, -1, -1]
+
+    def test_matches_grand_statistics(self, df):
+        grand = stats.grand_statistics(df)
+        result = stats.binned_statistics(df)
+
+        assert result["type"].tolist() == ["A", "B"]
+        assert result["count"].tolist() == [4, 2]
+        for column in grand.columns.drop("type"):
+            assert np.allclose(result[column], grand[column]), column
+
+    def test_matches_layer_statistics(self, df):
+        layers = [0, 100, 200, 300]
+        result = stats.binned_statistics(df, levels=layers)
+
+        df_layers = df.copy()
+        stats.bin_by_layer(df_layers, layers)
+        expected = stats.layer_statistics(df_layers).dropna(subset=["prior_rmse"])
+
+        merged = expected.merge(result, on=["type", "midpoint"], suffixes=("", "_b"))
+        assert len(merged) == len(result) == 4  # height (m) observation is dropped
+        for stat in ["prior_rmse", "prior_bias", "posterior_totalspread"]:
+            assert np.allclose(merged[stat], merged[f"{stat}_b"], equal_nan=True)
+
+    def test_nan_in_one_statistic(self, df):
+        # a NaN spread leaves the observation out of the RMSE and bias too
+        df.loc[0, "prior_totalvar"] = np.nan
+        result = stats.binned_statistics(df)
+        expected = df.iloc[[2, 4, 5]]
+        assert np.isclose(
+            result["prior_rmse"].iloc[0], np.sqrt(expected["prior_sq_err"].mean())
+        )
+        assert np.isclose(result["prior_bias"].iloc[0], expected["prior_bias"].mean())
+        assert np.isclose(
+            result["prior_totalspread"].iloc[0],
+            np.sqrt(expected["prior_totalvar"].mean()),
+        )
+
+    def test_combined_bins(self, df):
+        codes, keys = stats.bin_observations(
+            df,
+            by=["type", "DART_quality_control"],
+            time_value="1h",
+            lat_bins=[-90, 0, 90],
+            lon_bins=[0, 180, 360],
+        )
+        assert list(keys.columns) == [
+            "type",
+            "DART_quality_control",
+            "time_bin_midpoint",
+            "lat_midpoint",
+            "lon_midpoint",
+        ]
+        assert (codes >= 0).all()
+        assert len(keys) == len(df)  # every observation is in its own group
+
+        # observation 0 is type A, QC 0, first hour, southern hemisphere, 0-180 longitude
+        first = keys.iloc[codes[0]]
+        assert first["type"] == "A"
+        assert first["DART_quality_control"] == 0
+        assert first["time_bin_midpoint"] == pd.Timestamp("2025-01-01 00:29:59")
+        assert first["lat_midpoint"] == -45.0
+        assert first["lon_midpoint"] == 90.0
+
+    def test_outside_bins(self, df):
+        codes, keys = stats.bin_observations(df, by=[], lat_bins=[0, 90])
+        assert codes.tolist() == [-1, 0, 0, -1, 0, 0]
+        assert keys["lat_midpoint"].tolist() == [45.0]
+
+        with pytest.raises(ValueError):
+            stats.bin_observations(df, by=[])
+
+    def test_resolution_and_bins(self, df):
+        with pytest.raises(ValueError, match="resolution"):
+            stats.bin_observations(df, resolution=10.0, lat_bins=[-90, 0, 90])
+
+    def test_empty_time_bins(self, df):
+        codes, keys = stats.bin_observations(df.iloc[:0], time_value="1h")
+        assert len(codes) == 0
+        assert list(keys.columns) == ["type", "time_bin_midpoint"]
+        assert keys.empty
+
+class TestGriddedStatistics:
+
+    @pytest.fixture
+    def df(self):
+        data = {
+            "observation": [2.5, 3.0, 4.5, 5.0, 6.0],
+            "obs_err_var": [0.1, 0.2, 0.3, 0.1, 0.2],
+            "prior_ensemble_mean": [2.4, 3.1, 4.5, 5.2, 5.9],
+            "prior_ensemble_spread": [0.5, 0.6, 0.7, 0.5, 0.6],
+            "type": ["A", "A", "A", "B", "A"],
+            "latitude": [10.0, 80.0, -90.0, 45.0, 20.0],
+            "longitude": [10.0, 100.0, 0.0, 300.0, -10.0],
+        }
+        df = pd.DataFrame(data)
+        stats.diag_stats(df)
+        return df
+
+    def test_grid_edges(self):
+        lat_edges, lon_edges = stats.grid_edges(90.0)
+        assert lat_edges.tolist() == [-90.0, 0.0, 90.0]
+        assert lon_edges.tolist() == [0.0, 90.0, 180.0, 270.0, 360.0]
+
+        lat_edges, _ = stats.grid_edges(90.0, equal_area=True)
+        assert np.allclose(lat_edges, [-90.0, 0.0, 90.0])
+        lat_edges, _ = stats.grid_edges(60.0, equal_area=True)
+        assert np.allclose(np.diff(np.sin(np.deg2rad(lat_edges))), 2.0 / 3.0)
+
+    def test_gridded_statistics(self, df):
+        grid = stats.gridded_statistics(df, resolution=90.0)
+
+        assert grid["type"].tolist() == ["A", "B"]
+        assert grid["latitude"].tolist() == [-45.0, 45.0]
+        assert grid["longitude"].tolist() == [45.0, 135.0, 225.0, 315.0]
+        assert grid["prior_rmse"].shape == (2, 2, 4)
+
+        expected_count = np.zeros((2, 2, 4), dtype=int)
+        expected_count[0, 1, 0] = 1  # A at (10, 10)
+        expected_count[0, 1, 1] = 1  # A at (80, 100)
+        expected_count[0, 0, 0] = 1  # A at (-90, 0)
+        expected_count[1, 1, 3] = 1  # B at (45, 300)
+        expected_count[0, 1, 3] += 1  # A at (20, -10) wraps to 350
+        assert (grid["count"] == expected_count).all()
+
+        assert np.isclose(grid["prior_rmse"][0, 1, 3], 0.1)
+        assert np.isclose(grid["prior_bias"][1, 1, 3], 0.2)
+        assert np.isclose(grid["prior_totalspread"][0, 0, 0], np.sqrt(0.3 + 0.7**2))
+        assert np.isnan(grid["prior_rmse"][1, 0, 0])
+        assert "posterior_rmse" not in grid
+
+    def test_gridded_statistics_matches_binned(self, df):
+        grid = stats.gridded_statistics(df, resolution=90.0)
+        lat_edges, lon_edges = stats.grid_edges(90.0)
+        df["longitude"] = np.mod(df["longitude"], 360.0)
+        binned = stats.binned_statistics(df, lat_bins=lat_edges, lon_bins=lon_edges)
+
+        for _, row in binned.iterrows():
+            i = grid["type"].tolist().index(row["type"])
+            j = grid["latitude"].tolist().index(row["lat_midpoint"])
+            k = grid["longitude"].tolist().index(row["lon_midpoint"])
+            assert grid["count"][i, j, k] == row["count"]
+            assert np.isclose(grid["prior_rmse"][i, j, k], row["prior_rmse"])
+
+class TestBootstrapStatistics:
+
+    @pytest.fixture
+    def df(self):
+        rng = np.random.default_rng(0)
+        n = 2000
+        data = {
+            "observation": rng.normal(size=n),
+            "obs_err_var": np.full(n, 0.5),
+            "prior_ensemble_mean": rng.normal(0.5, 1.0, size=n),
+            "prior_ensemble_spread": np.full(n, 1.0),
+            "posterior_ensemble_mean": rng.normal(0.2, 0.5, size=n),
+            "posterior_ensemble_spread": np.full(n, 0.8),
+            "type": rng.choice(["A", "B"], size=n),
+            "vertical": rng.uniform(0, 300, size=n),
+            "vert_unit": ["pressure (Pa)"] * n,
+        }
+        df = pd.DataFrame(data)
+        df.loc[:9, "posterior_ensemble_mean"] = np.nan  # failed posterior
+        stats.diag_stats(df)
+        return df
+
+    def test_bootstrap_statistics(self, df):
+        result = stats.bootstrap_statistics(
+            df, levels=[0, 100, 200, 300], n_resamples=200, seed=1, workers=1
+        )
+
+        expected = stats.binned_statistics(df, levels=[0, 100, 200, 300])
+        assert len(result) == len(expected) == 6
+        for phase in ["prior", "posterior"]:
+            for stat in ["rmse", "bias", "totalspread"]:
+                column = f"{phase}_{stat}"
+                assert np.allclose(result[column], expected[column])
+                assert (result[f"{column}_lower"] <= result[column] + 1e-12).all()
+                assert (result[f"{column}_upper"] >= result[column] - 1e-12).all()
+
+        # prior bias is 0.5 with a standard error of about 0.05 per group
+        width = result["prior_bias_upper"] - result["prior_bias_lower"]
+        assert ((width > 0.05) & (width < 0.5)).all()
+        assert (result["prior_bias_lower"] > 0.2).all()
+
+    def test_bootstrap_statistics_workers(self, df):
+        serial = stats.bootstrap_statistics(df, n_resamples=120, seed=7, workers=1)
+        parallel = stats.bootstrap_statistics(df, n_resamples=120, seed=7, workers=2)
+        pd.testing.assert_frame_equal(serial, parallel)
+
+class TestPairedStatistics:
+
+    @pytest.fixture
+    def control(self):
+        data = {
+            "observation": [2.5, 3.0, 4.5, 5.0, 6.0, 6.0],
+            "obs_err_var": [0.1, 0.2, 0.3, 0.1, 0.2, 0.2],
+            "prior_ensemble_mean": [2.4, 3.1, 4.5, 5.2, 5.9, 5.8],
+            "prior_ensemble_spread": [0.5, 0.6, 0.7, 0.5, 0.6, 0.6],
+            "type": ["A", "B", "A", "B", "A", "A"],
+            "longitude": [10.0, 20.0, 30.0, 40.0, 50.0, 50.0],
+            "latitude": [1.0, 2.0, 3.0, 4.0, 5.0, 5.0],
+            "vertical": [100.0, 200.0, 300.0, 400.0, 500.0, 500.0],
+            "time": pd.to_datetime(["2025-01-01"] * 6),
+        }
+        df = pd.DataFrame(data)
+        stats.diag_stats(df)
+        return df
+
+    @pytest.fixture
+    def experiment(self, control):
+        # reversed order, one observation missing, one extra observation
+        df = control.iloc[[5, 4, 3, 2, 0]].copy()
+        extra = control.iloc[[1]].copy()
+        extra["observation"] = 99.0
+        df = pd.concat([df, extra], ignore_index=True)
+        df["prior_ensemble_mean"] = df["observation"] + 0.1
+        stats.diag_stats(df)
+        return df
+
+    def test_align_observations(self, control, experiment):
+        control_rows, experiment_rows = stats.align_observations(control, experiment)
+
+        assert control_rows.tolist() == [0, 2, 3, 4, 5]
+        # identical observations 4 and 5 are matched in order of appearance
+        assert experiment_rows.tolist() == [4, 3, 2, 0, 1]
+
+    def test_paired_statistics(self, control, experiment):
+        result = stats.paired_statistics(control, experiment)
+
+        assert result["type"].tolist() == ["A", "B"]
+        assert result["count"].tolist() == [4, 1]
+
+        matched_a = control.iloc[[0, 2, 4, 5]]
+        expected_rmse = np.sqrt(np.mean(matched_a["prior_sq_err"]))
+        assert np.isclose(result.loc[0, "prior_rmse_control"], expected_rmse)
+        assert np.isclose(result.loc[0, "prior_rmse_experiment"], 0.1)
+        assert np.isclose(result.loc[0, "prior_rmse_diff"], 0.1 - expected_rmse)
+        assert np.isclose(
+            result.loc[0, "prior_bias_diff"], 0.1 - matched_a["prior_bias"].mean()
+        )
+        assert 0.0 <= result.loc[0, "prior_bias_pvalue"] <= 1.0
+        assert np.isnan(result.loc[1, "prior_bias_pvalue"])  # single pair
+        assert "posterior_rmse_diff" not in result.columns
+
+    def test_two_sided_pvalue(self):
+        t = np.array([0.0, -0.5, 1.0, 1.96, -3.0, 8.0, 40.0, np.inf, np.nan])
+        expected = [math.erfc(abs(x) / math.sqrt(2.0)) for x in t[:-1]]
+        pvalue = stats._two_sided_pvalue(t)
+        assert np.allclose(pvalue[:-1], expected, rtol=2e-7, atol=0.0)
+        assert np.isnan(pvalue[-1])
+
+    def test_paired_statistics_multiple(self, control, experiment):
+        result = stats.paired_statistics(
+            control, {"exp1": experiment, "same": control}
+        )
+
+        assert result["experiment"].tolist() == ["exp1", "exp1", "same", "same"]
+        same = result[result["experiment"] == "same"]
+        assert same["count"].tolist() == [4, 2]
+        assert np.allclose(same["prior_rmse_diff"], 0.0)
+
+
+class TestEnsembleScores:
+
+    @pytest.fixture
+    def df(self):
+        rng = np.random.default_rng(0)
+        n_obs, n_members = 40, 9
+        members = rng.normal(size=(n_obs, n_members))
+        data = {
+            "type": ["A"] * 20 + ["B"] * 20,
+            "observation": rng.normal(size=n_obs),
+            "obs_err_var": np.full(n_obs, 0.5),
+            "prior_ensemble_mean": members.mean(axis=1),
+            "prior_ensemble_spread": members.std(axis=1, ddof=1),
+            "vertical": np.tile([150.0, 250.0], 20),
+            "vert_unit": ["pressure (Pa)"] * n_obs,
+        }
+        for i in range(n_members):
+            data[f"prior_ensemble_member_{i + 1}"] = members[:, i]
+        df = pd.DataFrame(data)
+        stats.diag_stats(df)
+        return df
+
+    @staticmethod
+    def brute_force_crps(members, obs):
+        abs_err = np.abs(members - obs[:, None]).mean(axis=1)
+        pairs = np.abs(members[:, :, None] - members[:, None, :]).mean(axis=(1, 2))
+        return abs_err - 0.5 * pairs
+
+    def test_crps(self, df):
+        stats.crps(df, chunk_size=7)
+        members = df.filter(like="prior_ensemble_member").to_numpy()
+        expected = self.brute_force_crps(members, df["observation"].to_numpy())
+        assert np.allclose(df["prior_crps"], expected)
+        assert "posterior_crps" not in df.columns
+
+    def test_crps_single_member_is_absolute_error(self):
+        df = pd.DataFrame(
+            {
+                "observation": [1.0, 2.0],
+                "prior_ensemble_spread": [0.0, 0.0],
+                "prior_ensemble_member_1": [1.5, 1.0],
+            }
+        )
+        stats.crps(df)
+        assert np.allclose(df["prior_crps"], [0.5, 1.0])
+
+    def test_crps_missing_members(self, df):
+        df.loc[3, "prior_ensemble_member_2"] = np.nan
+        stats.crps(df)
+        assert np.isnan(df.loc[3, "prior_crps"])
+        assert np.isfinite(df["prior_crps"].drop(index=3)).all()
+
+    def test_grand_statistics_ensemble_scores(self, df):
+        assert "prior_crps" not in stats.grand_statistics(df).columns
+
+        stats.crps(df)
+        grand = stats.grand_statistics(df)
+        expected = df.groupby("type")["prior_crps"].mean()
+        assert np.allclose(grand["prior_crps"], expected)
+        assert np.allclose(
+            grand["prior_spread_skill"],
+            grand["prior_totalspread"] / grand["prior_rmse"],
+        )
+
+        result = stats.binned_statistics(df)
+        for column in grand.columns.drop("type"):
+            assert np.allclose(result[column], grand[column]), column
+
+    def test_layer_statistics_ensemble_scores(self, df):
+        stats.crps(df)
+        stats.bin_by_layer(df, [100, 200, 300])
+        layers = stats.layer_statistics(df)
+        assert "prior_crps" in layers.columns
+        assert "prior_spread_skill" in layers.columns
+        first = layers[layers["type"] == "A"].sort_values("midpoint").iloc[0]
+        expected = df[(df["type"] == "A") & (df["vertical"] == 150.0)]["prior_crps"]
+        assert np.isclose(first["prior_crps"], expected.mean())
+
+    def test_reliability(self, df):
+        result = stats.reliability(df, threshold=0.0, n_bins=5, chunk_size=11)
+
+        members = df.filter(like="prior_ensemble_member").to_numpy()
+        probability = (members > 0.0).mean(axis=1)
+        probability_bin = np.minimum((probability * 5).astype(int), 4)
+        event = df["observation"] > 0.0
+
+        assert result["count"].sum() == len(df)
+        for _, row in result.iterrows():
+            in_bin = (df["type"] == row["type"]).to_numpy() & (
+                probability_bin == int(row["probability_bin"] * 5)
+            )
+            assert row["count"] == in_bin.sum()
+            assert np.isclose(row["forecast_probability"], probability[in_bin].mean())
+            assert np.isclose(row["observed_frequency"], event[in_bin].mean())
+
+    def test_reliability_no_members(self, df):
+        with pytest.raises(ValueError):
+            stats.reliability(df, threshold=0.0, phase="posterior")
+
+
+class TestDesroziersStatistics:
+
+    @pytest.fixture
+    def df(self):
+        # Optimal scalar analysis: y = t + eo, xb = t + eb, xa = xb + K (y - xb)
+        rng = np.random.default_rng(1)
+        n = 200000
+        obs_var, background_var = 2.0, 0.5
+        truth = rng.normal(size=n)
+        y = truth + rng.normal(scale=np.sqrt(obs_var), size=n)
+        xb = truth + rng.normal(scale=np.sqrt(background_var), size=n)
+        gain = background_var / (background_var + obs_var)
+        xa = xb + gain * (y - xb)
+        return pd.DataFrame(
+            {
+                "type": np.where(np.arange(n) % 2 == 0, "A", "B"),
+                "observation": y,
+                "obs_err_var": np.where(np.arange(n) % 2 == 0, obs_var, obs_var / 2),
+                "prior_ensemble_mean": xb,
+                "prior_ensemble_spread": np.full(n, np.sqrt(background_var)),
+                "posterior_ensemble_mean": xa,
+            }
+        )
+
+    def test_consistent_analysis(self, df):
+        result = stats.desroziers_statistics(df)
+
+        assert result["type"].tolist() == ["A", "B"]
+        assert result["count"].tolist() == [100000, 100000]
+        assert np.allclose(result["estimated_obs_err_var"], 2.0, rtol=0.05)
+        assert np.allclose(result["obs_err_var_ratio"], [1.0, 2.0], rtol=0.05)
+        assert np.allclose(result["estimated_obs_err_sd"], np.sqrt(2.0), rtol=0.05)
+        assert np.allclose(result["estimated_background_var"], 0.5, rtol=0.05)
+        assert np.allclose(result["background_var_ratio"], 1.0, rtol=0.05)
+        assert np.allclose(result["estimated_total_var"], 2.5, rtol=0.05)
+
+    def test_matches_group_means(self):
+        df = pd.DataFrame(
+            {
+                "type": ["A", "A", "B", "B", "B"],
+                "observation": [1.0, 2.0, 3.0, 4.0, 5.0],
+                "obs_err_var": [0.5, 0.5, 1.0, 1.0, 1.0],
+                "prior_ensemble_mean": [1.5, 1.0, 2.0, 4.5, 6.0],
+                "prior_ensemble_spread": [1.0, 2.0, 1.0, 1.0, 1.0],
+                "posterior_ensemble_mean": [1.2, 1.5, 2.5, np.nan, 5.5],
+            }
+        )
+        result = stats.desroziers_statistics(df)
+
+        valid = df.dropna()
+        omb = valid["observation"] - valid["prior_ensemble_mean"]
+        oma = valid["observation"] - valid["posterior_ensemble_mean"]
+        amb = valid["posterior_ensemble_mean"] - valid["prior_ensemble_mean"]
+        expected_obs = (oma * omb).groupby(valid["type"]).mean()
+        expected_background = (amb * omb).groupby(valid["type"]).mean()
+
+        assert result["count"].tolist() == [2, 2]
+        assert np.allclose(result["estimated_obs_err_var"], expected_obs)
+        assert np.allclose(result["estimated_background_var"], expected_background)
+        assert np.allclose(result["omb_mean"], omb.groupby(valid["type"]).mean())
+        assert np.allclose(result["assigned_obs_err_var"], [0.5, 1.0])
+
+    def test_missing_posterior(self, df):
+        with pytest.raises(ValueError):
+            stats.desroziers_statistics(df.drop(columns="posterior_ensemble_mean"))
+
+
+class TestEnsembleMeanSpread:
+
+    @pytest.fixture
+    def df(self):
+        rng = np.random.default_rng(2)
+        n_obs, n_members = 25, 6
+        data = {
+            "observation": rng.normal(size=n_obs),
+            "prior_ensemble_mean": np.zeros(n_obs),
+            "posterior_ensemble_mean": np.zeros(n_obs),
+            "prior_ensemble_spread": np.zeros(n_obs),
+            "posterior_ensemble_spread": np.zeros(n_obs),
+        }
+        for i in range(1, n_members + 1):
+            data[f"prior_ensemble_member_{i}"] = rng.normal(size=n_obs)
+            data[f"posterior_ensemble_member_{i}"] = rng.normal(size=n_obs)
+        df = pd.DataFrame(data)
+        # posterior forward operator failed, as set by ObsSequence._replace_qc2_nan
+        df.loc[4, df.columns.str.startswith("posterior_ensemble")] = np.nan
+        return df
+
+    def test_all_members(self, df):
+        stats.ensemble_mean_spread(df, chunk_size=10)
+        for phase in ["prior", "posterior"]:
+            members = df.filter(like=f"{phase}_ensemble_member").to_numpy()
+            assert np.allclose(
+                df[f"{phase}_ensemble_mean"], members.mean(axis=1), equal_nan=True
+            )
+            assert np.allclose(
+                df[f"{phase}_ensemble_spread"],
+                members.std(axis=1, ddof=1),
+                equal_nan=True,
+            )
+        assert np.isnan(df.loc[4, "posterior_ensemble_mean"])
+        assert np.isnan(df.loc[4, "posterior_ensemble_spread"])
+        assert np.isfinite(df.loc[4, "prior_ensemble_mean"])
+
+    def test_subset_of_members(self, df):
+        stats.ensemble_mean_spread(df, members=[2, 3, 5])
+        members = df[[f"prior_ensemble_member_{i}" for i in [2, 3, 5]]].to_numpy()
+        assert np.allclose(df["prior_ensemble_mean"], members.mean(axis=1))
+        assert np.allclose(df["prior_ensemble_spread"], members.std(axis=1, ddof=1))
+
+    def test_prior_only(self, df):
+        df = df.drop(columns=df.columns[df.columns.str.startswith("posterior")])
+        stats.ensemble_mean_spread(df, members=[1, 2])
+        assert "posterior_ensemble_mean" not in df.columns
+        assert np.allclose(
+            df["prior_ensemble_mean"],
+            (df["prior_ensemble_member_1"] + df["prior_ensemble_member_2"]) / 2,
+        )
+
+    def test_missing_member(self, df):
+        with pytest.raises(ValueError):
+            stats.ensemble_mean_spread(df, members=[1, 7])
+
+
+class TestQcBreakdown:
+
+    @pytest.fixture
+    def df(self):
+        return pd.DataFrame(
+            {
+                "type": ["A", "A", "A", "B", "B", "A", "B", "A"],
+                "observation": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0],
+                "DART_quality_control": [0, 7, 2, 0, 4, 7, 1, 8],
+                "vertical": [150.0, 150.0, 250.0, 150.0, 250.0, 250.0, 150.0, 500.0],
+                "vert_unit": ["pressure (Pa)"] * 8,
+                "time": pd.to_datetime(
+                    [
+                        "2025-01-01 00:00",
+                        "2025-01-01 00:30",
+                        "2025-01-01 01:00",
+                        "2025-01-01 01:30",
+                        "2025-01-01 02:00",
+                        "2025-01-01 02:30",
+                        "2025-01-01 03:00",
+                        "2025-01-01 03:30",
+                    ]
+                ),
+            }
+        )
+
+    def test_by_type(self, df):
+        result = stats.qc_breakdown(df)
+
+        assert result["type"].tolist() == ["A", "B"]
+        assert result["qc_0"].tolist() == [1, 1]
+        assert result["qc_2"].tolist() == [1, 0]
+        assert result["qc_7"].tolist() == [2, 0]
+        assert result["qc_8"].tolist() == [1, 0]
+        assert result["possible"].tolist() == [5, 3]
+        assert result["used"].tolist() == [2, 1]
+
+        qc_columns = [f"qc_{i}" for i in range(9)]
+        assert (result[qc_columns].sum(axis=1) == result["possible"]).all()
+
+        expected = stats.possible_vs_used(df)
+        assert result["possible"].tolist() == expected["possible"].tolist()
+        assert result["used"].tolist() == expected["used"].tolist()
+
+    def test_by_layer(self, df):
+        result = stats.qc_breakdown(df, levels=[100, 200, 300])
+
+        assert list(result.columns[:2]) == ["type", "midpoint"]
+        assert len(result) == 4
+        a_upper = result[(result["type"] == "A") & (result["midpoint"] == 250.0)]
+        assert a_upper["qc_2"].item() == 1
+        assert a_upper["qc_7"].item() == 1
+        # 500 Pa is outside the levels
+        assert result["qc_8"].sum() == 0
+        assert result["possible"].sum() == 7
+
+    def test_by_time(self, df):
+        result = stats.qc_breakdown(df, time_value="2h")
+
+        assert "time_bin_midpoint" in result.columns
+        assert result["possible"].sum() == len(df)
+        assert result.groupby("type")["qc_7"].sum().tolist() == [2, 0]
+
+
+class TestOutlierThresholdSweep:
+
+    @pytest.fixture
+    def df(self):
+        rng = np.random.default_rng(3)
+        n = 300
+        return pd.DataFrame(
+            {
+                "type": np.where(np.arange(n) % 3 == 0, "A", "B"),
+                "observation": rng.normal(scale=2.0, size=n),
+                "prior_ensemble_mean": rng.normal(size=n),
+                "prior_ensemble_spread": rng.uniform(0.5, 1.5, size=n),
+                "obs_err_var": np.full(n, 0.25),
+                "DART_quality_control": rng.choice([0, 2, 4, 7], size=n),
+            }
+        )
+
+    def test_matches_refiltering(self, df):
+        thresholds = [3.0, 1.0, -1, 2.0]
+        result = stats.outlier_threshold_sweep(df, thresholds)
+
+        considered = df[df["DART_quality_control"].isin([0, 2, 7])]
+        bias = considered["prior_ensemble_mean"] - considered["observation"]
+        z = bias.abs() / np.sqrt(
+            considered["prior_ensemble_spread"] ** 2 + considered["obs_err_var"]
+        )
+
+        assert len(result) == 2 * len(thresholds)
+        assert result["threshold"].tolist() == thresholds * 2
+        for _, row in result.iterrows():
+            in_type = considered["type"] == row["type"]
+            kept = in_type & ((z <= row["threshold"]) | (row["threshold"] < 0))
+            assert row["considered"] == in_type.sum()
+            assert row["used"] == kept.sum()
+            assert row["rejected"] == in_type.sum() - kept.sum()
+            assert np.isclose(row["prior_rmse"], np.sqrt((bias[kept] ** 2).mean()))
+            assert np.isclose(row["prior_bias"], bias[kept].mean())
+
+    def test_no_outlier_check(self, df):
+        result = stats.outlier_threshold_sweep(df, [-1])
+        assert (result["rejected"] == 0).all()
+
+    def test_by_layer(self, df):
+        df["vertical"] = np.where(np.arange(len(df)) % 2 == 0, 150.0, 250.0)
+        df["vert_unit"] = "pressure (Pa)"
+        result = stats.outlier_threshold_sweep(df, [2.0, 3.0], levels=[100, 200, 300])
+        considered = df["DART_quality_control"].isin([0, 2, 7]).sum()
+        assert len(result) == 8
+        assert result["considered"].sum() == 2 * considered
+
+
+class TestStationStatistics:
+
+    @pytest.fixture
+    def df(self):
+        data = {
+            "type": ["A", "A", "A", "A", "B", "A"],
+            "longitude": [10.001, 10.0, 20.0, 20.0, 10.0, 30.0],
+            "latitude": [45.0, 45.001, 50.0, 50.0, 45.0, -5.0],
+            "metadata": [["stn 1"], ["stn  1"], ["stn 2"], ["stn 2"], ["stn 1"], []],
+            "observation": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+            "obs_err_var": [1.0] * 6,
+            "prior_ensemble_mean": [1.5, 2.5, 2.0, 4.0, 5.0, 7.0],
+            "prior_ensemble_spread": [1.0] * 6,
+        }
+        df = pd.DataFrame(data)
+        stats.diag_stats(df)
+        return df
+
+    def test_station_ids_location(self, df):
+        stats.station_ids(df)
+        assert isinstance(df["station"].dtype, pd.CategoricalDtype)
+        assert df["station"].cat.codes.tolist() == [0, 0, 1, 1, 0, 2]
+        assert df["station"].iloc[0] == "10.00_45.00"
+
+    def test_station_ids_metadata(self, df):
+        stats.station_ids(df, source="metadata")
+        expected = ["stn 1", "stn 1", "stn 2", "stn 2", "stn 1"]
+        assert df["station"].iloc[:5].tolist() == expected
+        assert pd.isna(df["station"].iloc[5])
+
+    def test_station_ids_missing_location(self, df):
+        # a NaN latitude must not collide with another station's codes
+        df.loc[3, "latitude"] = np.nan
+        df.loc[5, "longitude"] = np.nan
+        stats.station_ids(df)
+        assert df["station"].cat.codes.tolist() == [0, 0, 1, -1, 0, -1]
+        assert df["station"].cat.categories.tolist() == ["10.00_45.00", "20.00_50.00"]
+
+    def test_station_ids_no_metadata(self, df):
+        df["metadata"] = [[] for _ in range(len(df))]
+        stats.station_ids(df, source="metadata")
+        assert df["station"].isna().all()
+
+    def test_station_ids_invalid_source(self, df):
+        with pytest.raises(ValueError):
+            stats.station_ids(df, source="wmo")
+
+    def test_station_statistics(self, df):
+        result = stats.station_statistics(df)
+
+        assert result["station"].tolist() == [
+            "10.00_45.00",
+            "10.00_45.00",
+            "20.00_50.00",
+            "30.00_-5.00",
+        ]
+        assert result["type"].tolist() == ["A", "B", "A", "A"]
+        assert result["count"].tolist() == [2, 1, 2, 1]
+        assert np.allclose(result["prior_bias"], [0.5, 0.0, -0.5, 1.0])
+        assert np.allclose(result["prior_rmse"], [0.5, 0.0, np.sqrt(0.5), 1.0])
+        assert np.allclose(result["longitude"], [10.0005, 10.0, 20.0, 30.0])
+
+    def test_station_statistics_min_count(self, df):
+        stats.station_ids(df, source="metadata")
+        result = stats.station_statistics(df, min_count=2)
+        assert result["station"].tolist() == ["stn 1", "stn 2"]
+        assert result["count"].tolist() == [2, 2]
+
+
+class TestDensity:
+
+    @pytest.fixture
+    def df(self):
+        return pd.DataFrame(
+            {
+                "type": ["A", "A", "A", "A", "B", "B"],
+                "longitude": [10.2, 10.7, 10.5, 359.9, 10.2, 10.2001],
+                "latitude": [45.2, 45.7, 45.5, -0.1, 45.2, 45.2],
+                "vertical": [500.0, 500.0, 500.0, 500.0, 800.0, 800.0],
+                "vert_unit": ["pressure (Pa)"] * 6,
+                "time": pd.to_datetime(["2025-01-01 00:00"] * 6),
+            }
+        )
+
+    def test_observation_density(self, df):
+        result = stats.observation_density(df, resolution=1.0)
+
+        assert result["type"].tolist() == ["A", "A", "B"]
+        assert result["lat_midpoint"].tolist() == [-0.5, 45.5, 45.5]
+        assert result["lon_midpoint"].tolist() == [359.5, 10.5, 10.5]
+        assert result["count"].tolist() == [1, 3, 2]
+
+    def test_observation_density_matches_lat_lon_bins(self, df):
+        lat_edges, lon_edges = stats.grid_edges(1.0)
+        expected = stats.binned_statistics(df, lat_bins=lat_edges, lon_bins=lon_edges)
+        result = stats.observation_density(df, resolution=1.0)
+        assert result["count"].tolist() == expected["count"].tolist()
+
+    def test_neighbor_counts(self, df):
+        counts = stats.neighbor_counts(df, distance_km=100.0)
+        assert counts.tolist() == [2, 2, 2, 0, 1, 1]
+
+        counts = stats.neighbor_counts(df, distance_km=50.0)
+        assert counts.tolist() == [1, 1, 2, 0, 1, 1]
+
+        counts = stats.neighbor_counts(df, distance_km=5.0)
+        assert counts.tolist() == [0, 0, 0, 0, 1, 1]
+
+    def test_neighbor_counts_tolerances(self, df):
+        df.loc[1, "time"] = pd.Timestamp("2025-01-01 00:30")
+        df.loc[2, "vertical"] = 450.0
+        assert stats.neighbor_counts(df, 100.0).tolist() == [0, 0, 0, 0, 1, 1]
+
+        counts = stats.neighbor_counts(
+            df, 100.0, vertical_tolerance=100.0, time_tolerance="1h"
+        )
+        assert counts.tolist() == [2, 2, 2, 0, 1, 1]
+
+    def test_duplicate_statistics(self, df):
+        df.loc[5, "longitude"] = 10.2  # exact duplicate of row 4
+        result = stats.duplicate_statistics(df, distance_km=100.0)
+
+        assert result["type"].tolist() == ["A", "B"]
+        assert result["count"].tolist() == [4, 2]
+        assert result["duplicates"].tolist() == [0, 1]
+        assert result["near_duplicates"].tolist() == [3, 2]
+        assert result["max_neighbors"].tolist() == [2, 1]
+
+    def test_thin_observations(self, df):
+        rows = stats.thin_observations(df, resolution=1.0)
+        # rows 2 and 5 are closest to the centre of the (45.5, 10.5) cell
+        assert rows.tolist() == [2, 3, 5]
+
 
 if __name__ == "__main__":
     pytest.main()
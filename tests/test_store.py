@@ -0,0 +1,128 @@
+# SPDX-License-Identifier: Apache-2.0
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from pydartdiags.obs_sequence import obs_sequence as obsq
+from pydartdiags.stats import stats
+from pydartdiags.stats.store import StatsStore
+
+
+class TestStatsStore:
+
+    @pytest.fixture
+    def obs_seq_file_path(self):
+        test_dir = os.path.dirname(__file__)
+        return os.path.join(test_dir, "data", "obs_seq.final.post.small")
+
+    @pytest.fixture
+    def levels(self):
+        return [i * 100 for i in [0, 300, 500, 700, 1100]]
+
+    def test_time_statistics_matches_stats(self, obs_seq_file_path, levels):
+        store = StatsStore(levels=levels)
+        store.add(obs_seq_file_path, cycle="2019-12-01 21:00")
+
+        obs_seq = obsq.ObsSequence(obs_seq_file_path)
+        stats.diag_stats(obs_seq.df)
+        used = stats.select_used_qcs(obs_seq.df)
+        expected = stats.binned_statistics(used, levels=levels)
+
+        result = store.time_statistics()
+        assert (result["cycle"] == pd.Timestamp("2019-12-01 21:00")).all()
+        assert (result["region"] == "global").all()
+        merged = expected.merge(result, on=["type", "midpoint"], suffixes=("", "_s"))
+        assert len(merged) == len(expected)
+        assert len(result) == len(store.possible_vs_used())  # includes groups with none used
+        for stat in ["prior_rmse", "prior_bias", "posterior_totalspread"]:
+            assert np.allclose(merged[stat], merged[f"{stat}_s"], equal_nan=True)
+
+    def test_possible_vs_used(self, obs_seq_file_path):
+        store = StatsStore()
+        store.add(obs_seq_file_path)
+
+        obs_seq = obsq.ObsSequence(obs_seq_file_path)
+        expected = stats.possible_vs_used(obs_seq.df)
+        result = store.possible_vs_used()
+
+        assert result["type"].tolist() == expected["type"].tolist()
+        assert result["possible"].tolist() == expected["possible"].tolist()
+        assert result["used"].tolist() == expected["used"].tolist()
+
+    def test_obs_seq_not_modified(self, obs_seq_file_path, levels):
+        obs_seq = obsq.ObsSequence(obs_seq_file_path)
+        columns = list(obs_seq.df.columns)
+        copy_on_write = pd.options.mode.copy_on_write
+        StatsStore(levels=levels).add(obs_seq)
+        assert list(obs_seq.df.columns) == columns
+        assert pd.options.mode.copy_on_write == copy_on_write
+
+    def test_persistent_incremental(self, obs_seq_file_path, tmpdir, levels):
+        path = os.path.join(tmpdir, "store")
+        regions = {"global": (-90, 90, 0, 360), "north": (0, 90, 0, 360)}
+
+        store = StatsStore(path, levels=levels, regions=regions)
+        store.add(obs_seq_file_path, cycle="2019-12-01 00:00")
+        store.add(obs_seq_file_path, cycle="2019-12-01 06:00")
+
+        # reopen the store and add another cycle
+        reopened = StatsStore(path)
+        assert reopened.levels == [float(x) for x in levels]
+        assert reopened.cycles() == [
+            pd.Timestamp("2019-12-01 00:00"),
+            pd.Timestamp("2019-12-01 06:00"),
+        ]
+        reopened.add(obs_seq_file_path, cycle="2019-12-01 12:00")
+        reopened.add(obs_seq_file_path, cycle="2019-12-01 06:00")  # replaced
+
+        result = StatsStore(path).time_statistics(region="global")
+        assert sorted(result["cycle"].unique()) == [
+            pd.Timestamp("2019-12-01 00:00"),
+            pd.Timestamp("2019-12-01 06:00"),
+            pd.Timestamp("2019-12-01 12:00"),
+        ]
+        first = result[result["cycle"] == pd.Timestamp("2019-12-01 00:00")]
+        last = result[result["cycle"] == pd.Timestamp("2019-12-01 12:00")]
+        assert np.allclose(first["prior_rmse"], last["prior_rmse"], equal_nan=True)
+
+        pvu = StatsStore(path).possible_vs_used(region="north")
+        assert len(pvu) > 0
+        assert (pvu["region"] == "north").all()
+
+    @pytest.mark.parametrize("prior_only_first", [False, True])
+    def test_persistent_different_columns(
+        self, obs_seq_file_path, tmpdir, levels, prior_only_first
+    ):
+        path = os.path.join(tmpdir, "store")
+        prior_only = obsq.ObsSequence(obs_seq_file_path)
+        prior_only.df = prior_only.df.drop(
+            columns=[c for c in prior_only.df.columns if c.startswith("posterior")]
+        )
+        sequences = [obs_seq_file_path, prior_only]
+        if prior_only_first:
+            sequences.reverse()
+
+        store = StatsStore(path, levels=levels)
+        store.add(sequences[0], cycle="2019-12-01 00:00")
+        store.add(sequences[1], cycle="2019-12-01 06:00")
+
+        reopened = StatsStore(path)
+        pd.testing.assert_frame_equal(
+            reopened.aggregates[store.aggregates.columns],
+            store.aggregates,
+            check_dtype=False,
+        )
+        result = reopened.time_statistics()
+        prior = result[result["cycle"] == pd.Timestamp("2019-12-01 06:00")]
+        full = result[result["cycle"] == pd.Timestamp("2019-12-01 00:00")]
+        if prior_only_first:
+            prior, full = full, prior
+        assert np.allclose(prior["prior_rmse"], full["prior_rmse"], equal_nan=True)
+        assert prior["posterior_rmse"].isna().all()
+        assert full["posterior_rmse"].notna().any()
+
+    def test_different_config(self, tmpdir, levels):
+        path = os.path.join(tmpdir, "store")
+        StatsStore(path, levels=levels)
+        with pytest.raises(ValueError):
+            StatsStore(path, levels=[0, 100])